@@ -0,0 +1,125 @@
+"""请求访问日志。
+
+AccessLogMiddleware 是纯 ASGI 中间件，每个请求在响应结束后输出一行日志，不读取请求体；
+按 body_sample_rate 抽样的请求在请求体流经时顺带保留前 body_max_bytes 字节用于调试，
+不会把整个上传缓冲到内存。install_queue_logging() 把根 logger 的处理器移到后台线程，
+日志写出 (终端 / 文件 I/O) 不会阻塞事件循环。
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+logger = logging.getLogger("access")
+
+CAPTURE_METHODS = {"POST", "PUT", "PATCH"}
+TEXT_CONTENT_TYPES = ("application/json", "application/x-www-form-urlencoded", "text/")
+# 抽样记录请求体时截断 base64 图片、特征向量等长串
+_LONG_TOKEN = re.compile(r"[A-Za-z0-9+/=_-]{64,}")
+
+
+def install_queue_logging():
+    """把根 logger 现有的处理器改由 QueueListener 后台线程执行，调用方只把记录放入队列。"""
+    root = logging.getLogger()
+    handlers = [h for h in root.handlers if not isinstance(h, QueueHandler)]
+    if not handlers:
+        return None
+    records = queue.SimpleQueue()
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(records))
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def _redact(body: bytes, truncated: bool) -> str:
+    text = body.decode("utf-8", errors="replace")
+    text = _LONG_TOKEN.sub(lambda m: m.group(0)[:30] + "...(truncated)", text)
+    return text + ("...(body truncated)" if truncated else "")
+
+
+class AccessLogMiddleware:
+    def __init__(self, app, body_sample_rate: float = 0.0, body_max_bytes: int = 2048, log_format: str = "text"):
+        self.app = app
+        self.body_sample_rate = max(0.0, float(body_sample_rate))
+        self.body_max_bytes = max(0, int(body_max_bytes))
+        self.json_format = log_format == "json"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start_time = time.perf_counter()
+        headers = dict(scope["headers"])
+        req_id = headers.get(b"x-request-id", b"").decode("latin-1") or str(uuid.uuid4())[:8]
+        content_type = headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip()
+        state = {"status": 500, "bytes_out": 0}
+
+        captured = None
+        if (
+            self.body_sample_rate
+            and scope["method"] in CAPTURE_METHODS
+            and random.random() < self.body_sample_rate
+        ):
+            captured = bytearray()
+            state["body_bytes"] = 0
+            receive = self._capture(receive, captured, state)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", req_id.encode("latin-1"))]
+            elif message["type"] == "http.response.body":
+                state["bytes_out"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            body = None
+            if captured is not None:
+                if content_type.startswith(TEXT_CONTENT_TYPES):
+                    body = _redact(bytes(captured), state["body_bytes"] > len(captured))
+                else:
+                    body = f"<{content_type or 'unknown'}, {state['body_bytes']} bytes>"
+            self._log(scope, req_id, headers, state, time.perf_counter() - start_time, body)
+
+    def _capture(self, receive, captured: bytearray, state: dict):
+        """包装 receive：请求体照常逐块交给应用，只保留前 body_max_bytes 字节。"""
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                state["body_bytes"] += len(chunk)
+                room = self.body_max_bytes - len(captured)
+                if room > 0:
+                    captured.extend(chunk[:room])
+            return message
+        return receive_wrapper
+
+    def _log(self, scope, req_id: str, headers: dict, state: dict, elapsed: float, body):
+        method, path, status = scope["method"], scope["path"], state["status"]
+        bytes_in = headers.get(b"content-length", b"-").decode("latin-1")
+        client = scope.get("client")
+        client = client[0] if client else "-"
+        if self.json_format:
+            record = {
+                "request_id": req_id, "method": method, "path": path, "status": status,
+                "duration_ms": round(elapsed * 1000, 1), "bytes_in": bytes_in, "bytes_out": state["bytes_out"], "client": client,
+            }
+            if body is not None:
+                record["body"] = body
+            logger.info("%s", json.dumps(record, ensure_ascii=False))
+            return
+        logger.info(
+            "[%s] %s %s %d | %.3fs | in=%s out=%d | %s", req_id, method, path, status, elapsed, bytes_in, state["bytes_out"], client,
+        )
+        if body is not None:
+            logger.info("[%s] Body: %s", req_id, body)
@@ -0,0 +1,207 @@
+"""人脸库向量检索索引。
+
+FaceService.search_faces 通过 index.candidates(query) 获取候选行号:
+返回 None 表示对全部行做精确检索，否则只在候选行上计算相似度。
+IVF 索引用球面 k-means 把归一化向量划分为 nlist 个倒排桶，检索时只探测
+与查询向量最相近的 nprobe 个桶；成员数低于 min_size 时不训练，退回精确检索。
+"""
+from typing import Optional
+
+import numpy as np
+
+from config_loader import get_index_config
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_LIST = 64
+ASSIGN_CHUNK_ROWS = 65536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def _nearest_centroid(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assign = np.empty(data.shape[0], dtype=np.int32)
+    for start in range(0, data.shape[0], ASSIGN_CHUNK_ROWS):
+        block = data[start:start + ASSIGN_CHUNK_ROWS]
+        assign[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def spherical_kmeans(data: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(data.shape[0], k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest_centroid(data, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        present = np.nonzero(counts)[0]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[present]
+        sums[present] = np.add.reduceat(data[order], starts, axis=0)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(data.shape[0], int(empty.sum()), replace=False)]
+        centroids = _normalize(sums).astype(data.dtype, copy=False)
+    return centroids
+
+
+class ExactIndex:
+    """精确检索：不维护任何结构，总是扫描全部行。"""
+
+    def build(self, matrix: np.ndarray):
+        pass
+
+    def add(self, matrix: np.ndarray, row: int):
+        pass
+
+    def extend(self, matrix: np.ndarray, start: int):
+        pass
+
+    def update(self, matrix: np.ndarray, row: int):
+        pass
+
+    def remove(self, row: int, last: int):
+        pass
+
+    def candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        return None
+
+
+class IVFIndex(ExactIndex):
+    """倒排聚类 (IVF) 近似检索索引，行号与 LibraryMatrix 的矩阵行对齐。
+
+    成员数增长到训练时的 retrain_factor 倍后自动重新训练。
+    """
+
+    def __init__(self, nlist: int = 0, nprobe: int = 16, min_size: int = 50000, retrain_factor: float = 2.0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.retrain_factor = retrain_factor
+        self.centroids = None
+        self.trained_size = 0
+        self._assign = np.empty(0, dtype=np.int32)
+        self._lists = []
+        self._arrays = []
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def _reset(self):
+        self.centroids = None
+        self.trained_size = 0
+        self._assign = np.empty(0, dtype=np.int32)
+        self._lists = []
+        self._arrays = []
+
+    def build(self, matrix: np.ndarray):
+        size = matrix.shape[0]
+        if size < self.min_size:
+            self._reset()
+            return
+        nlist = self.nlist or int(np.sqrt(size))
+        nlist = max(1, min(nlist, size))
+        rng = np.random.default_rng(0)
+        sample_size = min(size, nlist * KMEANS_SAMPLES_PER_LIST)
+        # 量化矩阵 (float16 / int8) 先转回 float32 单位向量再聚类
+        sample = _normalize(matrix[np.sort(rng.choice(size, sample_size, replace=False))].astype(np.float32))
+        self.centroids = spherical_kmeans(sample, nlist)
+        assign = _nearest_centroid(matrix, self.centroids)
+        self._assign = np.empty(max(size, 16), dtype=np.int32)
+        self._assign[:size] = assign
+        order = np.argsort(assign, kind="stable")
+        bounds = np.cumsum(np.bincount(assign, minlength=nlist))
+        starts = np.concatenate(([0], bounds[:-1]))
+        self._lists = [order[s:e].tolist() for s, e in zip(starts, bounds)]
+        self._arrays = [None] * nlist
+        self.trained_size = size
+
+    def _place(self, matrix: np.ndarray, row: int):
+        if row >= self._assign.shape[0]:
+            grown = np.empty(max(16, self._assign.shape[0] * 2, row + 1), dtype=np.int32)
+            grown[:self._assign.shape[0]] = self._assign
+            self._assign = grown
+        list_id = int(np.argmax(self.centroids @ matrix[row]))
+        self._assign[row] = list_id
+        self._lists[list_id].append(row)
+        self._arrays[list_id] = None
+
+    def _unplace(self, row: int):
+        list_id = int(self._assign[row])
+        self._lists[list_id].remove(row)
+        self._arrays[list_id] = None
+
+    def _build_due(self, size: int) -> bool:
+        if not self.trained:
+            return size >= self.min_size
+        return size >= self.trained_size * self.retrain_factor
+
+    def add(self, matrix: np.ndarray, row: int):
+        """新增第 row 行，matrix 的最后一行即为该行。"""
+        self.extend(matrix, row)
+
+    def extend(self, matrix: np.ndarray, start: int):
+        """新增 matrix 从第 start 行起的所有行；达到训练条件时整体 build 一次，不再逐行放入。"""
+        if self._build_due(matrix.shape[0]):
+            self.build(matrix)
+            return
+        if not self.trained:
+            return
+        for row in range(start, matrix.shape[0]):
+            self._place(matrix, row)
+
+    def update(self, matrix: np.ndarray, row: int):
+        if not self.trained:
+            return
+        self._unplace(row)
+        self._place(matrix, row)
+
+    def remove(self, row: int, last: int):
+        """删除第 row 行，矩阵最后一行 last 被移动到 row 的位置。"""
+        if not self.trained:
+            return
+        self._unplace(row)
+        if row != last:
+            list_id = int(self._assign[last])
+            members = self._lists[list_id]
+            members[members.index(last)] = row
+            self._assign[row] = list_id
+            self._arrays[list_id] = None
+        if last < self.min_size:
+            self._reset()
+
+    def candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        if not self.trained:
+            return None
+        nprobe = min(self.nprobe, len(self._lists))
+        if nprobe >= len(self._lists):
+            return None
+        scores = self.centroids @ query.astype(self.centroids.dtype, copy=False)
+        probe = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        arrays = []
+        for list_id in probe:
+            array = self._arrays[list_id]
+            if array is None:
+                array = np.array(self._lists[list_id], dtype=np.int64)
+                self._arrays[list_id] = array
+            arrays.append(array)
+        return np.concatenate(arrays)
+
+
+def create_index(config: Optional[dict] = None) -> ExactIndex:
+    if config is None:
+        config = get_index_config()
+    index_type = config.get("type", "exact")
+    if index_type == "exact":
+        return ExactIndex()
+    if index_type == "ivf":
+        return IVFIndex(
+            nlist=int(config.get("nlist", 0)),
+            nprobe=int(config.get("nprobe", 16)),
+            min_size=int(config.get("min_size", 50000)),
+        )
+    raise ValueError(f"Unknown index type: {index_type}")
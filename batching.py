@@ -0,0 +1,87 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Any
+
+
+class MicroBatcher:
+    """把并发请求合并为批次执行。
+
+    submit() 把单个输入放入队列并返回 Future；后台线程收集到 max_batch_size 个输入，
+    或第一个输入等待超过 max_wait_ms 后，调用一次 batch_fn(inputs)，
+    再把结果按顺序分发给各自的 Future。batch_fn 必须返回与输入等长的序列。
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 32, max_wait_ms: float = 5.0, name: str = "micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._last_batch_size = 0
+        self._batch_size_counts = {}
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            batch = [(item, f) for item, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            futures = [f for _, f in batch]
+            try:
+                outputs = self.batch_fn(items)
+            except Exception as e:
+                for f in futures:
+                    f.set_exception(e)
+            else:
+                for f, output in zip(futures, outputs):
+                    f.set_result(output)
+            self._record(len(items))
+
+    def _record(self, size: int):
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._last_batch_size = size
+            self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "last_batch_size": self._last_batch_size,
+                "batch_size_counts": dict(sorted(self._batch_size_counts.items())),
+            }
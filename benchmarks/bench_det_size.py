@@ -0,0 +1,139 @@
+"""检测模型输入尺寸的精度 / 延迟对比。
+
+以 model.det_size（默认 640）的检测结果为基准，对每个候选尺寸和自适应模式报告:
+  latency     单次检测延迟
+  recall      与基准检测框 IoU >= 0.5 的比例
+  mean_iou    匹配人脸的平均 IoU
+  embedding_cosine  匹配人脸的特征向量与基准特征的平均余弦相似度
+
+图片来自 --images 目录；未指定时把 insightface 自带的 t1.jpg 缩放到 --long-sides 指定的长边。
+
+用法: python benchmarks/bench_det_size.py [--images dir] [--sizes 320 480] [--output result.json]
+"""
+import argparse
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from common import emit, environment
+from insightface.utils import face_align
+
+IOU_MATCH = 0.5
+
+
+def _load_images(args):
+    if args.images:
+        images = {}
+        for path in sorted(Path(args.images).iterdir()):
+            img = cv2.imread(str(path))
+            if img is not None:
+                images[path.name] = img
+        return images
+    from insightface.data import get_image
+    base = get_image("t1")
+    images = {}
+    for long_side in args.long_sides:
+        scale = long_side / max(base.shape[:2])
+        images[f"t1@{long_side}"] = cv2.resize(base, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return images
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _embeddings(service, img, kpss) -> np.ndarray:
+    if kpss is None or len(kpss) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    size = service._recognition_model.input_size[0]
+    crops = [face_align.norm_crop(img, landmark=kps, image_size=size) for kps in kpss]
+    feats = service._recognize_batch(crops)
+    return feats / np.linalg.norm(feats, axis=1, keepdims=True)
+
+
+def _timed_detect(service, img, det_size, iterations):
+    service._detect(img, det_size)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        bboxes, kpss = service._detect(img, det_size)
+    return bboxes, kpss, (time.perf_counter() - start) * 1000 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="测试图片目录")
+    parser.add_argument("--long-sides", type=int, nargs="+", default=[240, 320, 480, 640, 960])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[320, 480])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    from face_service import FaceService
+
+    service = FaceService()
+    service.batcher = None
+    images = _load_images(args)
+    modes = {f"fixed_{max(service.det_size)}": None}
+    modes.update({f"fixed_{size}": size for size in args.sizes})
+    modes["adaptive"] = "adaptive"
+
+    report = {"environment": environment(), "det_size": list(service.det_size), "images": {}, "summary": {}}
+    totals = {name: {"latency_ms": [], "recall": [], "iou": [], "cosine": []} for name in modes}
+
+    for image_name, img in images.items():
+        ref_bboxes, ref_kpss, _ = _timed_detect(service, img, None, 1)
+        ref_feats = _embeddings(service, img, ref_kpss)
+        per_image = {"shape": list(img.shape[:2]), "reference_faces": int(ref_bboxes.shape[0])}
+
+        for name, mode in modes.items():
+            service.adaptive_det_size = mode == "adaptive"
+            det_size = mode if isinstance(mode, int) else None
+            input_size = service.select_det_size(img, det_size)
+            bboxes, kpss, latency = _timed_detect(service, img, det_size, args.iterations)
+            feats = _embeddings(service, img, kpss)
+
+            ious, cosines = [], []
+            for i, ref_box in enumerate(ref_bboxes):
+                if bboxes.shape[0] == 0:
+                    break
+                scores = [_iou(ref_box, box) for box in bboxes]
+                j = int(np.argmax(scores))
+                if scores[j] >= IOU_MATCH:
+                    ious.append(scores[j])
+                    if feats.size and ref_feats.size:
+                        cosines.append(float(np.dot(ref_feats[i], feats[j])))
+            recall = len(ious) / ref_bboxes.shape[0] if ref_bboxes.shape[0] else 1.0
+
+            per_image[name] = {
+                "input_size": list(input_size),
+                "faces": int(bboxes.shape[0]),
+                "latency_ms": latency,
+                "recall": recall,
+                "mean_iou": float(np.mean(ious)) if ious else None,
+                "embedding_cosine": float(np.mean(cosines)) if cosines else None,
+            }
+            totals[name]["latency_ms"].append(latency)
+            totals[name]["recall"].append(recall)
+            totals[name]["iou"].extend(ious)
+            totals[name]["cosine"].extend(cosines)
+        report["images"][image_name] = per_image
+
+    for name, values in totals.items():
+        report["summary"][name] = {
+            "mean_latency_ms": float(np.mean(values["latency_ms"])),
+            "mean_recall": float(np.mean(values["recall"])),
+            "mean_iou": float(np.mean(values["iou"])) if values["iou"] else None,
+            "mean_embedding_cosine": float(np.mean(values["cosine"])) if values["cosine"] else None,
+        }
+
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""HTTP 接口端到端吞吐量与延迟分位数。
+
+对运行中的服务 (--url) 在不同并发数下压测，每个并发线程复用一条 keep-alive 连接。准备阶段:
+  1. 把 insightface 自带的 t1.jpg (多人合影) 提交到 /api/detect，按检测框裁出单人图片
+  2. 用 /api/embeddings/batch/json 提取这些图片的特征，只保留单人脸图片
+  3. 新建临时人脸库，以特征向量录入这些人脸，再补充 --library-size 个随机向量成员
+压测接口 (--endpoints):
+  search            POST /api/search 上传单人图片 (multipart)
+  search_json       POST /api/search/json 提交 base64 图片
+  detect            POST /api/detect 上传合影
+  search_embedding  POST /api/search/embedding 直接提交特征向量，只有检索开销
+默认每个请求在 JPEG 中插入不同的注释段，像素不变但字节不同，避免命中结果缓存 (result_cache)；
+--allow-cache 时重复提交相同字节，测的是缓存命中路径。结束后删除临时人脸库 (--keep 保留)。
+
+用法: python benchmarks/bench_http.py --url http://127.0.0.1:8000 [--concurrency 1 4 16] [--requests 200]
+      [--endpoints search detect] [--library-size 10000] [--output result.json]
+"""
+import argparse
+import base64
+import http.client
+import itertools
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+from common import emit, environment, random_unit_matrix, summarize
+
+CROP_MARGIN = 0.6
+PAD_BATCH = 50
+# 每次运行唯一的注释前缀，重复运行或切换接口时也不会命中之前的缓存结果
+_RUN_TAG = uuid.uuid4().hex[:8]
+_variants = itertools.count()
+
+
+def _encode(img: np.ndarray) -> bytes:
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return buf.tobytes()
+
+
+def _vary(data: bytes) -> bytes:
+    """在 SOI 之后插入 JPEG 注释段 (COM)，解码结果不变，内容哈希不同。"""
+    comment = f"bench-{_RUN_TAG}-{next(_variants)}".encode()
+    return data[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + data[2:]
+
+
+def _multipart(fields: dict, files: dict):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: image/jpeg\r\n\r\n".encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Client:
+    """单线程使用的 keep-alive 连接，出错时重连一次。"""
+
+    def __init__(self, url: str, api_key: str = "", timeout: float = 60.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.headers = {"X-API-Key": api_key} if api_key else {}
+        self.conn = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        self.conn = cls(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method: str, path: str, body: bytes = None, content_type: str = None):
+        headers = dict(self.headers)
+        if content_type:
+            headers["Content-Type"] = content_type
+        for attempt in range(2):
+            if self.conn is None:
+                self._connect()
+            try:
+                self.conn.request(method, self.prefix + path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def json(self, method: str, path: str, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else None
+        status, data = self.request(method, path, body, "application/json" if body is not None else None)
+        if status >= 400:
+            raise RuntimeError(f"{method} {path} -> {status}: {data[:200]!r}")
+        return json.loads(data) if data else None
+
+
+def _prepare(client: Client, args):
+    from insightface.data import get_image
+
+    group = get_image("t1")
+    group_bytes = _encode(group)
+    body, content_type = _multipart({}, {"file": ("t1.jpg", group_bytes)})
+    status, data = client.request("POST", "/api/detect", body, content_type)
+    if status != 200:
+        raise SystemExit(f"/api/detect failed: {status} {data[:200]!r}")
+
+    crops = []
+    for face in json.loads(data)["faces"]:
+        x1, y1, x2, y2 = face["bbox"]
+        w, h = x2 - x1, y2 - y1
+        top, left = int(max(0, y1 - h * CROP_MARGIN)), int(max(0, x1 - w * CROP_MARGIN))
+        bottom, right = int(min(group.shape[0], y2 + h * CROP_MARGIN)), int(min(group.shape[1], x2 + w * CROP_MARGIN))
+        crops.append(_encode(group[top:bottom, left:right]))
+
+    extracted = client.json("POST", "/api/embeddings/batch/json", {"images": [base64.b64encode(c).decode() for c in crops]})
+    faces = [(crops[item["index"]], item["embedding"]) for item in extracted["results"] if "embedding" in item]
+    if not faces:
+        raise SystemExit("No single-face crops could be extracted from the sample image")
+
+    library = client.json("POST", "/api/libraries", {"name": f"bench-{uuid.uuid4().hex[:8]}", "description": "bench_http"})
+    library_id = library["id"]
+    for i, (_, embedding) in enumerate(faces):
+        client.json("POST", f"/api/libraries/{library_id}/members/embedding", {"name": f"face-{i}", "embedding": embedding})
+
+    dim = len(faces[0][1])
+    rng = np.random.default_rng(args.seed)
+    padding = random_unit_matrix(args.library_size, dim, rng) if args.library_size else np.empty((0, dim), dtype=np.float32)
+
+    def pad(start):
+        local = Client(args.url, args.api_key)
+        for i in range(start, min(start + PAD_BATCH, len(padding))):
+            local.json("POST", f"/api/libraries/{library_id}/members/embedding", {
+                "name": f"random-{i}", "embedding": base64.b64encode(padding[i].astype("<f4").tobytes()).decode(),
+            })
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(pad, range(0, len(padding), PAD_BATCH)))
+    return library_id, group_bytes, faces
+
+
+def _request_factory(endpoint: str, library_id: int, group_bytes: bytes, faces, allow_cache: bool):
+    def image(data):
+        return data if allow_cache else _vary(data)
+
+    def search(i):
+        body, content_type = _multipart(
+            {"library_id": library_id, "top_k": 10, "threshold": 0.3}, {"file": ("face.jpg", image(faces[i % len(faces)][0]))}
+        )
+        return "POST", "/api/search", body, content_type
+
+    def search_json(i):
+        payload = {"library_id": library_id, "top_k": 10, "threshold": 0.3, "image": base64.b64encode(image(faces[i % len(faces)][0])).decode()}
+        return "POST", "/api/search/json", json.dumps(payload).encode(), "application/json"
+
+    def detect(i):
+        body, content_type = _multipart({}, {"file": ("group.jpg", image(group_bytes))})
+        return "POST", "/api/detect", body, content_type
+
+    def search_embedding(i):
+        payload = {"library_id": library_id, "top_k": 10, "threshold": 0.3, "embedding": faces[i % len(faces)][1]}
+        return "POST", "/api/search/embedding", json.dumps(payload).encode(), "application/json"
+
+    return {"search": search, "search_json": search_json, "detect": detect, "search_embedding": search_embedding}[endpoint]
+
+
+def _run_level(args, make_request, concurrency: int) -> dict:
+    latencies, statuses, errors = [], {}, 0
+    lock = threading.Lock()
+    issued = itertools.count()
+
+    def worker():
+        nonlocal errors
+        client = Client(args.url, args.api_key)
+        while True:
+            i = next(issued)
+            if i >= args.requests:
+                return
+            method, path, body, content_type = make_request(i)
+            start = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, body, content_type)
+            except (http.client.HTTPException, OSError):
+                status = None
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                if status is None or status >= 400:
+                    errors += 1
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status is not None and status < 400:
+                    latencies.append(elapsed)
+
+    for _ in range(args.warmup):
+        method, path, body, content_type = make_request(0)
+        Client(args.url, args.api_key).request(method, path, body, content_type)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": args.requests,
+        "errors": errors,
+        "status_counts": statuses,
+        "wall_seconds": wall,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "latency": summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", default="", help="服务设置了 API_KEY 时传入")
+    parser.add_argument("--endpoints", nargs="+", default=["search", "detect", "search_embedding"],
+                        choices=["search", "search_json", "detect", "search_embedding"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="每个并发级别的请求数")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--library-size", type=int, default=1000, help="补充的随机向量成员数")
+    parser.add_argument("--allow-cache", action="store_true", help="重复提交相同图片字节，允许命中结果缓存")
+    parser.add_argument("--keep", action="store_true", help="结束后保留临时人脸库")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    client = Client(args.url, args.api_key)
+    library_id, group_bytes, faces = _prepare(client, args)
+    report = {
+        "environment": environment(),
+        "url": args.url,
+        "library_id": library_id,
+        "library_size": len(faces) + args.library_size,
+        "allow_cache": args.allow_cache,
+        "results": {},
+    }
+    try:
+        for endpoint in args.endpoints:
+            make_request = _request_factory(endpoint, library_id, group_bytes, faces, args.allow_cache)
+            report["results"][endpoint] = [_run_level(args, make_request, c) for c in args.concurrency]
+    finally:
+        if not args.keep:
+            client.request("DELETE", f"/api/libraries/{library_id}")
+
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""人脸库特征矩阵从数据库加载的耗时与内存。
+
+在临时 SQLite 数据库中为每个规模写入一个由随机特征向量组成的人脸库 (不需要模型和图片)，报告:
+  decode        decode_embeddings 把整库 embedding_vector 解码为矩阵的耗时
+  cold_load     新的 EmbeddingCache 首次读取: 查询成员、解码、量化、构建索引
+  warm_read     缓存命中时的读取: 只执行一次指纹校验查询
+  matrix_mb     常驻矩阵 (含行元数据) 占用
+--store 时另报告共享特征文件模式: store_build 首次生成文件，store_map 另一个缓存实例
+(相当于另一个 worker 进程) 映射已有文件。
+
+用法: python benchmarks/bench_library_load.py [--sizes 10000 100000] [--dtype float32] [--store] [--output result.json]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from common import emit, environment, random_unit_matrix, time_calls
+
+WORK_DIR = tempfile.mkdtemp(prefix="bench-library-load-")
+# 必须在导入 database 之前设置，基准只使用临时数据库
+os.environ["DATABASE_URL"] = f"sqlite:///{WORK_DIR}/bench.db"
+
+import numpy as np  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+import config_loader  # noqa: E402
+from database import SessionLocal, FaceLibrary, FaceMember, init_db  # noqa: E402
+from embedding_cache import EmbeddingCache  # noqa: E402
+from embedding_codec import decode_embeddings, encode_embedding  # noqa: E402
+
+INSERT_CHUNK = 5000
+MAX_BYTES = 64 * 1024 * 1024 * 1024
+
+
+def _create_library(size: int, dim: int, dtype: str, rng) -> int:
+    with SessionLocal() as db:
+        library = FaceLibrary(name=f"bench-{size}-{uuid.uuid4().hex[:6]}")
+        db.add(library)
+        db.commit()
+        library_id = library.id
+        for start in range(0, size, INSERT_CHUNK):
+            vectors = random_unit_matrix(min(INSERT_CHUNK, size - start), dim, rng)
+            db.execute(insert(FaceMember), [
+                {
+                    "record_id": str(uuid.uuid4()),
+                    "library_id": library_id,
+                    "name": f"member-{start + i}",
+                    "embedding": 1.0,
+                    "embedding_vector": encode_embedding(vector, dtype),
+                }
+                for i, vector in enumerate(vectors)
+            ])
+            db.commit()
+    return library_id
+
+
+def _timed_read(cache: EmbeddingCache, library_id: int):
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        with cache.read(db, library_id) as entry:
+            elapsed = (time.perf_counter() - start) * 1000
+            return entry, elapsed
+
+
+def _warm_read(cache: EmbeddingCache, library_id: int, iterations: int) -> dict:
+    def read():
+        with SessionLocal() as db:
+            with cache.read(db, library_id):
+                pass
+    return time_calls(read, iterations, warmup=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--dtype", default="float32", help="数据库中 embedding_vector 的精度 (storage_dtype)")
+    parser.add_argument("--memory-dtype", default=None, help="常驻矩阵精度 (quantization.memory_dtype)，默认取配置")
+    parser.add_argument("--store", action="store_true", help="同时测试共享特征文件模式")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    config = config_loader._get_config()
+    if args.memory_dtype:
+        config.setdefault("quantization", {})["memory_dtype"] = args.memory_dtype
+    # 共享特征文件写入临时目录
+    config["store"] = {**config.get("store", {}), "path": os.path.join(WORK_DIR, "embeddings")}
+
+    init_db()
+    rng = np.random.default_rng(args.seed)
+    report = {"environment": environment(), "dim": args.dim, "dtype": args.dtype, "results": []}
+    try:
+        for size in args.sizes:
+            start = time.perf_counter()
+            library_id = _create_library(size, args.dim, args.dtype, rng)
+            entry = {"size": size, "insert_seconds": time.perf_counter() - start}
+
+            with SessionLocal() as db:
+                blobs = [row[0] for row in db.query(FaceMember.embedding_vector).filter(FaceMember.library_id == library_id)]
+            entry["decode"] = time_calls(lambda: decode_embeddings(blobs), max(1, args.iterations // 4))
+            del blobs
+
+            cache = EmbeddingCache(max_bytes=MAX_BYTES)
+            loaded, entry["cold_load_ms"] = _timed_read(cache, library_id)
+            entry["matrix_dtype"] = str(loaded.matrix.dtype)
+            entry["index"] = type(loaded.index).__name__
+            entry["matrix_mb"] = loaded.nbytes / 1024 / 1024
+            entry["warm_read"] = _warm_read(cache, library_id, args.iterations)
+            del cache, loaded
+
+            if args.store:
+                store_config = {"enabled": True, "sync_after": 0}
+                cache = EmbeddingCache(max_bytes=MAX_BYTES, store_config=store_config)
+                _, entry["store_build_ms"] = _timed_read(cache, library_id)
+                other = EmbeddingCache(max_bytes=MAX_BYTES, store_config=store_config)
+                mapped, entry["store_map_ms"] = _timed_read(other, library_id)
+                entry["store_process_mb"] = mapped.nbytes / 1024 / 1024
+                entry["store_warm_read"] = _warm_read(other, library_id, args.iterations)
+                del cache, other, mapped
+            report["results"].append(entry)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
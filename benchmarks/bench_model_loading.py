@@ -0,0 +1,88 @@
+"""对比全量加载 buffalo_l 与按 allowed_modules 分层加载的开销。
+
+每种配置在独立子进程中加载模型，报告加载耗时、常驻内存以及每次请求的延迟:
+  full_get   FaceAnalysis.get()，对每张人脸运行所有已加载模型（旧的检测接口路径）
+  detect     FaceService.detect_faces()，只运行检测模型
+  embedding  FaceService.extract_embeddings_batch()，只运行检测 + 识别模型
+
+用法: python benchmarks/bench_model_loading.py [--image face.jpg] [--iterations 50] [--output result.json]
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+
+from common import emit, environment, time_calls
+
+CONFIGURATIONS = {
+    "all_modules": ["detection", "recognition", "landmark_3d_68", "landmark_2d_106", "genderage"],
+    "detection_recognition": ["detection", "recognition"],
+}
+
+
+def _load_image(path):
+    import cv2
+    if path:
+        img = cv2.imread(path)
+        if img is None:
+            raise SystemExit(f"Cannot read image: {path}")
+        return img
+    from insightface.data import get_image
+    return get_image("t1")
+
+
+def _run_configuration(allowed_modules, image_path, iterations, warmup, results):
+    from face_service import FaceService
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    service = FaceService(allowed_modules=allowed_modules)
+    load_seconds = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    img = _load_image(image_path)
+    results.put({
+        "modules": sorted(service.app.models),
+        "faces": len(service.detect_faces(img)),
+        "load_seconds": load_seconds,
+        "model_rss_mb": (rss_after - rss_before) / 1024,
+        "full_get": time_calls(lambda: service.app.get(img), iterations, warmup),
+        "detect": time_calls(lambda: service.detect_faces(img), iterations, warmup),
+        "embedding": time_calls(lambda: service.extract_embeddings_batch([img]), iterations, warmup),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="测试图片，默认使用 insightface 自带的 t1.jpg")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    report = {"environment": environment()}
+    for name, allowed_modules in CONFIGURATIONS.items():
+        results = context.Queue()
+        process = context.Process(
+            target=_run_configuration,
+            args=(allowed_modules, args.image, args.iterations, args.warmup, results),
+        )
+        process.start()
+        report[name] = results.get()
+        process.join()
+
+    full = report["all_modules"]
+    tiered = report["detection_recognition"]
+    report["savings"] = {
+        "model_rss_mb": full["model_rss_mb"] - tiered["model_rss_mb"],
+        "load_seconds": full["load_seconds"] - tiered["load_seconds"],
+        "detect_speedup": full["full_get"]["mean_ms"] / tiered["detect"]["mean_ms"],
+        "embedding_speedup": full["full_get"]["mean_ms"] / tiered["embedding"]["mean_ms"],
+    }
+
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""解码 / 检测 / 识别流水线各阶段的耗时。
+
+合成图片取自 insightface 自带的 t1.jpg (多人合影)，不需要联网或测试数据集:
+  group@<长边>   整张合影缩放到指定长边后编码为 JPEG
+  single         按检测结果裁出的单人图片 (带边距)，用于单人脸接口
+对每张图片报告各阶段的单次耗时:
+  decode         FaceService._read_image: JPEG 字节解码
+  detect         检测模型
+  align          按关键点对齐裁剪 (所有人脸)
+  recognize      识别模型，整张图的人脸一个批次
+  end_to_end     extract_embedding (单人) / extract_all_embeddings (合影)，从 JPEG 字节开始
+另报告 extract_embeddings_batch 在 --batch-sizes 下每张图片的平均耗时。识别微批处理关闭，测的是模型本身。
+
+用法: python benchmarks/bench_pipeline.py [--long-sides 640 1280] [--batch-sizes 1 8 32] [--output result.json]
+"""
+import argparse
+
+import cv2
+import numpy as np
+
+from common import emit, environment, time_calls
+from insightface.utils import face_align
+
+CROP_MARGIN = 0.6
+
+
+def _encode(img: np.ndarray) -> bytes:
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return buf.tobytes()
+
+
+def _single_face(service, base: np.ndarray) -> np.ndarray:
+    """取检测分数最高的人脸，按边距裁出只含这一张脸的图片。"""
+    bboxes, _ = service._detect(base)
+    x1, y1, x2, y2 = bboxes[int(np.argmax(bboxes[:, 4])), :4]
+    w, h = x2 - x1, y2 - y1
+    left, top = int(max(0, x1 - w * CROP_MARGIN)), int(max(0, y1 - h * CROP_MARGIN))
+    right, bottom = int(min(base.shape[1], x2 + w * CROP_MARGIN)), int(min(base.shape[0], y2 + h * CROP_MARGIN))
+    return base[top:bottom, left:right].copy()
+
+
+def _stages(service, data: bytes, single: bool, iterations: int, warmup: int) -> dict:
+    img = service._read_image(data)
+    bboxes, kpss = service._detect(img)
+    size = service._recognition_model.input_size[0]
+    crops = [face_align.norm_crop(img, landmark=kps, image_size=size) for kps in kpss]
+    result = {
+        "shape": list(img.shape[:2]),
+        "bytes": len(data),
+        "faces": int(bboxes.shape[0]),
+        "decode": time_calls(lambda: service._read_image(data), iterations, warmup),
+        "detect": time_calls(lambda: service._detect(img), iterations, warmup),
+        "align": time_calls(lambda: [face_align.norm_crop(img, landmark=kps, image_size=size) for kps in kpss], iterations, warmup),
+    }
+    if crops:
+        result["recognize"] = time_calls(lambda: service._recognize_batch(crops), iterations, warmup)
+    if single:
+        result["end_to_end"] = time_calls(lambda: service.extract_embedding(data), iterations, warmup)
+    else:
+        result["end_to_end"] = time_calls(lambda: service.extract_all_embeddings(data), iterations, warmup)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--long-sides", type=int, nargs="+", default=[640, 1280])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    from face_service import FaceService
+    from insightface.data import get_image
+
+    service = FaceService()
+    service.batcher = None
+    base = get_image("t1")
+
+    images = {}
+    for long_side in args.long_sides:
+        scale = long_side / max(base.shape[:2])
+        images[f"group@{long_side}"] = _encode(cv2.resize(base, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA))
+    single = _encode(_single_face(service, base))
+    images["single"] = single
+
+    report = {
+        "environment": environment(),
+        "model": service.model_name,
+        "det_size": list(service.det_size),
+        "images": {},
+        "batch": {},
+    }
+    for name, data in images.items():
+        report["images"][name] = _stages(service, data, name == "single", args.iterations, args.warmup)
+
+    for batch_size in args.batch_sizes:
+        batch = [single] * batch_size
+        timing = time_calls(lambda: service.extract_embeddings_batch(batch), max(1, args.iterations // 2), 1)
+        report["batch"][str(batch_size)] = {**timing, "per_image_ms": timing["mean_ms"] / batch_size}
+
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
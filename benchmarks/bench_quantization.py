@@ -0,0 +1,92 @@
+"""常驻特征矩阵量化 (float16 / int8) 相对 float32 的内存、延迟与召回率。
+
+对每个库规模用随机单位向量构造库矩阵，查询取库中向量加噪声；以 float32 精确检索为基准，
+对每种精度报告:
+  memory_mb   矩阵 (含 int8 每行缩放系数) 占用
+  latency     FaceService.search_faces_batch 单次查询延迟
+  recall@1    与基准 top-1 相同的比例
+  recall@k    与基准 top_k 结果集合的平均重合率
+量化精度另报告开启精确重排 (--rerank 个候选，原始向量取自内存中的 float32 矩阵) 后的结果。
+
+用法: python benchmarks/bench_quantization.py [--sizes 100000 1000000] [--rerank 100] [--output result.json]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from common import emit, environment, random_unit_matrix, summarize
+from embedding_cache import _quantize_into
+from face_service import FaceService
+
+DTYPES = ["float32", "float16", "int8"]
+
+
+def _search(queries, matrix, scales, top_k, exact=None, rerank=0):
+    ids = range(matrix.shape[0])
+    results = FaceService.search_faces_batch(
+        queries, matrix, ids, ids, top_k, -1.0, normalized=True, scales=scales, exact=exact, rerank_candidates=rerank
+    )
+    return [[hit["member_id"] for hit in hits] for hits in results]
+
+
+def _evaluate(queries, matrix, scales, top_k, baseline, iterations, exact=None, rerank=0):
+    found = _search(queries, matrix, scales, top_k, exact, rerank)
+    samples = []
+    for i in range(iterations):
+        query = queries[i % len(queries)][np.newaxis, :]
+        start = time.perf_counter()
+        _search(query, matrix, scales, top_k, exact, rerank)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        **summarize(samples),
+        "recall@1": float(np.mean([a[0] == b[0] for a, b in zip(found, baseline)])),
+        f"recall@{top_k}": float(np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, baseline)])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--noise", type=float, default=0.05, help="查询向量相对库中向量的噪声强度")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    report = {"environment": environment(), "dim": args.dim, "top_k": args.top_k, "rerank": args.rerank, "results": []}
+    for size in args.sizes:
+        base = random_unit_matrix(size, args.dim, rng)
+        queries = base[rng.integers(0, size, args.queries)]
+        queries = queries + rng.standard_normal(queries.shape, dtype=np.float32) * args.noise
+        baseline = _search(queries, base, None, args.top_k)
+        exact = lambda rows: base[rows]
+
+        for dtype in DTYPES:
+            matrix = np.empty(base.shape, dtype=dtype)
+            scales = np.empty(size, dtype=np.float32) if dtype == "int8" else None
+            _quantize_into(base, matrix, scales)
+            entry = {
+                "size": size,
+                "dtype": dtype,
+                "memory_mb": (matrix.nbytes + (scales.nbytes if scales is not None else 0)) / 1024 / 1024,
+                "search": _evaluate(queries, matrix, scales, args.top_k, baseline, args.iterations),
+            }
+            if dtype != "float32" and args.rerank:
+                entry["rerank"] = _evaluate(
+                    queries, matrix, scales, args.top_k, baseline, args.iterations, exact, args.rerank
+                )
+            report["results"].append(entry)
+            del matrix, scales
+        del base
+
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""人脸库检索内核的延迟 / 内存对比。
+
+对每个库规模，用随机单位向量构造 float32 特征矩阵，比较两种实现:
+  legacy  旧实现: 整库相似度 -> 阈值掩码 -> 对通过阈值的行 argsort
+  topk    topk.top_k_cosine: 分块矩阵乘法 + argpartition，只对 top_k 个结果排序
+另报告 service: FaceService.search_faces 的完整调用 (含结果格式化)，即接口实际的检索开销。
+
+每组报告单次查询延迟 (mean / p50 / p95) 与 tracemalloc 统计的峰值临时内存，
+并校验两种实现返回的行号一致。阈值 0 时几乎所有行通过掩码，是旧实现的最坏情况。
+
+库规模不小于 --ivf-min-size 时另测 IVF 索引 (index.type: ivf)：在各 --nprobe 下报告延迟，
+以及相对精确检索的 recall@k (IVF 返回的前 k 个结果中属于精确前 k 个结果的比例，按查询平均)。
+随机向量没有聚类结构，是 IVF 召回率的最坏情况；真实人脸特征的召回率通常更高。
+
+用法: python benchmarks/bench_search.py [--sizes 1000 10000 100000 1000000] [--thresholds 0 0.5]
+      [--nprobe 8 16 32] [--output result.json]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from common import emit, environment, random_unit_matrix, summarize
+from ann_index import IVFIndex
+from face_service import FaceService
+from topk import top_k_cosine
+
+
+def legacy_search(query, matrix, top_k, threshold):
+    """search_faces 改用 topk 之前的实现（normalized=True 分支）。"""
+    query = query / np.linalg.norm(query)
+    sims = np.dot(matrix, query.astype(matrix.dtype, copy=False))
+    mask = sims >= threshold
+    if not np.any(mask):
+        return np.empty(0, dtype=np.int64)
+    valid = np.where(mask)[0]
+    order = np.argsort(-sims[valid])[:top_k]
+    return valid[order]
+
+
+def topk_search(query, matrix, top_k, threshold):
+    indices, sims = top_k_cosine(query, matrix, top_k)
+    return indices[0][sims[0] >= threshold]
+
+
+def _measure(fn, queries, iterations, warmup):
+    for i in range(warmup):
+        fn(queries[i % len(queries)])
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(queries[i % len(queries)])
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn(queries[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {**summarize(samples), "peak_mb": peak / 1024 / 1024}
+
+
+def recall_at_k(approx: np.ndarray, exact: np.ndarray) -> float:
+    """(Q, k) 近似结果与精确结果的行号，返回平均 recall@k。"""
+    k = exact.shape[1]
+    return float(np.mean([len(np.intersect1d(a, e)) / k for a, e in zip(approx, exact)]))
+
+
+def measure_ivf(matrix, queries, args) -> dict:
+    ids = list(range(matrix.shape[0]))
+    names = [str(i) for i in ids]
+    index = IVFIndex(nlist=args.nlist, min_size=0)
+    start = time.perf_counter()
+    index.build(matrix)
+    build_seconds = time.perf_counter() - start
+    exact, _ = top_k_cosine(queries, matrix, args.top_k)
+
+    results = []
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        search = lambda q: FaceService.search_faces(q, matrix, ids, names, args.top_k, -1.0, normalized=True, index=index)
+        approx = np.array([[hit["member_id"] for hit in search(q)] for q in queries])
+        results.append({
+            "nprobe": nprobe,
+            "recall_at_k": recall_at_k(approx, exact),
+            "service": _measure(search, queries, args.iterations, args.warmup),
+        })
+    return {"size": matrix.shape[0], "nlist": len(index._lists), "build_seconds": build_seconds, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.0, 0.5])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32], help="IVF 每次检索探测的聚类数")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF 聚类中心数量，0 表示自动")
+    parser.add_argument("--ivf-min-size", type=int, default=10000, help="库规模不小于此值时测 IVF")
+    parser.add_argument("--recall-queries", type=int, default=100, help="计算 recall@k 的查询数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    report = {"environment": environment(), "dim": args.dim, "top_k": args.top_k, "results": [], "ivf": []}
+    for size in args.sizes:
+        matrix = random_unit_matrix(size, args.dim, rng)
+        ids = list(range(size))
+        names = [str(i) for i in ids]
+        # 查询取库中向量加噪声，保证阈值 0.5 时也有命中
+        queries = matrix[rng.integers(0, size, 8)] + rng.standard_normal((8, args.dim), dtype=np.float32) * 0.03
+        for threshold in args.thresholds:
+            legacy = lambda q: legacy_search(q, matrix, args.top_k, threshold)
+            engine = lambda q: topk_search(q, matrix, args.top_k, threshold)
+            service = lambda q: FaceService.search_faces(q, matrix, ids, names, args.top_k, threshold, normalized=True)
+            same = all(np.array_equal(legacy(q), engine(q)) for q in queries)
+            entry = {
+                "size": size,
+                "threshold": threshold,
+                "legacy": _measure(legacy, queries, args.iterations, args.warmup),
+                "topk": _measure(engine, queries, args.iterations, args.warmup),
+                "service": _measure(service, queries, args.iterations, args.warmup),
+                "same_results": same,
+            }
+            entry["speedup"] = entry["legacy"]["mean_ms"] / entry["topk"]["mean_ms"]
+            report["results"].append(entry)
+        if size >= args.ivf_min_size:
+            recall_queries = matrix[rng.integers(0, size, args.recall_queries)]
+            recall_queries = recall_queries + rng.standard_normal(recall_queries.shape, dtype=np.float32) * 0.03
+            report["ivf"].append(measure_ivf(matrix, recall_queries, args))
+        del matrix, ids, names
+
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
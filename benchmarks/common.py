@@ -0,0 +1,80 @@
+"""基准脚本共用的工具函数：合成数据、耗时统计和 JSON 输出。"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def random_unit_matrix(rows: int, dim: int, rng, block: int = 100000) -> np.ndarray:
+    """逐块生成 (rows, dim) 的随机单位向量，避免整库大小的临时副本。"""
+    matrix = np.empty((rows, dim), dtype=np.float32)
+    for start in range(0, rows, block):
+        chunk = rng.standard_normal((min(block, rows - start), dim), dtype=np.float32)
+        chunk /= np.linalg.norm(chunk, axis=1, keepdims=True)
+        matrix[start:start + len(chunk)] = chunk
+    return matrix
+
+
+def summarize(samples_ms) -> dict:
+    """延迟样本 (毫秒) 的均值与分位数。"""
+    samples = sorted(samples_ms)
+    if not samples:
+        return {"count": 0}
+
+    def pct(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples),
+        "p50_ms": pct(0.50),
+        "p90_ms": pct(0.90),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": samples[-1],
+    }
+
+
+def time_calls(fn, iterations: int, warmup: int = 0) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def environment() -> dict:
+    """运行环境信息，写入报告便于比较不同版本 / 机器的结果。"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def emit(report: dict, output=None):
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if output:
+        Path(output).write_text(text, encoding="utf-8")
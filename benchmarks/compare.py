@@ -0,0 +1,63 @@
+"""对比两份基准报告中的耗时指标。
+
+递归比较两份 JSON 中路径相同、键名以 _ms 结尾的数值 (列表按元素顺序对应)，
+新报告比基准报告慢超过 --tolerance 的指标标记为 REGRESSION，快超过同样比例的标记为 improved。
+存在回退时退出码为 1，可用于 CI 检查。
+
+用法: python benchmarks/compare.py baseline.json current.json [--tolerance 0.1] [--metric p50_ms]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def _leaves(node, path=()):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _leaves(value, path + (str(key),))
+    elif isinstance(node, list):
+        for i, value in enumerate(node):
+            yield from _leaves(value, path + (str(i),))
+    elif isinstance(node, (int, float)) and not isinstance(node, bool) and path and path[-1].endswith("_ms"):
+        yield "/".join(path), float(node)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="允许的相对变化，默认 10%%")
+    parser.add_argument("--metric", nargs="+", help="只比较这些键，例如 p50_ms mean_ms")
+    parser.add_argument("--all", action="store_true", help="同时列出变化在容差内的指标")
+    args = parser.parse_args()
+
+    baseline = dict(_leaves(json.loads(Path(args.baseline).read_text(encoding="utf-8"))))
+    current = dict(_leaves(json.loads(Path(args.current).read_text(encoding="utf-8"))))
+
+    regressions = 0
+    for path in sorted(baseline.keys() & current.keys()):
+        if args.metric and path.rsplit("/", 1)[-1] not in args.metric:
+            continue
+        before, after = baseline[path], current[path]
+        change = (after - before) / before if before else 0.0
+        if change > args.tolerance:
+            status = "REGRESSION"
+            regressions += 1
+        elif change < -args.tolerance:
+            status = "improved"
+        elif args.all:
+            status = "ok"
+        else:
+            continue
+        print(f"{status:<10} {change:+7.1%}  {before:10.3f} -> {after:10.3f}  {path}")
+
+    missing = sorted(baseline.keys() - current.keys())
+    if missing:
+        print(f"{len(missing)} metrics missing from {args.current}", file=sys.stderr)
+    print(f"{regressions} regressions (tolerance {args.tolerance:.0%})", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""按预设参数依次运行各基准脚本，合并为一份 JSON 报告。
+
+每个脚本在独立子进程中运行 (互不影响峰值内存与模型加载)，单个脚本失败时记录错误并继续。
+--quick 使用较小的规模和迭代次数，适合提交前快速检查；默认参数与各脚本的默认值一致。
+指定 --url 时追加 HTTP 端到端压测 (需要先启动服务)。合并后的报告可以用 compare.py 对比。
+
+用法: python benchmarks/run_all.py [--quick] [--only search pipeline] [--url http://127.0.0.1:8000] --output report.json
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import emit, environment
+
+HERE = Path(__file__).resolve().parent
+
+# 套件名 -> (脚本, 默认参数, --quick 参数)
+SUITES = {
+    "search": ("bench_search.py", [], ["--sizes", "1000", "10000", "100000", "--iterations", "5"]),
+    "quantization": ("bench_quantization.py", [], ["--sizes", "100000", "--queries", "20", "--iterations", "5"]),
+    "library_load": ("bench_library_load.py", ["--store"], ["--sizes", "10000", "--store", "--iterations", "5"]),
+    "pipeline": ("bench_pipeline.py", [], ["--long-sides", "640", "--batch-sizes", "1", "8", "--iterations", "5"]),
+    "model_loading": ("bench_model_loading.py", [], ["--iterations", "10", "--warmup", "2"]),
+    "det_size": ("bench_det_size.py", [], ["--long-sides", "320", "640", "--iterations", "5"]),
+    "http": ("bench_http.py", [], ["--concurrency", "1", "4", "--requests", "50", "--library-size", "200"]),
+}
+
+
+def _run(name: str, args, workdir: Path) -> dict:
+    script, default_args, quick_args = SUITES[name]
+    output = workdir / f"{name}.json"
+    command = [sys.executable, str(HERE / script), *(quick_args if args.quick else default_args), "--output", str(output)]
+    if name == "http":
+        command += ["--url", args.url] + (["--api-key", args.api_key] if args.api_key else [])
+    start = time.perf_counter()
+    proc = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    print(f"{name}: {'ok' if proc.returncode == 0 else 'failed'} ({elapsed:.1f}s)", file=sys.stderr)
+    if proc.returncode != 0 or not output.exists():
+        return {"error": proc.stderr.strip().splitlines()[-1:] or [f"exit code {proc.returncode}"], "seconds": elapsed}
+    result = json.loads(output.read_text(encoding="utf-8"))
+    # 环境信息在合并报告顶层记录一次
+    result.pop("environment", None)
+    result["seconds"] = elapsed
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="使用较小的规模和迭代次数")
+    parser.add_argument("--only", nargs="+", choices=list(SUITES), help="只运行指定的套件")
+    parser.add_argument("--url", help="服务地址，指定时运行 HTTP 压测")
+    parser.add_argument("--api-key", default="")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    names = args.only or [name for name in SUITES if name != "http" or args.url]
+    if "http" in names and not args.url:
+        parser.error("--url is required for the http suite")
+
+    report = {"environment": environment(), "preset": "quick" if args.quick else "default", "suites": {}}
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        for name in names:
+            report["suites"][name] = _run(name, args, Path(workdir))
+
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
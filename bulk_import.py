@@ -0,0 +1,235 @@
+"""人脸库成员批量导入。
+
+支持两种格式:
+  ZIP     每个图片文件为一个成员；位于子目录中的图片以目录名为成员名，否则以文件名（不含扩展名）为成员名
+  NDJSON  每行一个 JSON 对象 {"name": "...", "image": "<base64>"}
+
+导入在后台任务中执行: 逐条读取 -> 校验 -> 多线程并行解码/检测（每块图片的人脸合并为一批送入识别模型）
+-> 保存图片 -> 按 insert_batch_size 批量插入并提交。任务被取消时已提交的成员保留。
+"""
+import base64
+import binascii
+import json
+import logging
+import os
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+from typing import Iterator, List
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import insert
+
+from config_loader import get_bulk_import_config, get_model_name
+from database import SessionLocal, FaceMember, bump_member_version
+from embedding_cache import embedding_cache
+from embedding_codec import encode_embedding
+from face_service import face_service
+from jobs import Job, job_registry
+from storage import ALLOWED_EXTENSIONS, MAX_FILE_SIZE, get_file_ext, validate_upload, detect_image_ext, save_member_image, remove_member_images
+
+logger = logging.getLogger(__name__)
+
+FORMAT_ZIP = "zip"
+FORMAT_NDJSON = "ndjson"
+
+_ZIP_MAGIC = b"PK\x03\x04"
+MAX_NAME_LENGTH = 100
+
+
+def detect_format(path: str) -> str:
+    with open(path, "rb") as f:
+        head = f.read(64)
+    if head.startswith(_ZIP_MAGIC):
+        return FORMAT_ZIP
+    if head.lstrip()[:1] == b"{":
+        return FORMAT_NDJSON
+    raise ValueError("Unsupported bulk import format, expected ZIP or NDJSON")
+
+
+def _zip_members(archive: zipfile.ZipFile) -> Iterator[zipfile.ZipInfo]:
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        parts = PurePosixPath(info.filename).parts
+        if any(part.startswith(".") or part == "__MACOSX" for part in parts):
+            continue
+        if get_file_ext(info.filename) not in ALLOWED_EXTENSIONS:
+            continue
+        yield info
+
+
+def count_items(path: str, fmt: str) -> int:
+    if fmt == FORMAT_ZIP:
+        with zipfile.ZipFile(path) as archive:
+            return sum(1 for _ in _zip_members(archive))
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def _iter_zip(path: str) -> Iterator[dict]:
+    with zipfile.ZipFile(path) as archive:
+        for index, info in enumerate(_zip_members(archive)):
+            source = PurePosixPath(info.filename)
+            name = source.parts[-2] if len(source.parts) > 1 else source.stem
+            item = {"index": index, "name": name, "source": info.filename, "filename": source.name}
+            if info.file_size > MAX_FILE_SIZE:
+                # 先按目录中记录的大小拒绝，避免解压超大文件
+                item["error"] = f"File exceeds max size of {MAX_FILE_SIZE} bytes"
+            else:
+                try:
+                    item["data"] = archive.read(info)
+                except (zipfile.BadZipFile, OSError) as e:
+                    item["error"] = f"Failed to read entry: {e}"
+            yield item
+
+
+def _iter_ndjson(path: str) -> Iterator[dict]:
+    with open(path, "rb") as f:
+        index = 0
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = {"index": index, "name": None, "source": f"line {line_no}", "filename": "image"}
+            index += 1
+            try:
+                record = json.loads(line)
+                item["name"] = record.get("name")
+                image = record["image"]
+                if "," in image:
+                    image = image.split(",", 1)[1]
+                item["data"] = base64.b64decode(image + "=" * (-len(image) % 4))
+            except (ValueError, KeyError, TypeError, AttributeError, binascii.Error) as e:
+                item["error"] = f"Invalid record: {e}"
+            yield item
+
+
+def iter_items(path: str, fmt: str) -> Iterator[dict]:
+    return _iter_zip(path) if fmt == FORMAT_ZIP else _iter_ndjson(path)
+
+
+def _failure(job: Job, item: dict, error: str):
+    job.add_failure(error, index=item["index"], name=item["name"], source=item["source"])
+
+
+def _validated(items: Iterator[dict], job: Job) -> Iterator[dict]:
+    for item in items:
+        if "error" not in item:
+            name = item["name"]
+            if not isinstance(name, str) or not name.strip() or len(name) > MAX_NAME_LENGTH:
+                item["error"] = f"Name must be 1-{MAX_NAME_LENGTH} characters"
+            else:
+                try:
+                    validate_upload(item["filename"], len(item["data"]), item["data"])
+                except HTTPException as e:
+                    item["error"] = e.detail
+        if "error" in item:
+            _failure(job, item, item["error"])
+            continue
+        yield item
+
+
+def _chunks(items: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _extract(chunk: List[dict]) -> List[dict]:
+    return face_service.extract_embeddings_batch([item["data"] for item in chunk], purpose="enroll")
+
+
+class _MemberWriter:
+    """保存成员图片并缓冲待插入的行，满 insert_batch_size 后一次 executemany 提交。"""
+
+    def __init__(self, job: Job, library_id: int, batch_size: int):
+        self.job = job
+        self.library_id = library_id
+        self.batch_size = batch_size
+        self.model_name = get_model_name()
+        self._rows = []
+        self._items = []
+
+    def write(self, chunk: List[dict], results: List[dict]):
+        for item, result in zip(chunk, results):
+            if "error" in result:
+                _failure(self.job, item, result["error"])
+                continue
+            embedding = result["embedding"]
+            try:
+                image_path = save_member_image(item["data"], detect_image_ext(item["data"]))
+            except OSError as e:
+                _failure(self.job, item, f"Failed to save image: {e}")
+                continue
+            self._rows.append({
+                "record_id": str(uuid.uuid4()),
+                "library_id": self.library_id,
+                "name": item["name"],
+                "embedding": float(np.linalg.norm(embedding)),
+                "embedding_vector": encode_embedding(embedding),
+                "embedding_model": self.model_name,
+                "image_path": str(image_path),
+            })
+            self._items.append(item)
+            if len(self._rows) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows, items = self._rows, self._items
+        self._rows, self._items = [], []
+        try:
+            with SessionLocal() as db:
+                db.execute(insert(FaceMember), rows)
+                db.execute(bump_member_version(self.library_id))
+                db.commit()
+        except Exception as e:
+            logger.exception(f"Bulk import insert failed for library {self.library_id}")
+            remove_member_images([row["image_path"] for row in rows])
+            for item in items:
+                _failure(self.job, item, f"Database insert failed: {e}")
+            return
+        self.job.add_success(len(rows))
+
+
+def _remove_upload(path: str, **_):
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+@job_registry.handler("bulk_import", cleanup=_remove_upload)
+def run_bulk_import(job: Job, library_id: int, path: str, format: str) -> dict:
+    config = get_bulk_import_config()
+    workers = max(1, int(config.get("workers", 4)))
+    chunk_size = max(1, int(config.get("chunk_size", 32)))
+    writer = _MemberWriter(job, library_id, max(1, int(config.get("insert_batch_size", 500))))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-import") as pool:
+            # 最多 2 * workers 块在途，读取速度快于推理时不会把整个文件读入内存
+            in_flight = deque()
+            for chunk in _chunks(_validated(iter_items(path, format), job), chunk_size):
+                job.check_cancelled()
+                in_flight.append((chunk, pool.submit(_extract, chunk)))
+                while len(in_flight) >= workers * 2:
+                    done, future = in_flight.popleft()
+                    writer.write(done, future.result())
+            while in_flight:
+                done, future = in_flight.popleft()
+                writer.write(done, future.result())
+    finally:
+        # 取消或出错时在途块的结果被丢弃，已保存图片的缓冲行仍然提交
+        writer.flush()
+        _remove_upload(path)
+        embedding_cache.invalidate(library_id)
+
+    return {"library_id": library_id, "imported": job.succeeded, "failed": job.failed}
@@ -44,10 +44,72 @@ def get_server_config():
     return _get_config().get("server", {})
 
 
+def get_server_workers() -> int:
+    """HTTP worker 进程数：环境变量 WORKERS 优先，其次 server.workers。"""
+    return max(1, int(os.getenv("WORKERS") or get_server_config().get("workers", 1)))
+
+
 def get_model_config():
     return _get_config().get("model", {})
 
 
+def get_model_name():
+    """当前配置的模型名，记录在成员的 embedding_model 列中。"""
+    return get_model_config().get("name", "buffalo_l")
+
+
+def get_inference_config():
+    return _get_config().get("inference", {})
+
+
+def get_cache_config():
+    return _get_config().get("cache", {})
+
+
+def get_result_cache_config():
+    return _get_config().get("result_cache", {})
+
+
+def get_quantization_config():
+    return _get_config().get("quantization", {})
+
+
+def get_store_config():
+    return _get_config().get("store", {})
+
+
+def get_access_log_config():
+    return _get_config().get("access_log", {})
+
+
+def get_metrics_config():
+    return _get_config().get("metrics", {})
+
+
+def get_quality_config():
+    return _get_config().get("quality", {})
+
+
+def get_stream_config():
+    return _get_config().get("stream", {})
+
+
+def get_index_config():
+    return _get_config().get("index", {})
+
+
+def get_bulk_import_config():
+    return _get_config().get("bulk_import", {})
+
+
+def get_reembed_config():
+    return _get_config().get("reembed", {})
+
+
+def get_jobs_config():
+    return _get_config().get("jobs", {})
+
+
 def get_upload_config():
     return _get_config().get("upload", {})
 
@@ -1,7 +1,8 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, update
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, LargeBinary, Boolean
 from sqlalchemy.sql import func
 from pydantic import BaseModel
 from typing import Optional, List, Any
@@ -23,6 +24,19 @@ else:
 
 engine = create_engine(DATABASE_URL, connect_args=connect_args, **pool_kwargs)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def get_async_database_url(url: str) -> str:
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2:", "postgresql:", "postgres:"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg:" + url[len(prefix):]
+    return url
+
+
+async_engine = create_async_engine(get_async_database_url(DATABASE_URL), **pool_kwargs)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -32,6 +46,8 @@ class FaceLibrary(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), unique=True, nullable=False)
     description = Column(Text, nullable=True)
+    # 成员版本号，成员增删改时在同一事务中递增 (bump_member_version)，特征矩阵缓存据此判断是否需要重新加载
+    member_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -44,12 +60,39 @@ class FaceMember(Base):
     library_id = Column(Integer, ForeignKey("face_libraries.id"), nullable=False, index=True)
     name = Column(String(100), nullable=False)
     embedding = Column(Float, nullable=False)
-    embedding_vector = Column(Text, nullable=False)
+    embedding_vector = Column(LargeBinary, nullable=False)
     image_path = Column(String(500), nullable=True)
+    # 生成 embedding_vector 的模型 (model.name)
+    embedding_model = Column(String(100), nullable=True, index=True)
+    # 重新提取特征时写入的新模型向量，切换 (cut-over) 前搜索仍使用 embedding_vector
+    staged_embedding = Column(LargeBinary, nullable=True)
+    staged_embedding_norm = Column(Float, nullable=True)
+    staged_model = Column(String(100), nullable=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
 
+class BackgroundJob(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(String(32), primary_key=True)
+    type = Column(String(50), nullable=False, index=True)
+    status = Column(String(20), nullable=False, index=True)
+    params = Column(Text, nullable=False, default="{}")
+    total = Column(Integer, nullable=True)
+    processed = Column(Integer, nullable=False, default=0)
+    succeeded = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    failures = Column(Text, nullable=False, default="[]")
+    error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=False)
+
+
 class FaceLibrarySchema(BaseModel):
     id: Optional[int] = None
     name: str
@@ -65,6 +108,7 @@ class FaceMemberSchema(BaseModel):
     library_id: int
     name: str
     image_path: Optional[str] = None
+    embedding_model: Optional[str] = None
     created_at: Optional[str] = None
     
     class Config:
@@ -73,7 +117,7 @@ class FaceMemberSchema(BaseModel):
 
 class FaceMemberWithEmbedding(FaceMemberSchema):
     embedding: float
-    embedding_vector: str
+    embedding_vector: bytes
 
 
 class PaginatedResponse(BaseModel):
@@ -83,6 +127,20 @@ class PaginatedResponse(BaseModel):
     items: List[Any]
 
 
+def bump_member_version(library_id: int):
+    """递增人脸库成员版本号并返回新值的语句，与成员变更在同一事务中执行: version = db.scalar(...)。
+
+    人脸库的 updated_at 保持原值，成员变更不算人脸库本身的修改。
+    """
+    return (
+        update(FaceLibrary)
+        .where(FaceLibrary.id == library_id)
+        .values(member_version=FaceLibrary.member_version + 1, updated_at=FaceLibrary.updated_at)
+        .returning(FaceLibrary.member_version)
+        .execution_options(synchronize_session=False)
+    )
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -91,5 +149,14 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    from migrations import migration_lock, run_migrations
+
+    with migration_lock(engine):
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
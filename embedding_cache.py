@@ -0,0 +1,718 @@
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.orm import Session
+
+from ann_index import create_index
+from config_loader import get_cache_config, get_model_name, get_quantization_config, get_store_config
+from database import FaceLibrary, FaceMember
+from embedding_codec import decode_embeddings, quantize_int8
+from embedding_store import RECORD, LibraryStore, StoreView
+from jobs import PENDING, RUNNING, job_registry
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+QUANTIZE_CHUNK_ROWS = 65536
+STORE_CHUNK_ROWS = 10000
+# 缓存条目内容版本号，进程内全局递增，不同人脸库、重新加载后的条目也不会重复
+_versions = itertools.count(1)
+# 进程内每行元数据 (member_ids / names 列表项) 的估计字节数，计入缓存内存预算
+ROW_METADATA_BYTES = 96
+
+
+def _stamp(dt) -> float:
+    return dt.timestamp() if dt is not None else 0.0
+
+
+def active_model_vectors():
+    """(过滤条件, 向量列)：向量由当前模型 (model.name) 生成的成员取 embedding_vector，
+    否则取已暂存的当前模型向量 staged_embedding；两者都没有的成员与查询向量不可比，不参与检索。"""
+    model_name = get_model_name()
+    staged = and_(FaceMember.staged_model == model_name, FaceMember.embedding_model != model_name)
+    vector = case((staged, FaceMember.staged_embedding), else_=FaceMember.embedding_vector).label("vector")
+    # coalesce 使条件不为 NULL，取反 (~condition) 时也能正确统计不可检索的成员
+    condition = or_(
+        func.coalesce(FaceMember.embedding_model, model_name) == model_name,
+        func.coalesce(FaceMember.staged_model, "") == model_name,
+    )
+    return condition, vector
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def _quantize_into(vectors: np.ndarray, data: np.ndarray, scales: Optional[np.ndarray]):
+    """逐块归一化 vectors 并按 data 的精度写入 data，避免整库大小的临时副本。
+
+    int8 时 scales 写入每行缩放系数 1 / |q|，反量化后的行向量仍为单位长度，
+    相似度 = (q · query) * scale；float32 / float16 没有缩放系数，scales 为 None。
+    """
+    for start in range(0, vectors.shape[0], QUANTIZE_CHUNK_ROWS):
+        block = _normalize(vectors[start:start + QUANTIZE_CHUNK_ROWS].astype(np.float32, copy=False))
+        end = start + block.shape[0]
+        if scales is None:
+            data[start:end] = block
+            continue
+        quantized, _ = quantize_int8(block)
+        data[start:end] = quantized
+        norms = np.linalg.norm(quantized.astype(np.float32), axis=1)
+        norms[norms == 0] = 1
+        scales[start:end] = 1 / norms
+
+
+class _ReadWriteLock:
+    """多读单写锁：搜索并发读取矩阵，成员变更时独占写入。"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class LibraryMatrix:
+    """单个人脸库的常驻特征矩阵。
+
+    行向量为 L2 归一化后的向量，按 quantization.memory_dtype 以 float32 / float16 / int8 常驻，
+    int8 另存每行缩放系数 (见 _quantize_into)。member_ids / names 与矩阵行一一对齐。
+    底层缓冲区按容量倍增，新增成员为均摊 O(1)；删除成员时用最后一行填补空位。
+    version 在成员变更时递增，结果缓存 (result_cache) 以此判断检索结果是否仍然有效；
+    member_version 为矩阵对应的数据库成员版本号 (FaceLibrary.member_version)。
+    """
+
+    def __init__(self, dim: Optional[int] = None, capacity: int = 0, dtype=None):
+        config = get_quantization_config()
+        self.dim = dim
+        self.dtype = np.dtype(dtype or config.get("memory_dtype", "float32"))
+        self.rerank_candidates = int(config.get("rerank_candidates", 0)) if self.dtype != np.float32 else 0
+        self._data = np.empty((capacity, dim or 0), dtype=self.dtype)
+        self._scales = np.empty(capacity, dtype=np.float32) if self.dtype == np.int8 else None
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._stamps = np.empty(capacity, dtype=np.float64)
+        self.member_ids = []
+        self.names = []
+        self._rows = {}
+        self.index = create_index()
+        self.lock = _ReadWriteLock()
+        self.deleted = None
+        self.version = next(_versions)
+        self.member_version = None
+
+    @classmethod
+    def from_rows(cls, ids, names, vectors: np.ndarray, stamps) -> "LibraryMatrix":
+        count = len(ids)
+        dim = vectors.shape[1] if count else None
+        entry = cls(dim, count)
+        if count:
+            _quantize_into(vectors, entry._data, entry._scales)
+            entry._ids[:] = ids
+            entry._stamps[:] = stamps
+        entry.member_ids = list(ids)
+        entry.names = list(names)
+        entry._rows = {member_id: row for row, member_id in enumerate(entry.member_ids)}
+        entry.index.build(entry.matrix)
+        return entry
+
+    @property
+    def size(self) -> int:
+        return len(self.member_ids)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._data[:self.size]
+
+    @property
+    def scales(self) -> Optional[np.ndarray]:
+        return self._scales[:self.size] if self._scales is not None else None
+
+    @property
+    def nbytes(self) -> int:
+        scales = self._scales.nbytes if self._scales is not None else 0
+        return self._data.nbytes + scales + self._ids.nbytes + self._stamps.nbytes
+
+    def matches(self, member_version) -> bool:
+        return member_version == self.member_version
+
+    def _grow(self, dim: int):
+        if self.dim is None:
+            self.dim = dim
+        capacity = max(16, self._data.shape[0] * 2)
+        data = np.empty((capacity, self.dim), dtype=self.dtype)
+        ids = np.empty(capacity, dtype=np.int64)
+        stamps = np.empty(capacity, dtype=np.float64)
+        scales = np.empty(capacity, dtype=np.float32) if self._scales is not None else None
+        if self.size:
+            data[:self.size] = self._data[:self.size]
+            ids[:self.size] = self._ids[:self.size]
+            stamps[:self.size] = self._stamps[:self.size]
+            if scales is not None:
+                scales[:self.size] = self._scales[:self.size]
+        self._data, self._ids, self._stamps, self._scales = data, ids, stamps, scales
+
+    def _store(self, row: int, vector: np.ndarray):
+        scales = self._scales[row:row + 1] if self._scales is not None else None
+        _quantize_into(vector[np.newaxis, :], self._data[row:row + 1], scales)
+
+    def add(self, member_id: int, name: str, vector: np.ndarray, stamp: float):
+        if member_id in self._rows:
+            self.update(member_id, name, vector, stamp)
+            return
+        row = self.size
+        if row >= self._data.shape[0]:
+            self._grow(vector.shape[0])
+        self._store(row, vector)
+        self._ids[row] = member_id
+        self._stamps[row] = stamp
+        self.member_ids.append(member_id)
+        self.names.append(name)
+        self._rows[member_id] = row
+        self.index.add(self.matrix, row)
+        self.version = next(_versions)
+
+    def update(self, member_id: int, name: str, vector: Optional[np.ndarray], stamp: float):
+        row = self._rows.get(member_id)
+        if row is None:
+            if vector is not None:
+                self.add(member_id, name, vector, stamp)
+            return
+        self.names[row] = name
+        self._stamps[row] = stamp
+        if vector is not None:
+            self._store(row, vector)
+            self.index.update(self.matrix, row)
+        self.version = next(_versions)
+
+    def remove(self, member_id: int):
+        row = self._rows.pop(member_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            self._data[row] = self._data[last]
+            if self._scales is not None:
+                self._scales[row] = self._scales[last]
+            self._ids[row] = self._ids[last]
+            self._stamps[row] = self._stamps[last]
+            self.member_ids[row] = self.member_ids[last]
+            self.names[row] = self.names[last]
+            self._rows[self.member_ids[row]] = row
+        self.member_ids.pop()
+        self.names.pop()
+        self.index.remove(row, last)
+        self.version = next(_versions)
+
+
+def _memory_dtype() -> np.dtype:
+    return np.dtype(get_quantization_config().get("memory_dtype", "float32"))
+
+
+def _quantize_rows(vectors: np.ndarray, dtype: np.dtype) -> Tuple[np.ndarray, np.ndarray]:
+    """返回按 dtype 量化后的行与 int8 缩放系数 (非 int8 时为 1)。"""
+    data = np.empty(vectors.shape, dtype=dtype)
+    scales = np.ones(vectors.shape[0], dtype=np.float32)
+    _quantize_into(vectors, data, scales if dtype == np.int8 else None)
+    return data, scales
+
+
+class MappedLibrary:
+    """共享磁盘特征文件 (embedding_store) 上的人脸库视图，检索接口与 LibraryMatrix 相同。
+
+    矩阵是只读 memmap，各 worker 进程共享页缓存，进程内只保存行元数据。
+    行只追加不移动，已删除的行由 deleted 掩码在检索时排除；成员变更直接写入文件，
+    本进程和其他进程都在下一次读取发现成员版本号变化时映射新增的行。
+    """
+
+    def __init__(self, store: LibraryStore):
+        self.store = store
+        self.view: Optional[StoreView] = None
+        self.member_ids = []
+        self.names = []
+        self.deleted = np.zeros(0, dtype=bool)
+        self.index = create_index()
+        self.lock = _ReadWriteLock()
+        self.rerank_candidates = 0
+        self.mismatch_since = None
+        self.version = next(_versions)
+        self.member_version = None
+        self._size = 0
+        self._fingerprint = (0, None, 0.0)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.view.dim or None
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self.view.vectors
+
+    @property
+    def scales(self) -> Optional[np.ndarray]:
+        return self.view.records["scale"] if self.view.dtype == np.int8 else None
+
+    @property
+    def nbytes(self) -> int:
+        return self.deleted.nbytes + len(self.member_ids) * ROW_METADATA_BYTES
+
+    def fingerprint(self):
+        """已映射存活行的 (行数, 最大成员 id, 最大时间戳)，与数据库中的成员比对文件是否完整。"""
+        return self._fingerprint
+
+    def matches(self, member_version) -> bool:
+        # 文件在映射后追加过行 (如其他进程提交数据库后才写入文件) 时也重新映射
+        return (
+            member_version == self.member_version
+            and self.store.generation() == self.view.generation
+            and not self.view.appended()
+        )
+
+    def _names(self, db: Session, ids, full: bool):
+        query = db.query(FaceMember.id, FaceMember.name)
+        if full:
+            names = dict(query.filter(FaceMember.library_id == self.store.library_id).all())
+        else:
+            names = {}
+            for start in range(0, len(ids), 500):
+                names.update(query.filter(FaceMember.id.in_(ids[start:start + 500])).all())
+        return [names.get(member_id, "") for member_id in ids]
+
+    def refresh(self, db: Session) -> bool:
+        """映射最新提交的行和删除位图；文件不存在时返回 False。调用方需持有写锁。"""
+        view = self.store.open()
+        if view is None:
+            return False
+        start = self.view.count if self.view is not None and view.generation == self.view.generation else 0
+        if start == 0:
+            self.member_ids, self.names = [], []
+            self.index = create_index()
+        ids = view.records["member_id"][start:].tolist()
+        if ids:
+            self.names.extend(self._names(db, ids, full=start == 0))
+            self.member_ids.extend(ids)
+        self.view = view
+        self.rerank_candidates = int(get_quantization_config().get("rerank_candidates", 0)) if view.dtype != np.float32 else 0
+        if start == 0:
+            self.index.build(view.vectors)
+        else:
+            self.index.extend(view.vectors, start)
+
+        self.deleted = view.tombstones()
+        live = ~self.deleted
+        self._size = int(live.sum())
+        if self._size:
+            self._fingerprint = (
+                self._size,
+                int(view.records["member_id"][live].max()),
+                float(view.records["stamp"][live].max()),
+            )
+        else:
+            self._fingerprint = (0, None, 0.0)
+        self.version = next(_versions)
+        return True
+
+
+class EmbeddingCache:
+    """按人脸库缓存特征矩阵，所有库共享一个内存预算，超出时按 LRU 淘汰。
+
+    每次读取只查询人脸库的成员版本号 (FaceLibrary.member_version，单行读取) 校验缓存，
+    成员变更与版本号递增在同一事务中提交，因此其他 worker 进程的修改也会触发重新加载。
+    本进程的变更通过 add_member / update_member / remove_member 原地更新矩阵，
+    只有版本号正好是矩阵版本号的下一个时才原地更新，否则丢弃缓存，下次读取时重新加载。
+    只加载与当前模型可比的向量 (见 active_model_vectors)，其他模型生成且没有暂存当前模型向量的成员不参与检索。
+
+    开启 store 时特征矩阵放在共享磁盘文件中 (MappedLibrary)：成员变更追加写入文件，
+    版本号变化时只映射新增的行，再用一条聚合查询 (count / max(id) / max(updated_at))
+    核对文件是否完整；不一致超过 sync_after 秒 (如批量导入绕过了 add_member) 时按数据库补齐文件。
+    """
+
+    def __init__(self, max_bytes: int, store_config: Optional[dict] = None):
+        store_config = store_config or {}
+        self.max_bytes = max_bytes
+        self.store_enabled = bool(store_config.get("enabled", False))
+        self.sync_after = float(store_config.get("sync_after", 2.0))
+        self.compact_ratio = float(store_config.get("compact_ratio", 0.3))
+        self.compact_min_rows = int(store_config.get("compact_min_rows", 10000))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._compaction_requested = {}
+
+    def _member_version(self, db: Session, library_id: int) -> Optional[int]:
+        return db.scalar(select(FaceLibrary.member_version).where(FaceLibrary.id == library_id))
+
+    def _fingerprint(self, db: Session, library_id: int):
+        searchable, _ = active_model_vectors()
+        count, max_id, max_updated = db.query(
+            func.count(FaceMember.id), func.max(FaceMember.id), func.max(FaceMember.updated_at)
+        ).filter(FaceMember.library_id == library_id, searchable).one()
+        if not count:
+            return (0, None, 0.0)
+        return (count, max_id, _stamp(max_updated))
+
+    def _load(self, db: Session, library_id: int, member_version):
+        if self.store_enabled:
+            entry = MappedLibrary(LibraryStore(library_id))
+            if not entry.refresh(db) or entry.view.dtype != _memory_dtype() or entry.view.model != get_model_name():
+                self._build_store(db, entry.store)
+                entry.refresh(db)
+            if entry.fingerprint() != self._fingerprint(db, library_id):
+                self._sync_store(db, entry)
+                entry.refresh(db)
+            entry.member_version = member_version
+            return entry
+        searchable, vector = active_model_vectors()
+        rows = db.query(
+            FaceMember.id, FaceMember.name, vector, FaceMember.updated_at
+        ).filter(FaceMember.library_id == library_id, searchable).all()
+        ids = [r.id for r in rows]
+        names = [r.name for r in rows]
+        stamps = [_stamp(r.updated_at) for r in rows]
+        vectors = decode_embeddings([r.vector for r in rows])
+        entry = LibraryMatrix.from_rows(ids, names, vectors, stamps)
+        # 版本号在读取成员之前查询，期间提交的变更会使下次读取再加载一次，不会漏掉
+        entry.member_version = member_version
+        return entry
+
+    def exact_loader(self, db: Session, entry: LibraryMatrix):
+        """量化矩阵开启重排时，返回按矩阵行号从数据库读取原始特征向量的函数，否则返回 None。
+
+        已被删除的成员对应全零行。
+        """
+        if not entry.rerank_candidates:
+            return None
+
+        searchable, vector = active_model_vectors()
+
+        def load(rows: np.ndarray) -> np.ndarray:
+            ids = [entry.member_ids[row] for row in rows.tolist()]
+            blobs = dict(
+                db.query(FaceMember.id, vector).filter(FaceMember.id.in_(ids), searchable).all()
+            )
+            vectors = np.zeros((len(ids), entry.dim), dtype=np.float32)
+            present = [i for i, member_id in enumerate(ids) if member_id in blobs]
+            if present:
+                vectors[present] = decode_embeddings([blobs[ids[i]] for i in present])
+            return vectors
+
+        return load
+
+    def _build_store(self, db: Session, store: LibraryStore):
+        """从数据库生成人脸库的磁盘特征文件；其他进程已生成时直接返回。"""
+        dtype = _memory_dtype()
+        model_name = get_model_name()
+        searchable, vector = active_model_vectors()
+        with store.lock():
+            view = store.open()
+            if view is not None and view.dtype == dtype and view.model == model_name:
+                return
+            result = db.execute(
+                select(FaceMember.id, FaceMember.updated_at, vector)
+                .where(FaceMember.library_id == store.library_id, searchable)
+                .order_by(FaceMember.id)
+                .execution_options(yield_per=STORE_CHUNK_ROWS)
+            )
+
+            def chunks():
+                for rows in result.partitions():
+                    records = np.zeros(len(rows), dtype=RECORD)
+                    records["member_id"] = [r.id for r in rows]
+                    records["stamp"] = [_stamp(r.updated_at) for r in rows]
+                    data, records["scale"] = _quantize_rows(decode_embeddings([r.vector for r in rows]), dtype)
+                    yield records, data
+
+            view = store.write_generation(dtype, chunks(), model_name)
+            store.activate(view.generation)
+        logger.info(f"Library {store.library_id} embedding store built with {view.count} rows ({dtype})")
+
+    def _write_store(self, library_id: int, upserts: Iterable[Tuple[int, float, Optional[np.ndarray]]] = (), deletes: Iterable[int] = ()):
+        """把成员变更追加写入磁盘特征文件；文件尚未生成时跳过，首次加载时从数据库生成。
+
+        upserts 为 (member_id, 时间戳, 向量)，向量为 None 时复制该成员现有的行，只更新时间戳；
+        文件中已有更新时间戳更晚的行时跳过，与其他进程的补齐写入互不覆盖。
+        """
+        upserts, deletes = list(upserts), list(deletes)
+        store = LibraryStore(library_id)
+        if store.generation() is None:
+            return
+        with store.lock():
+            view = store.open()
+            # 其他模型生成的文件在下次加载时整体重新生成
+            if view is None or view.model != get_model_name():
+                return
+            deleted = view.tombstones()
+            ids = view.records["member_id"]
+            touched = [member_id for member_id, _, _ in upserts] + deletes
+            current = {}
+            for row in np.flatnonzero(np.isin(ids, touched) & ~deleted).tolist():
+                current.setdefault(int(ids[row]), []).append(row)
+
+            dead, records, vectors = [], [], []
+            for member_id, stamp, vector in upserts:
+                rows = current.get(member_id, [])
+                if rows and view.records["stamp"][rows].max() > stamp:
+                    continue
+                record = np.zeros((), dtype=RECORD)
+                if vector is None:
+                    if not rows:
+                        continue
+                    data = np.array(view.vectors[rows[-1]])
+                    record["scale"] = view.records["scale"][rows[-1]]
+                else:
+                    quantized, scales = _quantize_rows(np.asarray(vector, dtype=np.float32)[np.newaxis, :], view.dtype)
+                    data, record["scale"] = quantized[0], scales[0]
+                record["member_id"], record["stamp"] = member_id, stamp
+                records.append(record)
+                vectors.append(data)
+                dead.extend(rows)
+            for member_id in deletes:
+                dead.extend(current.get(member_id, []))
+
+            count = view.count + len(records)
+            if records:
+                store.append(view, np.stack(records), np.stack(vectors))
+            if dead:
+                store.tombstone(view, dead, count)
+            dead_total = int(deleted.sum()) + len(dead)
+
+        if dead_total >= self.compact_min_rows and dead_total >= self.compact_ratio * count:
+            self._request_compaction(library_id)
+
+    def _sync_store(self, db: Session, entry: MappedLibrary):
+        """按数据库补齐磁盘特征文件：写入缺失或更新过的成员，删除数据库中已不存在的成员。"""
+        library_id = entry.store.library_id
+        searchable, vector = active_model_vectors()
+        rows = db.query(FaceMember.id, FaceMember.updated_at).filter(FaceMember.library_id == library_id, searchable).all()
+        live = ~entry.deleted
+        stored = dict(zip(entry.view.records["member_id"][live].tolist(), entry.view.records["stamp"][live].tolist()))
+        stale = [r.id for r in rows if r.id not in stored or _stamp(r.updated_at) > stored[r.id]]
+        gone = stored.keys() - {r.id for r in rows}
+        for start in range(0, len(stale), STORE_CHUNK_ROWS):
+            batch = db.query(FaceMember.id, FaceMember.updated_at, vector).filter(
+                FaceMember.id.in_(stale[start:start + STORE_CHUNK_ROWS]), searchable
+            ).all()
+            vectors = decode_embeddings([r.vector for r in batch])
+            self._write_store(library_id, [(r.id, _stamp(r.updated_at), vector) for r, vector in zip(batch, vectors)])
+        if gone:
+            self._write_store(library_id, deletes=gone)
+        if stale or gone:
+            logger.info(f"Library {library_id} embedding store synced: {len(stale)} written, {len(gone)} removed")
+
+    def _refresh_mapped(self, db: Session, entry: MappedLibrary, member_version):
+        with entry.lock.write():
+            if not entry.refresh(db):
+                self._build_store(db, entry.store)
+                entry.refresh(db)
+            if entry.fingerprint() == self._fingerprint(db, entry.store.library_id):
+                entry.member_version = member_version
+                entry.mismatch_since = None
+                return
+            # 其他进程提交数据库后、写入文件前的短暂不一致不触发补齐，先使用已映射的行
+            now = time.monotonic()
+            if entry.mismatch_since is None:
+                entry.mismatch_since = now
+            elif now - entry.mismatch_since >= self.sync_after:
+                self._sync_store(db, entry)
+                entry.refresh(db)
+                entry.member_version = member_version
+                entry.mismatch_since = None
+
+    def _request_compaction(self, library_id: int):
+        now = time.monotonic()
+        if now - self._compaction_requested.get(library_id, -60.0) < 60:
+            return
+        self._compaction_requested[library_id] = now
+        for status in (PENDING, RUNNING):
+            if any(job["params"].get("library_id") == library_id for job in job_registry.list(status, "compact_store")):
+                return
+        job_registry.create("compact_store", {"library_id": library_id})
+
+    def compact(self, library_id: int) -> dict:
+        """把存活行写入新一代文件后切换，释放已删除行占用的空间。
+
+        复制在锁外进行，持锁后补上复制期间追加的行和新删除的行再切换，写入方只被短暂阻塞。
+        """
+        store = LibraryStore(library_id)
+        view = store.open()
+        if view is None:
+            return {"library_id": library_id, "rows": 0, "removed": 0}
+        deleted = view.tombstones()
+        live = np.flatnonzero(~deleted)
+
+        def chunks():
+            for start in range(0, live.shape[0], STORE_CHUNK_ROWS):
+                rows = live[start:start + STORE_CHUNK_ROWS]
+                yield view.records[rows], view.vectors[rows]
+
+        compacted = store.write_generation(view.dtype, chunks(), view.model)
+        with store.lock():
+            latest = store.open()
+            if latest is None or latest.generation != view.generation:
+                # 复制期间文件被重新生成或删除，放弃本次压缩
+                store.discard(compacted)
+                return {"library_id": library_id, "rows": latest.count if latest else 0, "removed": 0}
+            tail = np.arange(view.count, latest.count)
+            if tail.shape[0]:
+                store.append(compacted, latest.records[tail], latest.vectors[tail])
+            latest_deleted = latest.tombstones()
+            newly = np.flatnonzero(latest_deleted[:view.count] & ~deleted)
+            dead = np.searchsorted(live, newly).tolist() + (live.shape[0] + np.flatnonzero(latest_deleted[view.count:])).tolist()
+            if dead:
+                store.tombstone(compacted, dead, live.shape[0] + tail.shape[0])
+            store.activate(compacted.generation)
+        removed = view.count - live.shape[0]
+        logger.info(f"Library {library_id} embedding store compacted: {removed} deleted rows removed")
+        return {"library_id": library_id, "rows": live.shape[0] + int(tail.shape[0]), "removed": removed}
+
+    def _evict(self, keep: int):
+        total = sum(e.nbytes for e in self._entries.values())
+        for library_id in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if library_id == keep:
+                continue
+            total -= self._entries.pop(library_id).nbytes
+
+    def _get(self, db: Session, library_id: int):
+        with metrics.time("member_query"):
+            member_version = self._member_version(db, library_id)
+        with self._lock:
+            entry = self._entries.get(library_id)
+            if entry is not None and entry.matches(member_version):
+                self._entries.move_to_end(library_id)
+                metrics.inc("embedding_cache_requests_total", result="hit")
+                return entry
+            load_lock = self._load_locks.setdefault(library_id, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(library_id)
+                if entry is not None and entry.matches(member_version):
+                    self._entries.move_to_end(library_id)
+                    return entry
+            metrics.inc("embedding_cache_requests_total", result="refresh" if isinstance(entry, MappedLibrary) else "load")
+            with metrics.time("library_load"):
+                if isinstance(entry, MappedLibrary):
+                    self._refresh_mapped(db, entry, member_version)
+                else:
+                    entry = self._load(db, library_id, member_version)
+            with self._lock:
+                if entry.nbytes <= self.max_bytes:
+                    self._entries[library_id] = entry
+                    self._entries.move_to_end(library_id)
+                    self._evict(keep=library_id)
+                else:
+                    self._entries.pop(library_id, None)
+            return entry
+
+    @contextmanager
+    def read(self, db: Session, library_id: int):
+        entry = self._get(db, library_id)
+        with entry.lock.read():
+            yield entry
+
+    def _cached(self, library_id: int) -> Optional[LibraryMatrix]:
+        with self._lock:
+            return self._entries.get(library_id)
+
+    @contextmanager
+    def _apply(self, library_id: int, member_version: int):
+        """持写锁产出需要原地更新的矩阵，member_version 为本次变更提交后的成员版本号。
+
+        矩阵版本号不是 member_version - 1 时中间有本进程未见到的变更，丢弃缓存，产出 None。
+        """
+        entry = self._cached(library_id)
+        if entry is None:
+            yield None
+            return
+        with entry.lock.write():
+            if entry.member_version != member_version - 1:
+                with self._lock:
+                    if self._entries.get(library_id) is entry:
+                        del self._entries[library_id]
+                yield None
+                return
+            yield entry
+            entry.member_version = member_version
+
+    def add_member(self, member: FaceMember, vector: np.ndarray, member_version: int):
+        if self.store_enabled:
+            self._write_store(member.library_id, [(member.id, _stamp(member.updated_at), vector)])
+            return
+        with self._apply(member.library_id, member_version) as entry:
+            if entry is not None:
+                entry.add(member.id, member.name, vector, _stamp(member.updated_at))
+        with self._lock:
+            self._evict(keep=member.library_id)
+
+    def update_member(self, member: FaceMember, vector: Optional[np.ndarray], member_version: int):
+        if self.store_enabled:
+            self._write_store(member.library_id, [(member.id, _stamp(member.updated_at), vector)])
+            return
+        with self._apply(member.library_id, member_version) as entry:
+            if entry is not None:
+                entry.update(member.id, member.name, vector, _stamp(member.updated_at))
+
+    def remove_member(self, library_id: int, member_id: int, member_version: int):
+        if self.store_enabled:
+            self._write_store(library_id, deletes=[member_id])
+            return
+        with self._apply(library_id, member_version) as entry:
+            if entry is not None:
+                entry.remove(member_id)
+
+    def invalidate(self, library_id: int, discard_store: bool = False):
+        """丢弃本进程缓存；discard_store 为 True 时同时删除磁盘特征文件，下次加载时从数据库重新生成。"""
+        with self._lock:
+            self._entries.pop(library_id, None)
+            self._load_locks.pop(library_id, None)
+        if self.store_enabled and discard_store:
+            LibraryStore(library_id).drop()
+
+
+embedding_cache = EmbeddingCache(
+    max_bytes=int(get_cache_config().get("max_memory_mb", 1024)) * 1024 * 1024,
+    store_config=get_store_config(),
+)
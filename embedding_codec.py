@@ -0,0 +1,127 @@
+import base64
+import binascii
+import json
+import struct
+from typing import List, Sequence, Union
+
+import numpy as np
+
+from config_loader import get_quantization_config
+
+# 二进制特征向量格式: 8 字节头 (magic "FE", 版本, dtype 编码, 维度 uint32) + 原始小端字节。
+# 头长度是各 dtype 元素大小的整数倍，整批结果可以直接按 dtype 解析成一个矩阵。
+# int8 在头之后先写 4 字节 float32 缩放系数，向量值 = int8 值 * 缩放系数。
+MAGIC = b"FE"
+VERSION = 1
+HEADER = struct.Struct("<2sBBI")
+
+DTYPE_CODES = {
+    1: np.dtype("<f4"),
+    2: np.dtype("<f2"),
+    3: np.dtype("i1"),
+}
+INT8 = np.dtype("i1")
+SCALE = struct.Struct("<f")
+_CODE_BY_DTYPE = {dtype: code for code, dtype in DTYPE_CODES.items()}
+
+Blob = Union[bytes, bytearray, memoryview, str]
+
+MAX_EMBEDDING_DIM = 4096
+
+
+def quantize_int8(vectors: np.ndarray):
+    """按行对称量化为 int8，返回 (int8 矩阵, 每行缩放系数)。"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    quantized = np.rint(vectors / scales[:, np.newaxis]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def storage_dtype() -> np.dtype:
+    return np.dtype(get_quantization_config().get("storage_dtype", "float32"))
+
+
+def encode_embedding(vector: np.ndarray, dtype=None) -> bytes:
+    """编码单个特征向量；dtype 默认取 quantization.storage_dtype。"""
+    dtype = np.dtype(dtype or storage_dtype()).newbyteorder("<")
+    code = _CODE_BY_DTYPE.get(dtype)
+    if code is None:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+    vector = np.asarray(vector).ravel()
+    header = HEADER.pack(MAGIC, VERSION, code, vector.shape[0])
+    if dtype == INT8:
+        quantized, scales = quantize_int8(vector)
+        return header + SCALE.pack(scales[0]) + quantized.tobytes()
+    return header + vector.astype(dtype).tobytes()
+
+
+def _parse_header(blob: Blob):
+    magic, version, code, dim = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION or code not in DTYPE_CODES:
+        raise ValueError("Invalid embedding blob header")
+    return DTYPE_CODES[code], dim
+
+
+def decode_embedding(blob: Blob) -> np.ndarray:
+    """解码单个特征向量，兼容迁移前的 JSON 文本格式。"""
+    if isinstance(blob, str):
+        return np.asarray(json.loads(blob), dtype=np.float32)
+    dtype, dim = _parse_header(blob)
+    if dtype == INT8:
+        (scale,) = SCALE.unpack_from(blob, HEADER.size)
+        return np.frombuffer(blob, dtype=dtype, count=dim, offset=HEADER.size + SCALE.size) * np.float32(scale)
+    return np.frombuffer(blob, dtype=dtype, count=dim, offset=HEADER.size).astype(np.float32)
+
+
+def decode_embeddings(blobs: Sequence[Blob]) -> np.ndarray:
+    """把一批特征向量一次性解码为 (N, dim) 的 float32 矩阵。
+
+    所有行头部一致时只做一次拼接和一次 frombuffer，不逐行解析；
+    混有 JSON 文本或不同格式时退回逐行解码。
+    """
+    if len(blobs) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    if any(isinstance(b, str) for b in blobs):
+        return np.stack([decode_embedding(b) for b in blobs])
+
+    first = blobs[0]
+    dtype, dim = _parse_header(first)
+    prefix = HEADER.size + (SCALE.size if dtype == INT8 else 0)
+    row_bytes = prefix + dim * dtype.itemsize
+    buf = b"".join(blobs)
+    if len(buf) != row_bytes * len(blobs):
+        return np.stack([decode_embedding(b) for b in blobs])
+
+    raw = np.frombuffer(buf, dtype=np.uint8).reshape(len(blobs), row_bytes)
+    if not (raw[:, :HEADER.size] == raw[0, :HEADER.size]).all():
+        return np.stack([decode_embedding(b) for b in blobs])
+
+    if dtype == INT8:
+        scales = raw[:, HEADER.size:prefix].copy().view("<f4")
+        return raw[:, prefix:].view(np.int8) * scales
+
+    header_items = HEADER.size // dtype.itemsize
+    rows = np.frombuffer(buf, dtype=dtype).reshape(len(blobs), header_items + dim)
+    return rows[:, header_items:].astype(np.float32)
+
+
+def parse_embedding(value: Union[List[float], str]) -> np.ndarray:
+    """解析客户端直接提交的特征向量: JSON 浮点数组，或 base64 编码的小端 float32 原始字节。"""
+    if isinstance(value, str):
+        try:
+            raw = base64.b64decode(value, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError("Invalid base64 embedding")
+        if len(raw) % 4:
+            raise ValueError("Base64 embedding length must be a multiple of 4 bytes (float32)")
+        vector = np.frombuffer(raw, dtype="<f4").astype(np.float32)
+    else:
+        vector = np.asarray(value, dtype=np.float32).ravel()
+    if not 0 < vector.shape[0] <= MAX_EMBEDDING_DIM:
+        raise ValueError(f"Embedding dimension must be between 1 and {MAX_EMBEDDING_DIM}")
+    if not np.isfinite(vector).all():
+        raise ValueError("Embedding contains NaN or infinite values")
+    if not np.any(vector):
+        raise ValueError("Embedding must not be all zeros")
+    return vector
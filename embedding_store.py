@@ -0,0 +1,206 @@
+"""人脸库特征矩阵的共享磁盘文件。
+
+每个人脸库一个目录 {store.path}/{library_id}/，CURRENT 记录当前代号，每一代一个子目录 gen-<代号>:
+  vectors.bin     64 字节头 (magic "FS", 版本, dtype 编码, 维度) + 逐行追加的归一化向量
+  rows.bin        与向量行对齐的记录 (member_id, updated_at 时间戳, int8 缩放系数)
+  tombstones.bin  位图，第 i 位为 1 表示第 i 行已删除
+  model           生成向量的识别模型 (model.name)，与当前模型不一致时重新生成
+
+文件只追加：新增成员追加一行，更新先追加新行再把旧行标记删除，删除只写位图。
+各 uvicorn worker 以只读 np.memmap 映射同一组文件，共享操作系统页缓存。
+写入在 lock 文件上加 flock 互斥；行数以 rows.bin 长度为准，rows.bin 在向量写完之后才追加，
+读取方不会看到写了一半的行。压缩把存活行写入新一代目录后替换 CURRENT，
+已映射旧文件的进程在下次读取时发现代号变化并重新映射。
+"""
+import fcntl
+import os
+import shutil
+import struct
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from config_loader import BASE_DIR, get_store_config
+
+MAGIC = b"FS"
+VERSION = 1
+HEADER = struct.Struct("<2sBBI")
+HEADER_SIZE = 64
+
+DTYPE_CODES = {
+    1: np.dtype("<f4"),
+    2: np.dtype("<f2"),
+    3: np.dtype("i1"),
+}
+_CODE_BY_DTYPE = {dtype: code for code, dtype in DTYPE_CODES.items()}
+
+RECORD = np.dtype([("member_id", "<i8"), ("stamp", "<f8"), ("scale", "<f4"), ("reserved", "<u4")])
+
+
+def store_root() -> Path:
+    path = Path(get_store_config().get("path", "./embeddings"))
+    return path if path.is_absolute() else BASE_DIR / path
+
+
+class StoreView:
+    """某一代文件的只读映射，count 为映射时已提交的行数 (含已删除行)。"""
+
+    def __init__(self, directory: Path, generation: int):
+        self.directory = directory
+        self.generation = generation
+        with open(directory / "vectors.bin", "rb") as f:
+            magic, version, code, dim = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or code not in DTYPE_CODES:
+            raise ValueError(f"Invalid embedding store file: {directory}")
+        self.dtype = DTYPE_CODES[code]
+        self.dim = dim
+        try:
+            self.model = (directory / "model").read_text().strip() or None
+        except FileNotFoundError:
+            self.model = None
+        self.count = (directory / "rows.bin").stat().st_size // RECORD.itemsize
+        if self.count and self.dim:
+            self.records = np.memmap(directory / "rows.bin", dtype=RECORD, mode="r", shape=(self.count,))
+            self.vectors = np.memmap(
+                directory / "vectors.bin", dtype=self.dtype, mode="r", offset=HEADER_SIZE, shape=(self.count, dim)
+            )
+        else:
+            self.count = 0
+            self.records = np.empty(0, dtype=RECORD)
+            self.vectors = np.empty((0, dim), dtype=self.dtype)
+
+    def appended(self) -> bool:
+        """映射之后是否又有行提交 (rows.bin 变长)；这一代的文件已被删除时也返回 True。"""
+        try:
+            return (self.directory / "rows.bin").stat().st_size // RECORD.itemsize != self.count
+        except FileNotFoundError:
+            return True
+
+    def tombstones(self) -> np.ndarray:
+        """读取删除位图，返回长度为 count 的布尔数组。"""
+        deleted = np.zeros(self.count, dtype=bool)
+        path = self.directory / "tombstones.bin"
+        if self.count and path.exists():
+            raw = np.fromfile(path, dtype=np.uint8, count=(self.count + 7) // 8)
+            bits = np.unpackbits(raw, bitorder="little")[:self.count]
+            deleted[:bits.shape[0]] = bits.astype(bool)
+        return deleted
+
+
+class LibraryStore:
+    def __init__(self, library_id: int, root: Optional[Path] = None):
+        self.library_id = library_id
+        self.directory = (root or store_root()) / str(library_id)
+
+    def generation(self) -> Optional[int]:
+        try:
+            return int((self.directory / "CURRENT").read_text().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def open(self) -> Optional[StoreView]:
+        generation = self.generation()
+        if generation is None:
+            return None
+        try:
+            return StoreView(self.directory / f"gen-{generation}", generation)
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def lock(self):
+        """跨进程写锁，生成新一代、追加和写位图都需要持有。"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / "lock", "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def write_generation(self, dtype: np.dtype, chunks: Iterable[Tuple[np.ndarray, np.ndarray]], model: Optional[str] = None) -> StoreView:
+        """把 (records, vectors) 分块写入新一代目录并返回其视图，维度取自第一块向量，model 为生成向量的模型。
+
+        新一代在 activate() 之前对其他进程不可见；activate() 需持有 lock()。
+        """
+        dtype = np.dtype(dtype)
+        # 代号取微秒时间戳，drop() 删除所有文件后重新生成也不会与其他进程仍映射的旧代号重复
+        generation = max(max(self._generations(), default=0) + 1, time.time_ns() // 1000)
+        while True:
+            directory = self.directory / f"gen-{generation}"
+            try:
+                directory.mkdir(parents=True)
+                break
+            except FileExistsError:
+                generation += 1
+        dim = 0
+        with open(directory / "vectors.bin", "wb") as vectors, open(directory / "rows.bin", "wb") as rows:
+            vectors.write(bytes(HEADER_SIZE))
+            for records, data in chunks:
+                if not len(records):
+                    continue
+                dim = dim or data.shape[1]
+                vectors.write(np.ascontiguousarray(data, dtype=dtype).tobytes())
+                rows.write(np.ascontiguousarray(records, dtype=RECORD).tobytes())
+            vectors.seek(0)
+            vectors.write(HEADER.pack(MAGIC, VERSION, _CODE_BY_DTYPE[dtype], dim))
+        (directory / "tombstones.bin").touch()
+        (directory / "model").write_text(model or "")
+        return StoreView(directory, generation)
+
+    def activate(self, generation: int):
+        """切换 CURRENT 并删除其他代的目录；仍映射旧文件的进程不受影响，文件在解除映射后释放。"""
+        tmp = self.directory / "CURRENT.tmp"
+        tmp.write_text(str(generation))
+        os.replace(tmp, self.directory / "CURRENT")
+        for old in self._generations():
+            if old != generation:
+                shutil.rmtree(self.directory / f"gen-{old}", ignore_errors=True)
+
+    def discard(self, view: StoreView):
+        """删除未切换的新一代目录。"""
+        shutil.rmtree(view.directory, ignore_errors=True)
+
+    def _generations(self):
+        if not self.directory.exists():
+            return []
+        return [int(p.name[4:]) for p in self.directory.iterdir() if p.name.startswith("gen-") and p.name[4:].isdigit()]
+
+    def append(self, view: StoreView, records: np.ndarray, vectors: np.ndarray):
+        """在 view 已提交的行之后追加；调用方需持有 lock() 且 view 为持锁后打开的最新视图。"""
+        directory = view.directory
+        with open(directory / "vectors.bin", "r+b") as f:
+            if view.count == 0 and view.dim != vectors.shape[1]:
+                # 空文件的维度由第一行决定
+                f.write(HEADER.pack(MAGIC, VERSION, _CODE_BY_DTYPE[view.dtype], vectors.shape[1]))
+            f.seek(HEADER_SIZE + view.count * vectors.shape[1] * view.dtype.itemsize)
+            f.write(np.ascontiguousarray(vectors, dtype=view.dtype).tobytes())
+        with open(directory / "rows.bin", "r+b") as f:
+            # 从已提交行数处写入，覆盖异常退出时残留的半行
+            f.seek(view.count * RECORD.itemsize)
+            f.write(np.ascontiguousarray(records, dtype=RECORD).tobytes())
+            f.truncate()
+
+    def tombstone(self, view: StoreView, rows, count: int):
+        """把 view 中的 rows 标记为已删除，count 为当前总行数；调用方需持有 lock()。"""
+        path = view.directory / "tombstones.bin"
+        size = (count + 7) // 8
+        bitmap = np.zeros(size, dtype=np.uint8)
+        existing = np.fromfile(path, dtype=np.uint8, count=size)
+        bitmap[:existing.shape[0]] = existing
+        bits = np.unpackbits(bitmap, bitorder="little")
+        bits[rows] = 1
+        with open(path, "r+b") as f:
+            f.write(np.packbits(bits, bitorder="little").tobytes())
+
+    def drop(self):
+        """删除所有代的文件，下次加载时从数据库重新生成。"""
+        if not self.directory.exists():
+            return
+        with self.lock():
+            (self.directory / "CURRENT").unlink(missing_ok=True)
+            for generation in self._generations():
+                shutil.rmtree(self.directory / f"gen-{generation}", ignore_errors=True)
@@ -0,0 +1,104 @@
+"""人脸质量评估。
+
+在送入识别模型之前为检测到的人脸打分，不达标的人脸直接拒绝，不再提取特征:
+  det_score   检测分数
+  size        人脸框短边像素数
+  blur        对齐后人脸灰度图的拉普拉斯方差，越小越模糊
+  yaw / pitch 由 5 个关键点估计的水平 / 俯仰偏转角 (度)，0 为正脸
+  roll        两眼连线的倾斜角 (度)，对齐时会被校正，只作参考
+阈值按用途 (enroll 录入 / search 检索) 分别配置，见 config.yaml 的 quality 段，0 表示不检查该项。
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config_loader import get_quality_config
+
+PURPOSES = ("enroll", "search")
+FACE_SELECTIONS = ("error", "largest", "best")
+
+# 鼻尖相对两眼中点的水平偏移与半眼距之比约为 0.8 * tan(yaw)
+_YAW_SCALE = 0.8
+
+
+def estimate_pose(kps) -> Tuple[float, float, float]:
+    """由 5 点关键点 (左眼、右眼、鼻尖、左嘴角、右嘴角) 估计 (yaw, pitch, roll)，单位为度。"""
+    kps = np.asarray(kps, dtype=np.float64)
+    left_eye, right_eye, nose = kps[0], kps[1], kps[2]
+    eye_mid = (left_eye + right_eye) / 2
+    mouth_mid = (kps[3] + kps[4]) / 2
+    dx, dy = right_eye - left_eye
+    roll = math.atan2(dy, dx)
+    # 转到两眼连线水平的坐标系
+    cos, sin = math.cos(-roll), math.sin(-roll)
+    rotate = np.array([[cos, -sin], [sin, cos]])
+    nose_r, mouth_r = rotate @ (nose - eye_mid), rotate @ (mouth_mid - eye_mid)
+    half_eye = max(math.hypot(dx, dy) / 2, 1e-6)
+    yaw = math.atan((nose_r[0] - mouth_r[0] / 2) / half_eye / _YAW_SCALE)
+    # 正脸时鼻尖大致位于眼睛与嘴巴连线的中点
+    ratio = nose_r[1] / mouth_r[1] if abs(mouth_r[1]) > 1e-6 else 0.5
+    pitch = math.atan((ratio - 0.5) * 2 / _YAW_SCALE)
+    return math.degrees(yaw), math.degrees(pitch), math.degrees(roll)
+
+
+def blur_variance(crop: np.ndarray) -> float:
+    """只取对齐后人脸的中心区域 (五官)，避免背景和图片边缘补零的影响。"""
+    h, w = crop.shape[:2]
+    center = crop[h // 4:h - h // 4, w // 4:w - w // 4]
+    gray = cv2.cvtColor(center, cv2.COLOR_BGR2GRAY) if center.ndim == 3 else center
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def quality_score(bbox, kps, det_score: float) -> float:
+    """不需要像素的综合质量分：检测分数 × 人脸框短边 × 正脸程度，用于多人脸中选最佳人脸和视频流跟踪。"""
+    size = max(0.0, float(min(bbox[2] - bbox[0], bbox[3] - bbox[1])))
+    frontal = 1.0
+    if kps is not None:
+        yaw, pitch, _ = estimate_pose(kps)
+        frontal = max(0.0, math.cos(math.radians(yaw))) * max(0.0, math.cos(math.radians(pitch)))
+    return float(det_score) * size * frontal
+
+
+def assess(bbox, kps, det_score: float, crop: Optional[np.ndarray] = None) -> Dict:
+    quality = {
+        "det_score": round(float(det_score), 4),
+        "size": round(float(min(bbox[2] - bbox[0], bbox[3] - bbox[1])), 1),
+    }
+    if crop is not None:
+        quality["blur"] = round(blur_variance(crop), 1)
+    if kps is not None:
+        yaw, pitch, roll = estimate_pose(kps)
+        quality.update(yaw=round(yaw, 1), pitch=round(pitch, 1), roll=round(roll, 1))
+    quality["score"] = round(quality_score(bbox, kps, det_score), 2)
+    return quality
+
+
+def quality_issues(quality: Dict, thresholds: Dict) -> List[str]:
+    """返回不达标的项，如 ["blur 12.3 < 30"]；为空表示通过。"""
+    issues = []
+    for key, field in (("min_det_score", "det_score"), ("min_face_size", "size"), ("min_blur", "blur")):
+        limit = thresholds.get(key) or 0
+        if limit and field in quality and quality[field] < limit:
+            issues.append(f"{field} {quality[field]} < {limit}")
+    for key, field in (("max_yaw", "yaw"), ("max_pitch", "pitch")):
+        limit = thresholds.get(key) or 0
+        if limit and field in quality and abs(quality[field]) > limit:
+            issues.append(f"{field} {quality[field]} exceeds {limit}")
+    return issues
+
+
+def get_quality_thresholds() -> Dict[str, Dict]:
+    """{用途: 阈值}；quality.enabled 为 false 时为空，不做质量检查。"""
+    config = get_quality_config()
+    if not config.get("enabled", True):
+        return {}
+    return {purpose: config.get(purpose) or {} for purpose in PURPOSES}
+
+
+def get_face_selection() -> str:
+    selection = get_quality_config().get("face_selection", "error")
+    if selection not in FACE_SELECTIONS:
+        raise ValueError(f"quality.face_selection must be one of {', '.join(FACE_SELECTIONS)}")
+    return selection
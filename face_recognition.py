@@ -4,18 +4,23 @@ import numpy as np
 from insightface.app import FaceAnalysis
 from pathlib import Path
 
+from config_loader import get_model_config
+
 
 import onnxruntime
 
 
 class FaceRecognizer:
-    def __init__(self, model_name='buffalo_l', providers=None):
+    def __init__(self, model_name=None, providers=None):
+        model_config = get_model_config()
+        if model_name is None:
+            model_name = model_config.get("name", "buffalo_l")
         if providers is None:
             available = onnxruntime.get_available_providers()
             providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if 'CUDAExecutionProvider' in available else ['CPUExecutionProvider']
         self.app = FaceAnalysis(name=model_name, providers=providers)
         ctx_id = 0 if 'CUDAExecutionProvider' in providers else -1
-        self.app.prepare(ctx_id=ctx_id, det_size=(640, 640))
+        self.app.prepare(ctx_id=ctx_id, det_size=tuple(model_config.get("det_size", (640, 640))))
     
     def get_face_embedding(self, image_path):
         img = cv2.imread(str(image_path))
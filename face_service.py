@@ -1,9 +1,26 @@
+import threading
 import cv2
 import numpy as np
-from typing import List, Dict, Tuple
+from pathlib import Path
+from typing import List, Dict, Tuple, Union, Optional
 from insightface.app import FaceAnalysis
+from insightface.utils import face_align
 import onnxruntime
-from config_loader import get_threshold_config
+from config_loader import get_threshold_config, get_inference_config, get_model_config, get_model_name
+from batching import MicroBatcher
+from metrics import metrics
+from topk import top_k_cosine
+from face_quality import assess, quality_issues, quality_score, get_quality_thresholds, get_face_selection
+
+ImageInput = Union[str, Path, bytes, np.ndarray]
+
+RECOGNITION_BATCH_SIZE = 32
+
+# 接口只用到检测框、关键点和特征向量，默认不加载 landmark / genderage 等模型
+DEFAULT_ALLOWED_MODULES = ['detection', 'recognition']
+
+DEFAULT_DET_SIZE = (640, 640)
+DEFAULT_DET_SIZE_CANDIDATES = [320, 480]
 
 
 def get_providers():
@@ -18,113 +35,375 @@ def get_device_id():
     return 0 if 'CUDAExecutionProvider' in available else -1
 
 
+def create_session_options(intra_op_threads: int) -> onnxruntime.SessionOptions:
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    return options
+
+
 class FaceService:
-    def __init__(self, model_name='buffalo_l', providers=None, ctx_id=None):
+    def __init__(self, model_name=None, providers=None, ctx_id=None, intra_op_threads=None, allowed_modules=None):
+        model_config = get_model_config()
+        if model_name is None:
+            model_name = get_model_name()
         if providers is None:
             providers = get_providers()
         if ctx_id is None:
             ctx_id = get_device_id()
-        self.app = FaceAnalysis(name=model_name, providers=providers)
-        self.app.prepare(ctx_id=ctx_id, det_size=(640, 640))
+        if allowed_modules is None:
+            allowed_modules = model_config.get("allowed_modules", DEFAULT_ALLOWED_MODULES)
+        self.model_name = model_name
+        self.det_size = tuple(model_config.get("det_size", DEFAULT_DET_SIZE))
+        self.adaptive_det_size = bool(model_config.get("adaptive_det_size", False))
+        self.det_size_candidates = sorted(model_config.get("det_size_candidates", DEFAULT_DET_SIZE_CANDIDATES))
+        self.face_selection = get_face_selection()
+        self.quality_thresholds = get_quality_thresholds()
+        self.app = FaceAnalysis(name=model_name, providers=providers, allowed_modules=allowed_modules)
+        self.app.prepare(ctx_id=ctx_id, det_size=self.det_size)
+        if intra_op_threads:
+            self._set_intra_op_threads(intra_op_threads, providers)
+        
+        inference_config = get_inference_config()
+        self.batcher = None
+        if inference_config.get("micro_batching", True):
+            self.batcher = MicroBatcher(
+                self._recognize_batch,
+                max_batch_size=inference_config.get("max_batch_size", 32),
+                max_wait_ms=inference_config.get("max_wait_ms", 5),
+                name="recognition-batcher",
+            )
+    
+    def _set_intra_op_threads(self, intra_op_threads: int, providers):
+        """FaceAnalysis 不透传 SessionOptions，这里按指定线程数重建各模型的 ONNX 会话。"""
+        options = create_session_options(intra_op_threads)
+        for model in self.app.models.values():
+            model_file = getattr(model, 'model_file', None)
+            if model_file is None or not hasattr(model, 'session'):
+                continue
+            model.session = onnxruntime.InferenceSession(model_file, sess_options=options, providers=providers)
     
-    def detect_faces(self, image_path: str) -> List[Dict]:
-        img = cv2.imread(str(image_path))
+    @staticmethod
+    def _read_image(image: ImageInput) -> np.ndarray:
+        if isinstance(image, np.ndarray):
+            return image
+        with metrics.time("image_decode"):
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                img = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+            else:
+                img = cv2.imread(str(image))
         if img is None:
             raise ValueError("Failed to read image")
+        return img
+    
+    def select_det_size(self, img: np.ndarray, det_size: Optional[int] = None) -> Tuple[int, int]:
+        """选择检测模型输入尺寸。
+
+        det_size 为请求指定的边长；开启 adaptive_det_size 时，选用不小于图片长边的
+        最小候选尺寸，图片本身比检测输入还小时不再补零到完整的 det_size。
+        """
+        if det_size:
+            return (det_size, det_size)
+        if self.adaptive_det_size:
+            long_side = max(img.shape[:2])
+            for size in self.det_size_candidates:
+                if long_side <= size < max(self.det_size):
+                    return (size, size)
+        return self.det_size
+    
+    def _detect(self, img: np.ndarray, det_size: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """只运行检测模型，返回 (bboxes[N, 5], kpss[N, 5, 2] 或 None)。"""
+        input_size = self.select_det_size(img, det_size)
+        with metrics.time("detect"):
+            bboxes, kpss = self.app.det_model.detect(img, input_size=input_size, max_num=0, metric='default')
+        metrics.observe("faces_per_image", bboxes.shape[0])
+        return bboxes, kpss
+    
+    @property
+    def _recognition_model(self):
+        model = self.app.models.get('recognition')
+        if model is None:
+            raise RuntimeError("Recognition model is not loaded, check model.allowed_modules")
+        return model
+    
+    def detect_faces(self, image: ImageInput, det_size: Optional[int] = None) -> List[Dict]:
+        img = self._read_image(image)
+        bboxes, kpss = self._detect(img, det_size)
         
-        faces = self.app.get(img)
         results = []
-        
-        for face in faces:
+        for i in range(bboxes.shape[0]):
             results.append({
-                'bbox': face.bbox.tolist(),
-                'landmarks': face.kps.tolist() if hasattr(face, 'kps') else None,
-                'score': float(face.det_score) if hasattr(face, 'det_score') else 1.0,
+                'bbox': bboxes[i, 0:4].tolist(),
+                'landmarks': kpss[i].tolist() if kpss is not None else None,
+                'score': float(bboxes[i, 4]),
             })
         
         return results
     
-    def detect_faces_with_confidence(self, image_path: str) -> List[Dict]:
-        img = cv2.imread(str(image_path))
-        if img is None:
-            raise ValueError("Failed to read image")
+    def detect_faces_with_confidence(self, image: ImageInput, det_size: Optional[int] = None) -> List[Dict]:
+        img = self._read_image(image)
+        bboxes, kpss = self._detect(img, det_size)
         
-        faces = self.app.get(img)
         results = []
-        
-        for face in faces:
-            face_info = {
-                'bbox': face.bbox.tolist(),
-                'det_score': float(face.det_score) if hasattr(face, 'det_score') else 1.0,
-            }
-            
-            if hasattr(face, 'kps') and face.kps is not None:
-                face_info['landmarks'] = face.kps.tolist()
-            else:
-                face_info['landmarks'] = None
-            
-            results.append(face_info)
+        for i in range(bboxes.shape[0]):
+            results.append({
+                'bbox': bboxes[i, 0:4].tolist(),
+                'det_score': float(bboxes[i, 4]),
+                'landmarks': kpss[i].tolist() if kpss is not None else None,
+            })
         
         return results
     
-    def extract_embedding(self, image_path: str) -> Tuple[np.ndarray, Dict]:
-        img = cv2.imread(str(image_path))
-        if img is None:
-            raise ValueError("Failed to read image")
-        
-        faces = self.app.get(img)
-        if len(faces) == 0:
+    def _select_face(self, bboxes: np.ndarray, kpss: Optional[np.ndarray]) -> int:
+        """多张人脸时按 quality.face_selection 选择：error 报错，largest 取面积最大，best 取质量分最高。"""
+        if bboxes.shape[0] == 1:
+            return 0
+        if self.face_selection == "largest":
+            return int(np.argmax((bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])))
+        if self.face_selection == "best":
+            scores = [quality_score(bboxes[i, :4], kpss[i] if kpss is not None else None, bboxes[i, 4]) for i in range(bboxes.shape[0])]
+            return int(np.argmax(scores))
+        raise ValueError("Multiple faces detected in image")
+    
+    def _quality_issues(self, quality: Dict, purpose: Optional[str], source: Optional[str] = None) -> List[str]:
+        """purpose (enroll / search) 对应阈值下不达标的项；不达标的人脸不再送入识别模型。
+
+        拒绝计入 quality_rejected_total{purpose=source or purpose}，如视频流按 search 阈值检查、计为 stream。
+        """
+        thresholds = self.quality_thresholds.get(purpose) if purpose else None
+        issues = quality_issues(quality, thresholds) if thresholds else []
+        if issues:
+            metrics.inc("quality_rejected_total", purpose=source or purpose)
+        return issues
+    
+    def _detect_single_face(self, image: ImageInput, det_size: Optional[int] = None, purpose: Optional[str] = "search") -> Tuple[np.ndarray, Dict]:
+        """检测唯一人脸 (或按 face_selection 选出的一张) 并检查质量，返回对齐后的识别模型输入和人脸信息。"""
+        img = self._read_image(image)
+        bboxes, kpss = self._detect(img, det_size)
+        if bboxes.shape[0] == 0:
             raise ValueError("No face detected in image")
-        if len(faces) > 1:
-            raise ValueError("Multiple faces detected in image")
+        i = self._select_face(bboxes, kpss)
         
-        face = faces[0]
-        embedding = face.embedding
-        
-        return embedding, {
-            'bbox': face.bbox.tolist(),
-            'landmarks': face.kps.tolist() if hasattr(face, 'kps') else None,
-            'det_score': float(face.det_score) if hasattr(face, 'det_score') else 1.0,
+        kps = kpss[i] if kpss is not None else None
+        crop = face_align.norm_crop(img, landmark=kps, image_size=self._recognition_model.input_size[0])
+        quality = assess(bboxes[i, 0:4], kps, bboxes[i, 4], crop)
+        issues = self._quality_issues(quality, purpose)
+        if issues:
+            raise ValueError(f"Face quality too low: {', '.join(issues)}")
+        return crop, {
+            'bbox': bboxes[i, 0:4].tolist(),
+            'landmarks': kps.tolist() if kps is not None else None,
+            'det_score': float(bboxes[i, 4]),
+            'faces_detected': int(bboxes.shape[0]),
+            'quality': quality,
         }
     
-    def search_faces(self, query_embedding: np.ndarray, embeddings_matrix: np.ndarray, member_ids: List, names: List[str], top_k: int = 10, threshold: float = None) -> List[Dict]:
-        if threshold is None:
-            threshold = get_threshold_config().get("cosine_similarity", 0.5)
+    def _recognize_batch(self, crops: List[np.ndarray]) -> np.ndarray:
+        metrics.observe("inference_batch_size", len(crops))
+        with metrics.time("recognize"):
+            return self._recognition_model.get_feat(crops)
+    
+    def _recognize(self, crop: np.ndarray) -> np.ndarray:
+        if self.batcher is not None:
+            return self.batcher(crop).flatten()
+        return self._recognize_batch([crop])[0].flatten()
+    
+    def extract_embedding(self, image: ImageInput, det_size: Optional[int] = None, purpose: Optional[str] = "search") -> Tuple[np.ndarray, Dict]:
+        """purpose 选择质量阈值：enroll 录入成员，search 检索 / 比对，None 不检查质量。"""
+        crop, face_info = self._detect_single_face(image, det_size, purpose)
+        return self._recognize(crop), face_info
+    
+    def extract_embeddings_batch(self, images: List[ImageInput], det_size: Optional[int] = None, purpose: Optional[str] = "search") -> List[Dict]:
+        """批量提取特征向量。
+
+        每张图片单独做人脸检测，所有对齐后的人脸裁剪图合并为一个批次送入识别模型。
+        返回与输入顺序一致的列表，每项为 {'embedding', 'face_info'} 或 {'error'}。
+        """
+        results = [None] * len(images)
+        crops = []
+        owners = []
         
-        if embeddings_matrix.shape[0] == 0:
-            return []
+        for i, image in enumerate(images):
+            try:
+                crop, face_info = self._detect_single_face(image, det_size, purpose)
+            except Exception as e:
+                results[i] = {'error': str(e)}
+                continue
+            crops.append(crop)
+            owners.append(i)
+            results[i] = {'face_info': face_info}
         
-        query_norm = query_embedding / np.linalg.norm(query_embedding)
-        emb_norms = np.linalg.norm(embeddings_matrix, axis=1, keepdims=True)
-        emb_norms[emb_norms == 0] = 1
-        normalized_embs = embeddings_matrix / emb_norms
-        cosine_sims = np.dot(normalized_embs, query_norm)
+        for start in range(0, len(crops), RECOGNITION_BATCH_SIZE):
+            feats = self._recognize_batch(crops[start:start + RECOGNITION_BATCH_SIZE])
+            for i, feat in zip(owners[start:start + RECOGNITION_BATCH_SIZE], feats):
+                results[i]['embedding'] = feat.flatten()
         
-        mask = cosine_sims >= threshold
-        if not np.any(mask):
-            return []
+        return results
+    
+    def extract_all_embeddings(self, image: ImageInput, det_size: Optional[int] = None, max_faces: Optional[int] = None, purpose: Optional[str] = "search") -> List[Dict]:
+        """检测图片中的所有人脸（按检测分数取前 max_faces 个），一个批次提取特征。
+
+        返回 [{'embedding', 'face_info'}]，质量不达标的人脸为 {'face_info', 'error'}，没有人脸时返回空列表。
+        """
+        img = self._read_image(image)
+        bboxes, kpss = self._detect(img, det_size)
+        order = np.argsort(-bboxes[:, 4])[:max_faces] if bboxes.shape[0] else []
+        size = self._recognition_model.input_size[0]
         
-        valid_indices = np.where(mask)[0]
-        valid_sims = cosine_sims[valid_indices]
-        sorted_order = np.argsort(-valid_sims)[:top_k]
+        results = []
+        crops = []
+        accepted = []
+        for i in order:
+            kps = kpss[i] if kpss is not None else None
+            crop = face_align.norm_crop(img, landmark=kps, image_size=size)
+            quality = assess(bboxes[i, 0:4], kps, bboxes[i, 4], crop)
+            result = {'face_info': {
+                'bbox': bboxes[i, 0:4].tolist(),
+                'landmarks': kps.tolist() if kps is not None else None,
+                'det_score': float(bboxes[i, 4]),
+                'quality': quality,
+            }}
+            results.append(result)
+            issues = self._quality_issues(quality, purpose)
+            if issues:
+                result['error'] = f"Face quality too low: {', '.join(issues)}"
+                continue
+            crops.append(crop)
+            accepted.append(result)
         
+        for start in range(0, len(crops), RECOGNITION_BATCH_SIZE):
+            feats = self._recognize_batch(crops[start:start + RECOGNITION_BATCH_SIZE])
+            for result, feat in zip(accepted[start:start + RECOGNITION_BATCH_SIZE], feats):
+                result['embedding'] = feat.flatten()
+        
+        return results
+    
+    def extract_embeddings_at(self, image: ImageInput, faces: List[Dict], purpose: Optional[str] = "search", source: Optional[str] = None) -> List[Dict]:
+        """按已检测到的人脸 ({'bbox', 'landmarks', 'det_score'}，如视频流中跟踪的人脸) 对齐裁剪并提取特征，不再运行检测。
+
+        与 extract_all_embeddings 一样先按 purpose 的阈值检查质量，source 为拒绝计数的标签。
+        返回与 faces 对齐的 [{'embedding', 'quality'}]，质量不达标的人脸为 {'quality', 'error'}。
+        """
+        img = self._read_image(image)
+        size = self._recognition_model.input_size[0]
+        
+        results = []
+        crops = []
+        accepted = []
+        for face in faces:
+            kps = np.asarray(face['landmarks'], dtype=np.float32)
+            crop = face_align.norm_crop(img, landmark=kps, image_size=size)
+            quality = assess(face['bbox'], kps, face['det_score'], crop)
+            result = {'quality': quality}
+            results.append(result)
+            issues = self._quality_issues(quality, purpose, source)
+            if issues:
+                result['error'] = f"Face quality too low: {', '.join(issues)}"
+                continue
+            crops.append(crop)
+            accepted.append(result)
+        
+        for start in range(0, len(crops), RECOGNITION_BATCH_SIZE):
+            feats = self._recognize_batch(crops[start:start + RECOGNITION_BATCH_SIZE])
+            for result, feat in zip(accepted[start:start + RECOGNITION_BATCH_SIZE], feats):
+                result['embedding'] = feat.flatten()
+        return results
+    
+    def batching_stats(self) -> Dict:
+        if self.batcher is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.batcher.stats()}
+    
+    @staticmethod
+    def _format_hits(indices: np.ndarray, sims: np.ndarray, member_ids: List, names: List[str], threshold: float) -> List[Dict]:
         return [
             {
-                'member_id': member_ids[valid_indices[i]],
-                'name': names[valid_indices[i]],
-                'similarity': float(valid_sims[i]),
-                'similarity_percent': float((valid_sims[i] + 1) / 2 * 100),
+                'member_id': member_ids[j],
+                'name': names[j],
+                'similarity': float(sim),
+                'similarity_percent': float((sim + 1) / 2 * 100),
             }
-            for i in sorted_order
+            for j, sim in zip(indices.tolist(), sims.tolist()) if sim >= threshold
         ]
     
-    def compare_faces(self, img1_path: str, img2_path: str) -> Dict:
+    @staticmethod
+    def search_faces(query_embedding: np.ndarray, embeddings_matrix: np.ndarray, member_ids: List, names: List[str], top_k: int = 10, threshold: float = None, normalized: bool = False, index=None, scales: Optional[np.ndarray] = None, exact=None, rerank_candidates: int = 0, deleted: Optional[np.ndarray] = None) -> List[Dict]:
+        return FaceService.search_faces_batch(
+            np.asarray(query_embedding)[np.newaxis, :], embeddings_matrix, member_ids, names, top_k, threshold, normalized, index,
+            scales, exact, rerank_candidates, deleted
+        )[0]
+    
+    @staticmethod
+    def _rerank(queries: np.ndarray, indices: np.ndarray, approx: np.ndarray, exact, top_k: int):
+        """用原始向量重新计算候选的相似度并取 top_k；exact(rows) 返回对应行的原始向量，
+        全零行以及量化相似度为 -inf (已删除) 的行保持 -inf。"""
+        rows, positions = np.unique(indices, return_inverse=True)
+        vectors = exact(rows)
+        norms = np.linalg.norm(vectors, axis=1)
+        missing = norms == 0
+        norms[missing] = 1
+        query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        query_norms[query_norms == 0] = 1
+        sims = (queries / query_norms) @ (vectors / norms[:, np.newaxis]).T
+        sims[:, missing] = -np.inf
+        sims = np.take_along_axis(sims, positions.reshape(indices.shape), axis=1)
+        sims[np.isneginf(approx)] = -np.inf
+        order = np.argsort(-sims, axis=1, kind="stable")[:, :top_k]
+        return np.take_along_axis(indices, order, axis=1), np.take_along_axis(sims, order, axis=1)
+    
+    @staticmethod
+    def search_faces_batch(query_embeddings: np.ndarray, embeddings_matrix: np.ndarray, member_ids: List, names: List[str], top_k: int = 10, threshold: float = None, normalized: bool = False, index=None, scales: Optional[np.ndarray] = None, exact=None, rerank_candidates: int = 0, deleted: Optional[np.ndarray] = None) -> List[List[Dict]]:
+        """多个查询向量一次检索，返回与 query_embeddings 行对齐的结果列表。
+
+        相似度由分块矩阵乘法得到，每行用 argpartition 取 top_k（见 topk.top_k_cosine），
+        阈值只作用于前 top_k 个结果。使用 IVF 索引时在所有查询的候选行并集上计算。
+        量化矩阵传入 int8 的每行缩放系数 scales；exact 不为 None 时先在量化矩阵上取
+        max(top_k, rerank_candidates) 个候选，再用 exact 返回的原始向量精确重排。
+        deleted 为已删除行的掩码 (共享磁盘特征文件中只做标记、未压缩的行)，这些行不会出现在结果中。
+        """
+        if threshold is None:
+            threshold = get_threshold_config().get("cosine_similarity", 0.5)
+        
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if queries.shape[0] == 0:
+            return []
+        if embeddings_matrix.shape[0] == 0:
+            return [[] for _ in range(queries.shape[0])]
+        metrics.observe("library_search_size", embeddings_matrix.shape[0])
+        with metrics.time("search"):
+            candidates = None
+            if index is not None:
+                query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+                query_norms[query_norms == 0] = 1
+                per_query = [index.candidates(q) for q in queries / query_norms]
+                if all(c is not None for c in per_query):
+                    candidates = per_query[0] if len(per_query) == 1 else np.unique(np.concatenate(per_query))
+            if candidates is not None:
+                embeddings_matrix = embeddings_matrix[candidates]
+                if scales is not None:
+                    scales = scales[candidates]
+                if deleted is not None:
+                    deleted = deleted[candidates]
+            
+            k = max(top_k, rerank_candidates) if exact is not None else top_k
+            indices, sims = top_k_cosine(queries, embeddings_matrix, k, normalized=normalized, scales=scales, deleted=deleted)
+            if candidates is not None:
+                indices = candidates[indices]
+            if exact is not None and indices.shape[1]:
+                indices, sims = FaceService._rerank(queries, indices, sims, exact, top_k)
+            return [FaceService._format_hits(row_ids, row_sims, member_ids, names, threshold) for row_ids, row_sims in zip(indices, sims)]
+    
+    def compare_faces(self, image1: ImageInput, image2: ImageInput) -> Dict:
+        emb1, _ = self.extract_embedding(image1)
+        emb2, _ = self.extract_embedding(image2)
+        return FaceService.compare_embeddings(emb1, emb2)
+    
+    @staticmethod
+    def compare_embeddings(emb1: np.ndarray, emb2: np.ndarray) -> Dict:
         threshold_config = get_threshold_config()
         default_threshold = threshold_config.get("cosine_similarity", 0.5)
         
-        emb1, _ = self.extract_embedding(img1_path)
-        emb2, _ = self.extract_embedding(img2_path)
-        
         cosine_sim = np.dot(emb1, emb2) / (np.linalg.norm(emb1) * np.linalg.norm(emb2))
         euclidean_dist = np.linalg.norm(emb1 - emb2)
         
@@ -132,24 +411,36 @@ class FaceService:
             'cosine_similarity': float(cosine_sim),
             'similarity_percent': float((cosine_sim + 1) / 2 * 100),
             'euclidean_distance': float(euclidean_dist),
-            'is_same': cosine_sim > default_threshold,
+            'is_same': bool(cosine_sim > default_threshold),
             'threshold': default_threshold
         }
 
 
+def _create_face_service():
+    pool_config = get_inference_config().get("pool", {})
+    if pool_config.get("enabled", False):
+        from inference_server import InferencePoolClient
+        return InferencePoolClient(pool_config)
+    return FaceService()
+
+
 class _LazyFaceService:
+    """首次使用时创建 FaceService；多个推理线程同时首次访问时只加载一份模型。"""
     _instance = None
     _init_failed = None
+    _lock = threading.Lock()
 
     def __getattr__(self, name):
-        if self._init_failed:
-            raise RuntimeError(f"FaceService initialization failed: {self._init_failed}")
         if self._instance is None:
-            try:
-                self._instance = FaceService()
-            except Exception as e:
-                self._init_failed = e
-                raise RuntimeError(f"FaceService initialization failed: {e}")
+            with self._lock:
+                if self._init_failed:
+                    raise RuntimeError(f"FaceService initialization failed: {self._init_failed}")
+                if self._instance is None:
+                    try:
+                        self._instance = _create_face_service()
+                    except Exception as e:
+                        self._init_failed = e
+                        raise RuntimeError(f"FaceService initialization failed: {e}")
         return getattr(self._instance, name)
 
 
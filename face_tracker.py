@@ -0,0 +1,208 @@
+"""视频流 / 连续帧的人脸跟踪。
+
+FaceTracker 按人脸框 IoU 把每帧的检测结果贪心关联到已有轨迹。只有新轨迹和人脸质量比上次识别
+明显提高的轨迹需要提取特征并检索人脸库，其余人脸沿用轨迹的识别结果。轨迹连续 max_missed_frames
+帧未匹配后进入丢失状态，丢失期间出现的新轨迹识别后与其特征比较，相似度足够高时恢复原轨迹
+(短暂遮挡、漏检不会变成新的人)；丢失超过 reid_frames 帧的轨迹结束。
+
+轨迹出现满 min_hits 帧后身份视为稳定，输出 identity 事件，之后识别结果变化时再次输出；
+轨迹结束时输出 track_ended 事件。跟踪器本身不做推理，也不是线程安全的，每个视频流一个实例。
+"""
+import itertools
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config_loader import get_stream_config
+from face_quality import quality_score
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """(N, 4) 与 (M, 4) 人脸框两两之间的 IoU。"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+# Track.emitted 的初始值，表示还没有输出过 identity 事件
+_UNSET = object()
+
+
+def _identity_key(identity: Optional[Dict]):
+    if identity is None:
+        return None
+    return identity.get("library_id"), identity["member_id"]
+
+
+class Track:
+    def __init__(self, track_id: int, face: Dict, frame: int):
+        self.track_id = track_id
+        self.first_frame = frame
+        self.hits = 0
+        self.embedding = None
+        self.identity = None
+        self.recognized_quality = 0.0
+        self.emitted = _UNSET
+        self.observe(face, frame)
+
+    def observe(self, face: Dict, frame: int):
+        self.bbox = face["bbox"]
+        self.landmarks = face.get("landmarks")
+        self.det_score = face["det_score"]
+        self.quality = quality_score(self.bbox, self.landmarks, self.det_score)
+        self.last_frame = frame
+        self.hits += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "track_id": self.track_id,
+            "bbox": self.bbox,
+            "det_score": self.det_score,
+            "frames": self.hits,
+            "identity": self.identity,
+        }
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold: float = 0.3, max_missed_frames: int = 10, min_hits: int = 2,
+                 quality_gain: float = 0.2, reid_similarity: float = 0.5, reid_frames: int = 50):
+        self.iou_threshold = iou_threshold
+        self.max_missed_frames = max_missed_frames
+        self.min_hits = max(1, min_hits)
+        self.quality_gain = quality_gain
+        self.reid_similarity = reid_similarity
+        self.reid_frames = reid_frames
+        self.frame = -1
+        self.tracks: List[Track] = []
+        self.lost: List[Track] = []
+        self._ids = itertools.count(1)
+        self._events: List[Dict] = []
+
+    @classmethod
+    def from_config(cls, config: Optional[dict] = None) -> "FaceTracker":
+        config = get_stream_config() if config is None else config
+        return cls(
+            iou_threshold=config.get("iou_threshold", 0.3),
+            max_missed_frames=config.get("max_missed_frames", 10),
+            min_hits=config.get("min_hits", 2),
+            quality_gain=config.get("quality_gain", 0.2),
+            reid_similarity=config.get("reid_similarity", 0.5),
+            reid_frames=config.get("reid_frames", 50),
+        )
+
+    def update(self, faces: List[Dict]) -> List[Track]:
+        """关联一帧的检测结果 ({'bbox', 'landmarks', 'det_score'})，返回本帧需要识别的轨迹。"""
+        self.frame += 1
+        matched = {}
+        if self.tracks and faces:
+            ious = iou_matrix(
+                np.array([t.bbox for t in self.tracks], dtype=np.float32),
+                np.array([f["bbox"] for f in faces], dtype=np.float32),
+            )
+            # 按 IoU 从高到低贪心匹配，每个轨迹、每个人脸最多匹配一次
+            for flat in np.argsort(-ious, axis=None):
+                t, f = divmod(int(flat), len(faces))
+                if ious[t, f] < self.iou_threshold:
+                    break
+                if t in matched or f in matched.values():
+                    continue
+                matched[t] = f
+
+        pending = []
+        for t, f in matched.items():
+            track = self.tracks[t]
+            track.observe(faces[f], self.frame)
+            if track.quality > track.recognized_quality * (1 + self.quality_gain):
+                pending.append(track)
+
+        taken = set(matched.values())
+        for f, face in enumerate(faces):
+            if f not in taken:
+                track = Track(next(self._ids), face, self.frame)
+                self.tracks.append(track)
+                pending.append(track)
+
+        self._expire()
+        return pending
+
+    def recognized(self, track: Track, embedding: np.ndarray, hits: List[Dict]):
+        """记录轨迹的识别结果：hits 为检索结果 (按相似度降序)，取第一个作为身份。"""
+        embedding = embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+        if track.embedding is None and track.hits == 1:
+            track = self._reidentify(track, embedding)
+        track.embedding = embedding
+        track.identity = hits[0] if hits else None
+        track.recognized_quality = track.quality
+
+    def _reidentify(self, track: Track, embedding: np.ndarray) -> Track:
+        """新轨迹与丢失中的轨迹比较特征，足够相似时由原轨迹接管本帧的人脸。"""
+        candidates = [t for t in self.lost if t.embedding is not None]
+        if not candidates or self.reid_similarity <= 0:
+            return track
+        sims = np.stack([t.embedding for t in candidates]) @ embedding
+        best = int(np.argmax(sims))
+        if sims[best] < self.reid_similarity:
+            return track
+        revived = candidates[best]
+        self.lost.remove(revived)
+        revived.observe({"bbox": track.bbox, "landmarks": track.landmarks, "det_score": track.det_score}, self.frame)
+        self.tracks[self.tracks.index(track)] = revived
+        return revived
+
+    def _expire(self):
+        active = []
+        for track in self.tracks:
+            if self.frame - track.last_frame > self.max_missed_frames:
+                self.lost.append(track)
+            else:
+                active.append(track)
+        self.tracks = active
+        ended = [t for t in self.lost if self.frame - t.last_frame > self.max_missed_frames + self.reid_frames]
+        for track in ended:
+            self.lost.remove(track)
+            self._end(track)
+
+    def _end(self, track: Track):
+        if track.hits >= self.min_hits:
+            self._events.append({
+                "type": "track_ended",
+                "track_id": track.track_id,
+                "identity": track.identity,
+                "first_frame": track.first_frame,
+                "last_frame": track.last_frame,
+                "frames": track.hits,
+            })
+
+    def visible(self) -> List[Track]:
+        """本帧检测到的轨迹。"""
+        return [t for t in self.tracks if t.last_frame == self.frame]
+
+    def events(self) -> List[Dict]:
+        """取出自上次调用以来的事件：身份变为稳定或发生变化、轨迹结束。"""
+        for track in self.visible():
+            if track.hits < self.min_hits or track.embedding is None:
+                continue
+            if track.emitted is _UNSET or _identity_key(track.emitted) != _identity_key(track.identity):
+                track.emitted = track.identity
+                self._events.append({
+                    "type": "identity",
+                    "track_id": track.track_id,
+                    "frame": self.frame,
+                    "identity": track.identity,
+                })
+        events, self._events = self._events, []
+        return events
+
+    def finish(self) -> List[Dict]:
+        """视频流结束：结束所有轨迹，返回剩余事件。"""
+        events = self.events()
+        for track in self.tracks + self.lost:
+            self._end(track)
+        self.tracks, self.lost = [], []
+        return events + self.events()
@@ -0,0 +1,89 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from config_loader import get_inference_config
+from metrics import metrics
+
+
+class InferenceQueueFull(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail="Inference queue is full, please retry later",
+            headers={"Retry-After": str(retry_after)},
+        )
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """推理专用线程池，带准入控制。
+
+    同时在执行和排队的任务数达到 max_workers + max_queue 后，新请求直接抛出
+    InferenceQueueFull (503 + Retry-After)，而不是无限排队拉长延迟。
+    任务真正执行完毕后才释放名额，客户端断开不会让名额提前归还。
+    """
+
+    def __init__(self, max_workers: int = 32, max_queue: int = 64, retry_after: int = 1):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.retry_after = int(retry_after)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._pending >= self.capacity:
+                self._rejected += 1
+                raise InferenceQueueFull(self.retry_after)
+            self._pending += 1
+        task = functools.partial(fn, *args, **kwargs)
+        if metrics.enabled:
+            task = functools.partial(self._timed, task, time.perf_counter())
+        try:
+            future = self._executor.submit(task)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    @staticmethod
+    def _timed(task, submitted: float):
+        metrics.observe("stage_seconds", time.perf_counter() - submitted, stage="queue_wait")
+        return task()
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "queued": max(0, self._pending - self.max_workers),
+                "rejected": self._rejected,
+            }
+
+
+_inference_config = get_inference_config()
+inference_executor = InferenceExecutor(
+    max_workers=_inference_config.get("executor_workers", 32),
+    max_queue=_inference_config.get("max_queue", 64),
+    retry_after=_inference_config.get("retry_after", 1),
+)
@@ -0,0 +1,450 @@
+"""独立推理进程池。
+
+启用 inference.pool 后，模型只在 N 个推理进程中各加载一份，每个进程绑定到
+固定的 CPU 核并按核数设置 ONNX intra-op 线程数；HTTP worker 不再加载模型，
+而是通过 InferencePoolClient 把请求转发给推理进程。
+
+HTTP worker 在本进程内解码图片，把像素写入每个连接独占的共享内存缓冲区，
+经 unix socket 只发送缓冲区名称、偏移和形状，解码后的图片不经过 pickle。
+套接字目录必须属于当前用户且权限为 0700；进程池启动时生成随机 authkey 写入该目录，
+两端连接时用它互相认证，其他本地用户无法冒充推理进程或向其发送消息。
+
+单独启动: python inference_server.py
+"""
+import atexit
+import logging
+import os
+import queue
+import secrets
+import signal
+import stat
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError, get_context, resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from config_loader import get_inference_config
+from face_service import FaceService, ImageInput
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_ALIGNMENT = 64
+MIN_SEGMENT_BYTES = 4 * 1024 * 1024
+MONITOR_INTERVAL = 1.0
+AUTHKEY_FILE = "authkey"
+
+METHODS = (
+    "detect_faces",
+    "detect_faces_with_confidence",
+    "extract_embedding",
+    "extract_embeddings_batch",
+    "extract_all_embeddings",
+    "extract_embeddings_at",
+    "compare_faces",
+)
+
+_ERRORS = {
+    "ValueError": ValueError,
+}
+
+
+def _available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pool_settings(config: Optional[dict] = None) -> dict:
+    if config is None:
+        config = get_inference_config().get("pool", {})
+    threads = max(1, int(config.get("threads_per_worker", 2)))
+    workers = int(config.get("workers", 0)) or max(1, len(_available_cores()) // threads)
+    return {
+        "workers": workers,
+        "threads_per_worker": threads,
+        "connections": max(1, int(config.get("connections", 2))),
+        "socket_dir": config.get("socket_dir") or default_socket_dir(),
+        "connect_timeout": float(config.get("connect_timeout", 120)),
+    }
+
+
+def default_socket_dir() -> str:
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "face-inference")
+    return os.path.join(tempfile.gettempdir(), f"face-inference-{os.getuid()}")
+
+
+def check_socket_dir(socket_dir: str, create: bool = False):
+    """套接字目录必须是当前用户所有、权限为 0700 的目录，否则拒绝使用。"""
+    if create:
+        os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    info = os.lstat(socket_dir)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) != 0o700:
+        raise RuntimeError(
+            f"Inference socket directory {socket_dir} must be a directory owned by uid {os.getuid()} with mode 0700"
+        )
+
+
+def write_authkey(socket_dir: str) -> bytes:
+    authkey = secrets.token_bytes(32)
+    tmp = os.path.join(socket_dir, f"{AUTHKEY_FILE}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    os.replace(tmp, os.path.join(socket_dir, AUTHKEY_FILE))
+    return authkey
+
+
+def read_authkey(socket_dir: str) -> bytes:
+    check_socket_dir(socket_dir)
+    with open(os.path.join(socket_dir, AUTHKEY_FILE), "rb") as f:
+        return f.read()
+
+
+def worker_address(socket_dir: str, index: int) -> str:
+    return os.path.join(socket_dir, f"worker-{index}.sock")
+
+
+def assign_cores(workers: int, threads: int) -> List[List[int]]:
+    """把可用核按顺序切分给各推理进程，核数不足时循环复用。"""
+    available = _available_cores()
+    return [
+        sorted({available[(i * threads + j) % len(available)] for j in range(threads)})
+        for i in range(workers)
+    ]
+
+
+_attach_lock = threading.Lock()
+
+
+def _attach_segment(name: str) -> shared_memory.SharedMemory:
+    # 缓冲区由 HTTP worker 创建和回收，推理进程只映射，不能登记到 resource tracker:
+    # 两者可能共用同一个 tracker，登记/注销会打乱 HTTP worker 的记录；
+    # 不共用时，推理进程退出会把仍在使用的缓冲区删除。Python 3.13 以下没有 track 参数。
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def _dispatch(service: FaceService, method: str, images: List[np.ndarray], kwargs: dict):
+    if method not in METHODS:
+        raise ValueError(f"Unsupported inference method: {method}")
+    if method == "extract_embeddings_batch":
+        return service.extract_embeddings_batch(images, **kwargs)
+    return getattr(service, method)(*images, **kwargs)
+
+
+def _serve_connection(service: FaceService, conn):
+    segment = None
+    try:
+        while True:
+            try:
+                method, name, specs, kwargs = conn.recv()
+            except (EOFError, OSError):
+                break
+            if name is not None and (segment is None or segment.name != name):
+                if segment is not None:
+                    segment.close()
+                segment = _attach_segment(name)
+            images = [
+                np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf, offset=offset)
+                for offset, shape, dtype in specs
+            ]
+            try:
+                reply = ("ok", _dispatch(service, method, images, kwargs))
+            except Exception as e:
+                reply = ("error", type(e).__name__, str(e))
+            del images
+            conn.send(reply)
+    finally:
+        if segment is not None:
+            segment.close()
+        conn.close()
+
+
+def _worker_main(index: int, cores: List[int], threads: int, address: str, authkey: bytes):
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    cv2.setNumThreads(threads)
+
+    service = FaceService(intra_op_threads=threads)
+
+    if os.path.exists(address):
+        os.unlink(address)
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    logger.info(f"Inference worker {index} ready on {address}, cores={cores}, threads={threads}")
+    while True:
+        try:
+            conn = listener.accept()
+        except (AuthenticationError, EOFError, OSError) as e:
+            logger.warning(f"Inference worker {index} rejected a connection: {e}")
+            continue
+        threading.Thread(target=_serve_connection, args=(service, conn), name=f"inference-conn-{index}", daemon=True).start()
+
+
+class InferencePool:
+    """推理进程的启动、就绪等待和异常退出后的重启。"""
+
+    def __init__(self, config: Optional[dict] = None):
+        self.settings = pool_settings(config)
+        self.cores = assign_cores(self.settings["workers"], self.settings["threads_per_worker"])
+        self._context = get_context("spawn")
+        self._processes = []
+        self._stopping = threading.Event()
+        self._monitor = None
+        self._authkey = None
+
+    def _address(self, index: int) -> str:
+        return worker_address(self.settings["socket_dir"], index)
+
+    def _spawn(self, index: int):
+        address = self._address(index)
+        if os.path.exists(address):
+            os.unlink(address)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self.cores[index], self.settings["threads_per_worker"], address, self._authkey),
+            name=f"inference-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def start(self, wait: bool = True):
+        check_socket_dir(self.settings["socket_dir"], create=True)
+        self._authkey = write_authkey(self.settings["socket_dir"])
+        self._processes = [self._spawn(i) for i in range(self.settings["workers"])]
+        atexit.register(self.stop)
+        if wait:
+            self.wait_ready()
+        self._monitor = threading.Thread(target=self._watch, name="inference-pool-monitor", daemon=True)
+        self._monitor.start()
+
+    def wait_ready(self):
+        deadline = time.monotonic() + self.settings["connect_timeout"]
+        pending = set(range(len(self._processes)))
+        while pending:
+            for i in list(pending):
+                if not self._processes[i].is_alive():
+                    raise RuntimeError(f"Inference worker {i} exited with code {self._processes[i].exitcode}")
+                if os.path.exists(self._address(i)):
+                    pending.discard(i)
+            if pending and time.monotonic() > deadline:
+                raise RuntimeError(f"Inference workers not ready: {sorted(pending)}")
+            time.sleep(0.2)
+
+    def _watch(self):
+        while not self._stopping.wait(MONITOR_INTERVAL):
+            for i, process in enumerate(self._processes):
+                if not process.is_alive() and not self._stopping.is_set():
+                    logger.warning(f"Inference worker {i} exited with code {process.exitcode}, restarting")
+                    self._processes[i] = self._spawn(i)
+
+    def stop(self):
+        self._stopping.set()
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            process.join(timeout=5)
+
+    def join(self):
+        while not self._stopping.wait(MONITOR_INTERVAL):
+            pass
+
+
+def _connect(address: str, timeout: float):
+    """每次连接时重新读取 authkey，推理进程池重启后换了新的 authkey 也能重连。"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return Client(address, family="AF_UNIX", authkey=read_authkey(os.path.dirname(address)))
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Inference worker not available: {address}")
+            time.sleep(0.5)
+
+
+class _Channel:
+    """到单个推理进程的一条连接，以及它独占的共享内存缓冲区。"""
+
+    def __init__(self, address: str, timeout: float):
+        self.address = address
+        self.timeout = timeout
+        self.conn = _connect(address, timeout)
+        self.segment = None
+
+    def _reserve(self, nbytes: int) -> shared_memory.SharedMemory:
+        if self.segment is not None and self.segment.size >= nbytes:
+            return self.segment
+        size = max(nbytes, MIN_SEGMENT_BYTES, self.segment.size * 2 if self.segment is not None else 0)
+        self._release_segment()
+        self.segment = shared_memory.SharedMemory(create=True, size=size)
+        return self.segment
+
+    def _release_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment.unlink()
+            self.segment = None
+
+    def call(self, method: str, images: List[np.ndarray], kwargs: dict):
+        name = None
+        specs = []
+        if images:
+            offset = 0
+            for image in images:
+                specs.append((offset, image.shape, image.dtype.str))
+                offset += -(-image.nbytes // SEGMENT_ALIGNMENT) * SEGMENT_ALIGNMENT
+            segment = self._reserve(offset)
+            for (start, shape, dtype), image in zip(specs, images):
+                np.ndarray(shape, dtype=image.dtype, buffer=segment.buf, offset=start)[...] = image
+            name = segment.name
+        self.conn.send((method, name, specs, kwargs))
+        return self.conn.recv()
+
+    def reconnect(self):
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        self.conn = _connect(self.address, self.timeout)
+
+    def close(self):
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        self._release_segment()
+
+
+class InferencePoolClient:
+    """在 HTTP worker 中替代 FaceService，接口与 FaceService 一致。"""
+
+    search_faces = staticmethod(FaceService.search_faces)
+    search_faces_batch = staticmethod(FaceService.search_faces_batch)
+
+    def __init__(self, config: Optional[dict] = None):
+        self.settings = pool_settings(config)
+        self._idle = queue.Queue()
+        self._channels = []
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        # 按连接轮流排列各推理进程，空闲队列先进先出，请求自然均匀分布
+        for _ in range(self.settings["connections"]):
+            for i in range(self.settings["workers"]):
+                channel = _Channel(worker_address(self.settings["socket_dir"], i), self.settings["connect_timeout"])
+                self._channels.append(channel)
+                self._idle.put(channel)
+        atexit.register(self.close)
+
+    @staticmethod
+    def _decode(image: ImageInput) -> np.ndarray:
+        return np.ascontiguousarray(FaceService._read_image(image))
+
+    def _call(self, method: str, images: List[np.ndarray], **kwargs):
+        channel = self._idle.get()
+        try:
+            try:
+                reply = channel.call(method, images, kwargs)
+            except (EOFError, OSError):
+                # 推理进程重启后连接失效，重连后重试一次
+                channel.reconnect()
+                reply = channel.call(method, images, kwargs)
+        finally:
+            self._idle.put(channel)
+
+        with self._lock:
+            self._requests += 1
+            if reply[0] != "ok":
+                self._errors += 1
+        if reply[0] == "ok":
+            return reply[1]
+        _, error_type, message = reply
+        raise _ERRORS.get(error_type, RuntimeError)(message)
+
+    def detect_faces(self, image: ImageInput, det_size: Optional[int] = None) -> List[Dict]:
+        return self._call("detect_faces", [self._decode(image)], det_size=det_size)
+
+    def detect_faces_with_confidence(self, image: ImageInput, det_size: Optional[int] = None) -> List[Dict]:
+        return self._call("detect_faces_with_confidence", [self._decode(image)], det_size=det_size)
+
+    def extract_embedding(self, image: ImageInput, det_size: Optional[int] = None, purpose: Optional[str] = "search"):
+        return self._call("extract_embedding", [self._decode(image)], det_size=det_size, purpose=purpose)
+
+    def extract_all_embeddings(self, image: ImageInput, det_size: Optional[int] = None, max_faces: Optional[int] = None, purpose: Optional[str] = "search") -> List[Dict]:
+        return self._call("extract_all_embeddings", [self._decode(image)], det_size=det_size, max_faces=max_faces, purpose=purpose)
+
+    def extract_embeddings_at(self, image: ImageInput, faces: List[Dict], purpose: Optional[str] = "search", source: Optional[str] = None) -> List[Dict]:
+        faces = [{"bbox": list(face["bbox"]), "landmarks": np.asarray(face["landmarks"]).tolist(), "det_score": float(face["det_score"])} for face in faces]
+        return self._call("extract_embeddings_at", [self._decode(image)], faces=faces, purpose=purpose, source=source)
+
+    def compare_faces(self, image1: ImageInput, image2: ImageInput) -> Dict:
+        return self._call("compare_faces", [self._decode(image1), self._decode(image2)])
+
+    def extract_embeddings_batch(self, images: List[ImageInput], det_size: Optional[int] = None, purpose: Optional[str] = "search") -> List[Dict]:
+        results = [None] * len(images)
+        decoded = []
+        owners = []
+        for i, image in enumerate(images):
+            try:
+                decoded.append(self._decode(image))
+            except Exception as e:
+                results[i] = {'error': str(e)}
+                continue
+            owners.append(i)
+        if decoded:
+            for i, result in zip(owners, self._call("extract_embeddings_batch", decoded, det_size=det_size, purpose=purpose)):
+                results[i] = result
+        return results
+
+    def batching_stats(self) -> Dict:
+        with self._lock:
+            requests, errors = self._requests, self._errors
+        return {
+            "enabled": bool(get_inference_config().get("micro_batching", True)),
+            "mode": "pool",
+            "pool": {
+                "workers": self.settings["workers"],
+                "threads_per_worker": self.settings["threads_per_worker"],
+                "connections": len(self._channels),
+                "idle_connections": self._idle.qsize(),
+                "requests": requests,
+                "errors": errors,
+            },
+        }
+
+    def close(self):
+        for channel in self._channels:
+            channel.close()
+        self._channels = []
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    pool = InferencePool()
+    signal.signal(signal.SIGTERM, lambda *_: pool.stop())
+    pool.start()
+    logger.info(f"Inference pool started: {pool.settings['workers']} workers, sockets in {pool.settings['socket_dir']}")
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        pool.stop()
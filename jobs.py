@@ -0,0 +1,356 @@
+"""后台任务队列。
+
+任务持久化在 jobs 表中，提交后立即返回任务 ID。每个服务进程启动若干工作线程，
+轮询 jobs 表并以条件更新 (status = 'pending') 认领任务，多个 uvicorn worker 不会重复执行同一任务。
+
+任务处理函数通过 @job_registry.handler("类型") 注册，签名为 fn(job, **params)，返回值记为任务结果。
+处理函数用 job.add_success() / job.add_failure() 汇报进度，并在安全点调用 job.check_cancelled()
+响应取消请求。进度每隔 FLUSH_INTERVAL 秒写回数据库；另有心跳线程每隔 heartbeat_interval 秒
+刷新 updated_at，长时间没有进度的单个步骤也不会被误判。心跳超过 stale_after 秒的 running 任务
+视为所在进程已退出，标记为失败；写回只作用于仍为 running 的任务，已判定失败的任务不会被改回。
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select, update
+
+from config_loader import get_jobs_config
+from database import SessionLocal, BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FLUSH_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 30.0
+STALE_CHECK_INTERVAL = 60.0
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def job_to_dict(row: BackgroundJob) -> dict:
+    return {
+        "id": row.id,
+        "type": row.type,
+        "status": row.status,
+        "params": json.loads(row.params or "{}"),
+        "total": row.total,
+        "processed": row.processed,
+        "succeeded": row.succeeded,
+        "failed": row.failed,
+        "failures": json.loads(row.failures or "[]"),
+        "error": row.error,
+        "result": json.loads(row.result) if row.result else None,
+        "cancel_requested": bool(row.cancel_requested),
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "started_at": row.started_at.isoformat() if row.started_at else None,
+        "finished_at": row.finished_at.isoformat() if row.finished_at else None,
+    }
+
+
+class Job:
+    """执行中的任务，在内存中累计进度并定期写回 jobs 表。"""
+
+    def __init__(self, row: BackgroundJob, max_failures: int = 1000):
+        self.id = row.id
+        self.type = row.type
+        self.params = json.loads(row.params or "{}")
+        self.total: Optional[int] = row.total
+        self.processed = row.processed
+        self.succeeded = row.succeeded
+        self.failed = row.failed
+        self.failures: List[dict] = json.loads(row.failures or "[]")
+        self.max_failures = max_failures
+        self._cancelled = threading.Event()
+        if row.cancel_requested:
+            self._cancelled.set()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def set_total(self, total: int):
+        with self._lock:
+            self.total = total
+        self.flush(force=True)
+
+    def add_success(self, count: int = 1):
+        with self._lock:
+            self.processed += count
+            self.succeeded += count
+        self.flush()
+
+    def add_failure(self, error: str, **detail):
+        """记录一条失败；失败明细最多保留 max_failures 条，计数不受限制。"""
+        with self._lock:
+            self.processed += 1
+            self.failed += 1
+            if len(self.failures) < self.max_failures:
+                self.failures.append({**detail, "error": error})
+        self.flush()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def _progress(self) -> dict:
+        with self._lock:
+            return {
+                "total": self.total,
+                "processed": self.processed,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "failures": json.dumps(self.failures, ensure_ascii=False),
+                "updated_at": datetime.utcnow(),
+            }
+
+    def flush(self, force: bool = False, **fields) -> bool:
+        """写回进度（兼作心跳），并读取其他进程提交的取消请求。
+
+        只更新仍为 running 的任务，返回是否写入；任务已被其他进程判定为失败时不再写入，并请求处理函数退出。
+        """
+        now = time.monotonic()
+        if not force and now - self._last_flush < FLUSH_INTERVAL:
+            return True
+        self._last_flush = now
+        with SessionLocal() as db:
+            updated = db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == self.id, BackgroundJob.status == RUNNING)
+                .values(**self._progress(), **fields)
+            ).rowcount
+            cancel_requested = db.execute(
+                select(BackgroundJob.cancel_requested).where(BackgroundJob.id == self.id)
+            ).scalar()
+            db.commit()
+        if cancel_requested or not updated:
+            self._cancelled.set()
+        return bool(updated)
+
+
+class JobRegistry:
+    def __init__(self, workers: int = 2, poll_interval: float = 1.0, stale_after: float = 300.0, max_failures: int = 1000):
+        self.workers = max(1, int(workers))
+        self.poll_interval = float(poll_interval)
+        self.stale_after = float(stale_after)
+        self.heartbeat_interval = min(HEARTBEAT_INTERVAL, self.stale_after / 4)
+        self.max_failures = int(max_failures)
+        self._handlers: Dict[str, Callable] = {}
+        self._cleanups: Dict[str, Callable] = {}
+        self._running: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._last_stale_check = 0.0
+
+    def handler(self, job_type: str, cleanup: Optional[Callable] = None):
+        """注册任务处理函数；cleanup(**params) 在排队中的任务被取消时调用，用于清理临时文件等。"""
+        def decorator(fn):
+            self._handlers[job_type] = fn
+            if cleanup is not None:
+                self._cleanups[job_type] = cleanup
+            return fn
+        return decorator
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        with self._lock:
+            for job in self._running.values():
+                job.cancel()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def create(self, job_type: str, params: dict, total: Optional[int] = None) -> dict:
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        now = datetime.utcnow()
+        row = BackgroundJob(
+            id=uuid.uuid4().hex,
+            type=job_type,
+            status=PENDING,
+            params=json.dumps(params, ensure_ascii=False),
+            total=total,
+            processed=0,
+            succeeded=0,
+            failed=0,
+            failures="[]",
+            cancel_requested=False,
+            created_at=now,
+            updated_at=now,
+        )
+        with SessionLocal() as db:
+            db.add(row)
+            db.commit()
+            db.refresh(row)
+            result = job_to_dict(row)
+        self._wakeup.set()
+        return result
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with SessionLocal() as db:
+            row = db.get(BackgroundJob, job_id)
+            return job_to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, job_type: Optional[str] = None, limit: int = 50) -> List[dict]:
+        query = select(BackgroundJob).order_by(BackgroundJob.created_at.desc()).limit(limit)
+        if status:
+            query = query.where(BackgroundJob.status == status)
+        if job_type:
+            query = query.where(BackgroundJob.type == job_type)
+        with SessionLocal() as db:
+            return [job_to_dict(row) for row in db.execute(query).scalars()]
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        """排队中的任务直接取消；执行中的任务设置取消标记，由处理函数在安全点退出。"""
+        with SessionLocal() as db:
+            row = db.get(BackgroundJob, job_id)
+            if row is None:
+                return None
+            now = datetime.utcnow()
+            cancelled = db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == job_id, BackgroundJob.status == PENDING)
+                .values(status=CANCELLED, cancel_requested=True, finished_at=now, updated_at=now)
+            ).rowcount
+            if not cancelled and row.status == RUNNING:
+                db.execute(update(BackgroundJob).where(BackgroundJob.id == job_id).values(cancel_requested=True))
+            db.commit()
+            db.refresh(row)
+            result = job_to_dict(row)
+
+        if cancelled and row.type in self._cleanups:
+            try:
+                self._cleanups[row.type](**result["params"])
+            except Exception:
+                logger.exception(f"Cleanup of cancelled job {job_id} failed")
+        with self._lock:
+            job = self._running.get(job_id)
+        if job is not None:
+            job.cancel()
+        return result
+
+    def _claim(self) -> Optional[BackgroundJob]:
+        with SessionLocal() as db:
+            candidates = db.execute(
+                select(BackgroundJob.id)
+                .where(BackgroundJob.status == PENDING, BackgroundJob.type.in_(list(self._handlers)))
+                .order_by(BackgroundJob.created_at)
+                .limit(self.workers)
+            ).scalars().all()
+            for job_id in candidates:
+                now = datetime.utcnow()
+                claimed = db.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.id == job_id, BackgroundJob.status == PENDING)
+                    .values(status=RUNNING, started_at=now, updated_at=now)
+                ).rowcount
+                db.commit()
+                if claimed:
+                    return db.get(BackgroundJob, job_id)
+        return None
+
+    def _fail_stale(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        with SessionLocal() as db:
+            count = db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.status == RUNNING, BackgroundJob.updated_at < cutoff)
+                .values(status=FAILED, error="Job worker stopped responding", finished_at=datetime.utcnow())
+            ).rowcount
+            db.commit()
+        if count:
+            logger.warning(f"Marked {count} stale job(s) as failed")
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                if time.monotonic() - self._last_stale_check > STALE_CHECK_INTERVAL:
+                    self._last_stale_check = time.monotonic()
+                    self._fail_stale()
+                row = self._claim()
+            except Exception:
+                logger.exception("Failed to poll job queue")
+                row = None
+            if row is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(row)
+
+    def _heartbeat(self, job: Job, stop: threading.Event):
+        while not stop.wait(self.heartbeat_interval):
+            try:
+                job.flush(force=True)
+            except Exception:
+                logger.exception(f"Heartbeat of job {job.id} failed")
+
+    def _run(self, row: BackgroundJob):
+        job = Job(row, self.max_failures)
+        with self._lock:
+            self._running[job.id] = job
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, stop), name=f"job-heartbeat-{job.id[:8]}", daemon=True)
+        heartbeat.start()
+        status, error, result = COMPLETED, None, None
+        try:
+            job.check_cancelled()
+            result = self._handlers[row.type](job, **job.params)
+        except JobCancelled:
+            status = CANCELLED
+        except Exception as e:
+            logger.exception(f"Job {job.id} ({job.type}) failed")
+            status, error = FAILED, str(e)
+        finally:
+            stop.set()
+            heartbeat.join()
+            with self._lock:
+                self._running.pop(job.id, None)
+        try:
+            recorded = job.flush(
+                force=True,
+                status=status,
+                error=error,
+                result=json.dumps(result, ensure_ascii=False) if result is not None else None,
+                finished_at=datetime.utcnow(),
+            )
+            if not recorded:
+                logger.warning(f"Job {job.id} is no longer running (marked stale), {status} result discarded")
+        except Exception:
+            logger.exception(f"Failed to record result of job {job.id}")
+
+
+_jobs_config = get_jobs_config()
+job_registry = JobRegistry(
+    workers=_jobs_config.get("workers", 2),
+    poll_interval=_jobs_config.get("poll_interval", 1.0),
+    stale_after=_jobs_config.get("stale_after", 300),
+    max_failures=_jobs_config.get("max_failures", 1000),
+)
@@ -0,0 +1,82 @@
+"""人脸库级别的后台任务：删除人脸库、重建检索索引、压缩共享磁盘特征文件。"""
+import logging
+
+from sqlalchemy import delete, func, select
+
+from database import SessionLocal, FaceLibrary, FaceMember, bump_member_version
+from embedding_cache import embedding_cache
+from jobs import Job, job_registry
+from storage import remove_member_images
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 1000
+
+
+@job_registry.handler("delete_library")
+def delete_library(job: Job, library_id: int) -> dict:
+    """分批删除成员及其图片，每批单独提交；取消后已删除的成员不会恢复，人脸库保留。"""
+    with SessionLocal() as db:
+        if db.get(FaceLibrary, library_id) is None:
+            return {"library_id": library_id, "deleted_members": 0}
+        job.set_total(db.scalar(select(func.count(FaceMember.id)).where(FaceMember.library_id == library_id)))
+
+    try:
+        while True:
+            job.check_cancelled()
+            with SessionLocal() as db:
+                rows = db.execute(
+                    select(FaceMember.id, FaceMember.image_path)
+                    .where(FaceMember.library_id == library_id)
+                    .order_by(FaceMember.id)
+                    .limit(DELETE_BATCH_SIZE)
+                ).all()
+                if not rows:
+                    break
+                db.execute(delete(FaceMember).where(FaceMember.id.in_([r.id for r in rows])))
+                db.execute(bump_member_version(library_id))
+                db.commit()
+            remove_member_images([r.image_path for r in rows])
+            job.add_success(len(rows))
+
+        with SessionLocal() as db:
+            library = db.get(FaceLibrary, library_id)
+            if library is not None:
+                db.delete(library)
+                db.commit()
+        embedding_cache.invalidate(library_id, discard_store=True)
+    finally:
+        embedding_cache.invalidate(library_id)
+
+    return {"library_id": library_id, "deleted_members": job.succeeded}
+
+
+@job_registry.handler("rebuild_index")
+def rebuild_index(job: Job, library_id: int) -> dict:
+    """丢弃当前进程中的特征矩阵与 ANN 索引并从数据库重新加载；开启 store 时磁盘特征文件一并重新生成。
+
+    成员没有变化，但仍递增成员版本号，其他 worker 进程在下一次搜索时发现版本号变化并自行重新加载。
+    """
+    with SessionLocal() as db:
+        if db.get(FaceLibrary, library_id) is None:
+            raise ValueError(f"Library {library_id} not found")
+        db.execute(bump_member_version(library_id))
+        db.commit()
+    embedding_cache.invalidate(library_id, discard_store=True)
+    with SessionLocal() as db:
+        with embedding_cache.read(db, library_id) as entry:
+            size = entry.size
+    job.set_total(size)
+    job.add_success(size)
+    return {"library_id": library_id, "members": size}
+
+
+@job_registry.handler("compact_store")
+def compact_store(job: Job, library_id: int) -> dict:
+    """删除磁盘特征文件中已标记删除的行；已删除行占比超过 store.compact_ratio 时自动提交。"""
+    if not embedding_cache.store_enabled:
+        raise ValueError("Embedding store is not enabled")
+    result = embedding_cache.compact(library_id)
+    job.set_total(result["removed"])
+    job.add_success(result["removed"])
+    return result
@@ -1,36 +1,62 @@
 import os
 import json
+import shutil
+import tempfile
 import uuid
 import logging
 import time
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Literal
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Query, Request
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Query, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, select, func
 from pydantic import BaseModel, Field
 import numpy as np
 
 from database import (
-    get_db, init_db, FaceLibrary, FaceMember, 
-    FaceLibrarySchema, FaceMemberSchema, PaginatedResponse
+    get_async_db, init_db, engine, async_engine, SessionLocal, AsyncSessionLocal, FaceLibrary, FaceMember, 
+    FaceLibrarySchema, PaginatedResponse, bump_member_version
+)
+from face_service import face_service, FaceService
+from face_tracker import FaceTracker
+from inference_executor import inference_executor
+from embedding_cache import embedding_cache
+from result_cache import result_cache
+from metrics import metrics
+from access_log import AccessLogMiddleware, install_queue_logging
+from config_loader import get_access_log_config
+from embedding_codec import encode_embedding, decode_embedding, parse_embedding
+from jobs import job_registry, PENDING, RUNNING, COMPLETED, FAILED, CANCELLED
+from bulk_import import detect_format, count_items
+import library_jobs  # noqa: F401  注册人脸库任务处理函数
+from reembed import library_model_status, cutover, log_model_mismatch
+from storage import (
+    is_path_in_upload_dir, get_file_ext, validate_upload, detect_image_ext,
+    save_member_image,
 )
-from face_service import face_service
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
+if get_access_log_config().get("async", True):
+    install_queue_logging()
 logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()
+    # startup.py 已在启动 worker 之前建表并完成迁移
+    if not os.getenv("DB_INITIALIZED"):
+        init_db()
+    log_model_mismatch()
+    job_registry.start()
     yield
+    job_registry.stop()
 
 
 app = FastAPI(title="ArcFace Face Recognition API", version="1.0.0", lifespan=lifespan)
@@ -39,7 +65,7 @@ app = FastAPI(title="ArcFace Face Recognition API", version="1.0.0", lifespan=li
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     if isinstance(exc, HTTPException):
-        return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+        return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=exc.headers)
     logger.exception("Unhandled exception")
     return JSONResponse(status_code=500, content={"detail": "Internal server error"})
 
@@ -63,95 +89,178 @@ async def auth_middleware(request: Request, call_next):
     return await call_next(request)
 
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    req_id = request.headers.get("X-Request-ID", str(uuid.uuid4())[:8])
-    
-    body = None
-    if request.method in ["POST", "PUT", "PATCH"] and not request.url.path.startswith("/api/detect"):
-        try:
-            body = await request.body()
-            if body:
-                try:
-                    body = json.loads(body)
-                    if isinstance(body, dict):
-                        if 'image' in body:
-                            body = {**body, 'image': body['image'][:30] + '...(base64 truncated)'}
-                        if 'file' in body:
-                            body = {**body, 'file': body['file'][:30] + '...(base64 truncated)'}
-                except:
-                    body = str(body)[:200]
-        except:
-            pass
-    
-    logger.info(f"[{req_id}] 📥 {request.method} {request.url.path}")
-    if body:
-        logger.info(f"[{req_id}] 📥 Body: {body}")
-    
-    response = await call_next(request)
-    response.headers["X-Request-ID"] = req_id
-    
-    process_time = time.time() - start_time
-    logger.info(f"[{req_id}] 📤 {response.status_code} | {process_time:.3f}s")
-    
-    return response
-
-BASE_DIR = Path(__file__).parent.resolve()
-UPLOAD_DIR = BASE_DIR / "uploads"
-UPLOAD_DIR.mkdir(exist_ok=True)
+_access_log_config = get_access_log_config()
+if _access_log_config.get("enabled", True):
+    app.add_middleware(
+        AccessLogMiddleware,
+        body_sample_rate=_access_log_config.get("body_sample_rate", 0.0),
+        body_max_bytes=_access_log_config.get("body_max_bytes", 2048),
+        log_format=_access_log_config.get("format", "text"),
+    )
 
 
-def is_path_in_upload_dir(path: Path) -> bool:
+async def record_request_metrics(request: Request, call_next):
+    start_time = time.perf_counter()
+    status = 500
     try:
-        return path.resolve().absolute().parts[:len(UPLOAD_DIR.parts)] == UPLOAD_DIR.parts
-    except (ValueError, OSError):
-        return False
-
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # 按路由模板统计，路径参数不会产生新的标签值
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.inc("http_requests_total", method=request.method, route=path, status=status)
+        metrics.observe("http_request_seconds", time.perf_counter() - start_time, method=request.method, route=path)
 
-import base64
-import io
-from PIL import Image
-from config_loader import get_upload_config
 
-_upload_config = get_upload_config()
-ALLOWED_EXTENSIONS = set(_upload_config.get("allowed_extensions", ["jpg", "jpeg", "png", "bmp"]))
-MAX_FILE_SIZE = _upload_config.get("max_file_size", 10 * 1024 * 1024)
+def collect_runtime_metrics():
+    for name, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        for state, getter in (("size", "size"), ("checked_out", "checkedout"), ("checked_in", "checkedin")):
+            if hasattr(pool, getter):
+                metrics.set("db_pool_connections", getattr(pool, getter)(), engine=name, state=state)
+    stats = inference_executor.stats()
+    metrics.set("inference_executor_pending", stats["pending"])
+    metrics.set("inference_executor_rejected_total", stats["rejected"])
 
-_MAGIC_BYTES = {
-    b'\xff\xd8\xff': ('jpg', 'jpeg'),
-    b'\x89PNG\r\n\x1a\n': ('png',),
-    b'BM': ('bmp',),
-}
 
+# 未开启指标时不注册中间件，请求路径上没有额外开销
+if metrics.enabled:
+    app.middleware("http")(record_request_metrics)
+    metrics.register_collector(collect_runtime_metrics)
 
-def _get_file_ext(filename: str) -> str:
-    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+import base64
+from config_loader import get_upload_config, get_bulk_import_config, get_model_name, get_stream_config
 
+MAX_BATCH_IMAGES = get_upload_config().get("max_batch_images", 64)
+_bulk_import_config = get_bulk_import_config()
+MAX_BULK_UPLOAD_SIZE = int(_bulk_import_config.get("max_upload_mb", 10240)) * 1024 * 1024
 
-def validate_upload(filename: str, file_size: int, content: bytes):
-    ext = _get_file_ext(filename)
-    if ext and ext not in ALLOWED_EXTENSIONS:
-        raise HTTPException(status_code=400, detail=f"File type '.{ext}' not allowed")
 
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail=f"File exceeds max size of {MAX_FILE_SIZE} bytes")
+async def read_upload(file: UploadFile) -> bytes:
+    with metrics.time("upload_read"):
+        file_bytes = await file.read()
+    validate_upload(file.filename or "image.jpg", len(file_bytes), file_bytes)
+    return file_bytes
+
+
+async def run_cached(kind: str, key, fn, *args):
+    """在推理线程池执行 fn(*args)；key 不为 None 时先查结果缓存 (见 result_cache)，未命中再执行并写入。"""
+    if key is None:
+        return await inference_executor.run(fn, *args)
+    value = result_cache.get(kind, key)
+    if value is None:
+        value = await inference_executor.run(fn, *args)
+        result_cache.put(kind, key, value)
+    return value
+
+
+def search_entry(db, entry, query_embeddings: np.ndarray, top_k: int, threshold: float) -> List[List[dict]]:
+    """在已加读锁的缓存矩阵上检索；量化矩阵开启重排时从 db 读取候选成员的原始向量。"""
+    return face_service.search_faces_batch(
+        query_embeddings, entry.matrix, entry.member_ids, entry.names, top_k, threshold, normalized=True, index=entry.index,
+        scales=entry.scales, exact=embedding_cache.exact_loader(db, entry), rerank_candidates=entry.rerank_candidates,
+        deleted=entry.deleted,
+    )
 
-    if not content:
-        raise HTTPException(status_code=400, detail="Empty file")
 
-    matched = False
-    for magic, exts in _MAGIC_BYTES.items():
-        if content[:len(magic)] == magic:
-            if ext and ext not in exts:
-                raise HTTPException(status_code=400, detail="File extension does not match content type")
-            matched = True
-            break
-    if not matched:
-        raise HTTPException(status_code=400, detail="File is not a supported image format")
+def search_entry_cached(db, entry, library_id: int, query_embedding: np.ndarray, top_k: int, threshold: float, query_key=None) -> List[dict]:
+    """单个查询向量的 search_entry；query_key 为查询图片的缓存键，不为 None 时按
+    (query_key, 人脸库, 条目版本, top_k, threshold) 缓存结果，返回的是可修改的副本。"""
+    if query_key is None:
+        return search_entry(db, entry, query_embedding[np.newaxis, :], top_k, threshold)[0]
+    key = (query_key, library_id, entry.version, top_k, threshold)
+    hits = result_cache.get("search", key)
+    if hits is None:
+        hits = search_entry(db, entry, query_embedding[np.newaxis, :], top_k, threshold)[0]
+        result_cache.put("search", key, hits)
+    return [dict(hit) for hit in hits]
+
+
+def search_library(library_id: int, query_embedding: np.ndarray, top_k: int, threshold: float, query_key=None) -> List[dict]:
+    """在推理线程中执行：校验并取得人脸库的缓存矩阵后检索。"""
+    with SessionLocal() as db:
+        with embedding_cache.read(db, library_id) as entry:
+            return search_entry_cached(db, entry, library_id, query_embedding, top_k, threshold, query_key)
+
+
+def search_libraries(libraries: dict, query_embedding: np.ndarray, top_k: int, threshold: float, query_key=None) -> List[dict]:
+    """在推理线程中执行：查询向量只提取一次，逐库检索后按相似度合并为总的 top_k。
+
+    libraries 为 {library_id: name}，结果中带 library_id / library_name。
+    """
+    results = []
+    with SessionLocal() as db:
+        for library_id, library_name in libraries.items():
+            with embedding_cache.read(db, library_id) as entry:
+                hits = search_entry_cached(db, entry, library_id, query_embedding, top_k, threshold, query_key)
+            for hit in hits:
+                hit["library_id"] = library_id
+                hit["library_name"] = library_name
+            results.extend(hits)
+    results.sort(key=lambda hit: hit["similarity"], reverse=True)
+    return results[:top_k]
+
+
+def search_libraries_batch(libraries: dict, query_embeddings: np.ndarray, top_k: int, threshold: float, attribute: bool = False) -> List[List[dict]]:
+    """在推理线程中执行：Q 个查询向量在每个库上一次矩阵乘法检索，返回与查询行对齐的结果。
+
+    多个库时按查询合并各库结果并重新取 top_k；attribute 为 True 时结果带 library_id / library_name。
+    """
+    merged = [[] for _ in range(query_embeddings.shape[0])]
+    with SessionLocal() as db:
+        for library_id, library_name in libraries.items():
+            with embedding_cache.read(db, library_id) as entry:
+                if entry.size and entry.matrix.shape[1] != query_embeddings.shape[1]:
+                    raise ValueError(
+                        f"Embedding dimension {query_embeddings.shape[1]} does not match library {library_id} ({entry.matrix.shape[1]})"
+                    )
+                per_query = search_entry(db, entry, query_embeddings, top_k, threshold)
+            for hits, results in zip(per_query, merged):
+                if attribute:
+                    for hit in hits:
+                        hit["library_id"] = library_id
+                        hit["library_name"] = library_name
+                results.extend(hits)
+    if len(libraries) > 1:
+        for results in merged:
+            results.sort(key=lambda hit: hit["similarity"], reverse=True)
+            del results[top_k:]
+    return merged
+
+
+async def resolve_search_libraries(db: AsyncSession, library_id: Optional[int], library_ids) -> dict:
+    """把 library_id / library_ids 解析为 {library_id: name}。
+
+    library_ids 可以是 id 列表、逗号分隔的字符串或 "all"（所有人脸库）。
+    """
+    if library_ids is None or library_ids == "" or library_ids == []:
+        if not library_id:
+            raise HTTPException(status_code=400, detail="library_id or library_ids is required")
+        library = await db.get(FaceLibrary, library_id)
+        if not library:
+            raise HTTPException(status_code=404, detail="Library not found")
+        return {library.id: library.name}
+    
+    if isinstance(library_ids, str):
+        if library_ids.strip().lower() == "all":
+            rows = (await db.execute(select(FaceLibrary.id, FaceLibrary.name).order_by(FaceLibrary.id))).all()
+            return {row.id: row.name for row in rows}
+        try:
+            library_ids = [int(part) for part in library_ids.split(",") if part.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail='library_ids must be a list of ids or "all"')
+    
+    requested = list(dict.fromkeys(library_ids))
+    rows = (await db.execute(select(FaceLibrary.id, FaceLibrary.name).where(FaceLibrary.id.in_(requested)))).all()
+    names = {row.id: row.name for row in rows}
+    missing = [i for i in requested if i not in names]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Library not found: {', '.join(map(str, missing))}")
+    return {i: names[i] for i in requested}
 
 
-def decode_base64_image(base64_str: str) -> Path:
+def decode_base64_bytes(base64_str: str) -> bytes:
     if ',' in base64_str:
         base64_str = base64_str.split(',')[1]
     
@@ -159,15 +268,10 @@ def decode_base64_image(base64_str: str) -> Path:
     padding = 4 - len(base64_str) % 4
     if padding != 4:
         base64_str += '=' * padding
-    image_data = base64.b64decode(base64_str)
+    with metrics.time("base64_decode"):
+        image_data = base64.b64decode(base64_str)
     validate_upload("image.jpg", len(image_data), image_data)
-    image = Image.open(io.BytesIO(image_data))
-    
-    filename = f"{uuid.uuid4()}.jpg"
-    file_path = UPLOAD_DIR / filename
-    image.save(file_path)
-    
-    return file_path
+    return image_data
 
 
 class Base64Request(BaseModel):
@@ -175,14 +279,21 @@ class Base64Request(BaseModel):
     image: str
 
 
+# 检测模型输入尺寸提示（边长，32 的倍数），不传时按 model.det_size / adaptive_det_size 选择
+DET_SIZE_MIN = 128
+DET_SIZE_MAX = 1280
+
+
 class Base64SearchRequest(BaseModel):
     image: str
     top_k: int = Field(default=10, ge=1, le=1000)
     threshold: float = Field(default=0.5, ge=0.0, le=1.0)
+    det_size: int | None = Field(default=None, ge=DET_SIZE_MIN, le=DET_SIZE_MAX, multiple_of=32)
 
 
 class Base64DetectRequest(BaseModel):
     image: str
+    det_size: int | None = Field(default=None, ge=DET_SIZE_MIN, le=DET_SIZE_MAX, multiple_of=32)
 
 
 class UpdateLibraryRequest(BaseModel):
@@ -200,62 +311,80 @@ class SearchRequest(BaseModel):
 
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "ArcFace Face Recognition API", "version": "1.0.0"}
 
 
 @app.get("/health")
-def health(db: Session = Depends(get_db)):
+async def health(db: AsyncSession = Depends(get_async_db)):
     try:
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return {"status": "ok", "database": "connected"}
     except Exception as e:
         return JSONResponse(status_code=503, content={"status": "error", "database": str(e)})
 
 
+@app.get("/api/stats/inference")
+async def inference_stats():
+    return {**face_service.batching_stats(), "executor": inference_executor.stats()}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are not enabled")
+    content = await run_in_threadpool(metrics.render)
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/stats/cache")
+async def cache_stats():
+    return result_cache.stats()
+
+
 class CreateLibraryRequest(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
     description: str | None = None
 
 @app.post("/api/libraries", response_model=FaceLibrarySchema)
-def create_library(request: CreateLibraryRequest, db: Session = Depends(get_db)):
-    existing = db.query(FaceLibrary).filter(FaceLibrary.name == request.name).first()
+async def create_library(request: CreateLibraryRequest, db: AsyncSession = Depends(get_async_db)):
+    existing = (await db.execute(select(FaceLibrary).where(FaceLibrary.name == request.name))).scalars().first()
     if existing:
         raise HTTPException(status_code=400, detail="Library name already exists")
     
     library = FaceLibrary(name=request.name, description=request.description)
     db.add(library)
-    db.commit()
-    db.refresh(library)
+    await db.commit()
+    await db.refresh(library)
     return library
 
 
 @app.get("/api/libraries", response_model=List[FaceLibrarySchema])
-def list_libraries(
+async def list_libraries(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(FaceLibrary).order_by(FaceLibrary.id)
-    return query.offset((page - 1) * page_size).limit(page_size).all()
+    query = select(FaceLibrary).order_by(FaceLibrary.id).offset((page - 1) * page_size).limit(page_size)
+    return (await db.execute(query)).scalars().all()
 
 
 @app.get("/api/libraries/{library_id}", response_model=FaceLibrarySchema)
-def get_library(library_id: int, db: Session = Depends(get_db)):
-    library = db.query(FaceLibrary).filter(FaceLibrary.id == library_id).first()
+async def get_library(library_id: int, db: AsyncSession = Depends(get_async_db)):
+    library = await db.get(FaceLibrary, library_id)
     if not library:
         raise HTTPException(status_code=404, detail="Library not found")
     return library
 
 
 @app.put("/api/libraries/{library_id}", response_model=FaceLibrarySchema)
-def update_library(library_id: int, request: UpdateLibraryRequest, db: Session = Depends(get_db)):
-    library = db.query(FaceLibrary).filter(FaceLibrary.id == library_id).first()
+async def update_library(library_id: int, request: UpdateLibraryRequest, db: AsyncSession = Depends(get_async_db)):
+    library = await db.get(FaceLibrary, library_id)
     if not library:
         raise HTTPException(status_code=404, detail="Library not found")
     
     if request.name is not None:
-        existing = db.query(FaceLibrary).filter(FaceLibrary.name == request.name, FaceLibrary.id != library_id).first()
+        existing = (await db.execute(select(FaceLibrary).where(FaceLibrary.name == request.name, FaceLibrary.id != library_id))).scalars().first()
         if existing:
             raise HTTPException(status_code=400, detail="Library name already exists")
         library.name = request.name
@@ -263,90 +392,158 @@ def update_library(library_id: int, request: UpdateLibraryRequest, db: Session =
     if request.description is not None:
         library.description = request.description
     
-    db.commit()
-    db.refresh(library)
+    await db.commit()
+    await db.refresh(library)
     return library
 
 
-@app.delete("/api/libraries/{library_id}")
-def delete_library(library_id: int, db: Session = Depends(get_db)):
-    library = db.query(FaceLibrary).filter(FaceLibrary.id == library_id).first()
+@app.delete("/api/libraries/{library_id}", status_code=202)
+async def delete_library(library_id: int, db: AsyncSession = Depends(get_async_db)):
+    library = await db.get(FaceLibrary, library_id)
+    if not library:
+        raise HTTPException(status_code=404, detail="Library not found")
+    
+    job = await run_in_threadpool(job_registry.create, "delete_library", {"library_id": library_id})
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@app.post("/api/libraries/{library_id}/index/rebuild", status_code=202)
+async def rebuild_library_index(library_id: int, db: AsyncSession = Depends(get_async_db)):
+    library = await db.get(FaceLibrary, library_id)
+    if not library:
+        raise HTTPException(status_code=404, detail="Library not found")
+    
+    job = await run_in_threadpool(job_registry.create, "rebuild_index", {"library_id": library_id})
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@app.post("/api/libraries/{library_id}/store/compact", status_code=202)
+async def compact_library_store(library_id: int, db: AsyncSession = Depends(get_async_db)):
+    library = await db.get(FaceLibrary, library_id)
+    if not library:
+        raise HTTPException(status_code=404, detail="Library not found")
+    if not embedding_cache.store_enabled:
+        raise HTTPException(status_code=400, detail="Embedding store is not enabled")
+    
+    job = await run_in_threadpool(job_registry.create, "compact_store", {"library_id": library_id})
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+class ReembedRequest(BaseModel):
+    model_name: str | None = Field(default=None, min_length=1, max_length=100)
+    cutover: bool = False
+
+
+class CutoverRequest(BaseModel):
+    model_name: str = Field(..., min_length=1, max_length=100)
+
+
+@app.get("/api/libraries/{library_id}/reembed")
+async def get_reembed_status(library_id: int, db: AsyncSession = Depends(get_async_db)):
+    library = await db.get(FaceLibrary, library_id)
     if not library:
         raise HTTPException(status_code=404, detail="Library not found")
     
-    members = db.query(FaceMember).filter(FaceMember.library_id == library_id).all()
-    for m in members:
-        if m.image_path and is_path_in_upload_dir(Path(m.image_path)):
-            Path(m.image_path).unlink(missing_ok=True)
-    db.query(FaceMember).filter(FaceMember.library_id == library_id).delete()
-    db.delete(library)
-    db.commit()
-    return {"message": "Library deleted successfully"}
+    return await db.run_sync(library_model_status, library_id)
+
+
+@app.post("/api/libraries/{library_id}/reembed", status_code=202)
+async def reembed_library_members(library_id: int, request: ReembedRequest, db: AsyncSession = Depends(get_async_db)):
+    library = await db.get(FaceLibrary, library_id)
+    if not library:
+        raise HTTPException(status_code=404, detail="Library not found")
+    
+    params = {
+        "library_id": library_id,
+        "model_name": request.model_name or get_model_name(),
+        "cutover_when_done": request.cutover,
+    }
+    job = await run_in_threadpool(job_registry.create, "reembed", params)
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@app.post("/api/libraries/{library_id}/reembed/cutover")
+async def cutover_library_embeddings(library_id: int, request: CutoverRequest, db: AsyncSession = Depends(get_async_db)):
+    library = await db.get(FaceLibrary, library_id)
+    if not library:
+        raise HTTPException(status_code=404, detail="Library not found")
+    
+    try:
+        result = await run_in_threadpool(cutover, library_id, request.model_name)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if result["remaining"]:
+        raise HTTPException(
+            status_code=409,
+            detail=f"{result['remaining']} members have no embedding for model '{request.model_name}' yet"
+        )
+    return result
 
 
 @app.get("/api/libraries/{library_id}/members", response_model=PaginatedResponse)
-def list_library_members(
+async def list_library_members(
     library_id: int,
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    library = db.query(FaceLibrary).filter(FaceLibrary.id == library_id).first()
+    library = await db.get(FaceLibrary, library_id)
     if not library:
         raise HTTPException(status_code=404, detail="Library not found")
     
-    total = db.query(FaceMember).filter(FaceMember.library_id == library_id).count()
-    members = db.query(FaceMember).filter(FaceMember.library_id == library_id).offset((page - 1) * page_size).limit(page_size).all()
+    total = await db.scalar(select(func.count(FaceMember.id)).where(FaceMember.library_id == library_id))
+    members = (await db.execute(
+        select(FaceMember).where(FaceMember.library_id == library_id).offset((page - 1) * page_size).limit(page_size)
+    )).scalars().all()
     
-    items = [{"id": m.id, "record_id": m.record_id, "name": m.name, "image_path": m.image_path, "created_at": m.created_at.isoformat(), "updated_at": m.updated_at.isoformat() if m.updated_at else None} for m in members]
+    items = [{"id": m.id, "record_id": m.record_id, "name": m.name, "image_path": m.image_path, "embedding_model": m.embedding_model, "created_at": m.created_at.isoformat(), "updated_at": m.updated_at.isoformat() if m.updated_at else None} for m in members]
     
     return {"total": total, "page": page, "page_size": page_size, "items": items}
 
 
 @app.post("/api/libraries/{library_id}/members")
-def add_library_member(
+async def add_library_member(
     library_id: int,
     name: str = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    library = db.query(FaceLibrary).filter(FaceLibrary.id == library_id).first()
+    library = await db.get(FaceLibrary, library_id)
     if not library:
         raise HTTPException(status_code=404, detail="Library not found")
     
-    file_bytes = file.file.read()
-    validate_upload(file.filename or "image.jpg", len(file_bytes), file_bytes)
-    file_ext = _get_file_ext(file.filename or "image.jpg") or 'jpg'
-    filename = f"{uuid.uuid4()}.{file_ext}"
-    file_path = UPLOAD_DIR / filename
-    
-    with open(file_path, "wb") as f:
-        f.write(file_bytes)
+    file_bytes = await read_upload(file)
+    file_ext = get_file_ext(file.filename or "image.jpg") or 'jpg'
     
     try:
-        embedding, face_info = face_service.extract_embedding(str(file_path))
+        embedding, face_info = await inference_executor.run(face_service.extract_embedding, file_bytes, None, "enroll")
+    except HTTPException:
+        raise
     except Exception as e:
-        file_path.unlink(missing_ok=True)
         raise HTTPException(status_code=400, detail=f"Face extraction failed: {str(e)}")
     
-    embedding_str = json.dumps(embedding.tolist())
+    file_path = save_member_image(file_bytes, file_ext)
+    embedding_blob = encode_embedding(embedding)
     
     member = FaceMember(
         record_id=str(uuid.uuid4()),
         library_id=library_id,
         name=name,
         embedding=float(np.linalg.norm(embedding)),
-        embedding_vector=embedding_str,
+        embedding_vector=embedding_blob,
+        embedding_model=get_model_name(),
         image_path=str(file_path)
     )
     db.add(member)
     try:
-        db.commit()
+        member_version = await db.scalar(bump_member_version(library_id))
+        await db.commit()
     except Exception:
         file_path.unlink(missing_ok=True)
-        db.rollback()
+        await db.rollback()
         raise
-    db.refresh(member)
+    await db.refresh(member)
+    await run_in_threadpool(embedding_cache.add_member, member, embedding, member_version)
     
     return {
         "id": member.id,
@@ -364,12 +561,12 @@ class AddMemberByPathRequest(BaseModel):
 
 
 @app.post("/api/libraries/{library_id}/members/by-path")
-def add_library_member_by_path(
+async def add_library_member_by_path(
     library_id: int,
     request: AddMemberByPathRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    library = db.query(FaceLibrary).filter(FaceLibrary.id == library_id).first()
+    library = await db.get(FaceLibrary, library_id)
     if not library:
         raise HTTPException(status_code=404, detail="Library not found")
     
@@ -378,41 +575,41 @@ def add_library_member_by_path(
         raise HTTPException(status_code=400, detail="Image file not found")
     
     file_ext = src.suffix[1:] if src.suffix else 'jpg'
-    filename = f"{uuid.uuid4()}.{file_ext}"
-    dest = UPLOAD_DIR / filename
     try:
-        import shutil
-        shutil.copy2(src, dest)
+        file_bytes = src.read_bytes()
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to copy image: {str(e)}")
-    
-    file_bytes = dest.read_bytes()
-    validate_upload(dest.name, len(file_bytes), file_bytes)
+    validate_upload(src.name, len(file_bytes), file_bytes)
     
     try:
-        embedding, face_info = face_service.extract_embedding(str(dest))
+        embedding, face_info = await inference_executor.run(face_service.extract_embedding, file_bytes, None, "enroll")
+    except HTTPException:
+        raise
     except Exception:
-        dest.unlink(missing_ok=True)
         raise HTTPException(status_code=400, detail="Face extraction failed")
     
-    embedding_str = json.dumps(embedding.tolist())
+    dest = save_member_image(file_bytes, file_ext)
+    embedding_blob = encode_embedding(embedding)
     
     member = FaceMember(
         record_id=str(uuid.uuid4()),
         library_id=library_id,
         name=request.name,
         embedding=float(np.linalg.norm(embedding)),
-        embedding_vector=embedding_str,
+        embedding_vector=embedding_blob,
+        embedding_model=get_model_name(),
         image_path=str(dest)
     )
     db.add(member)
     try:
-        db.commit()
+        member_version = await db.scalar(bump_member_version(library_id))
+        await db.commit()
     except Exception:
         dest.unlink(missing_ok=True)
-        db.rollback()
+        await db.rollback()
         raise
-    db.refresh(member)
+    await db.refresh(member)
+    await run_in_threadpool(embedding_cache.add_member, member, embedding, member_version)
     
     return {
         "id": member.id,
@@ -424,46 +621,147 @@ def add_library_member_by_path(
     }
 
 
+def _copy_to_file(src, dst_path: str) -> int:
+    with open(dst_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+        return dst.tell()
+
+
+async def receive_bulk_upload(request: Request) -> str:
+    """把导入文件写入临时文件并返回路径；支持 multipart 的 file 字段或直接以请求体上传。"""
+    fd, path = tempfile.mkstemp(prefix="bulk-import-")
+    os.close(fd)
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="file is required")
+            size = await run_in_threadpool(_copy_to_file, upload.file, path)
+        else:
+            size = 0
+            with open(path, "wb") as f:
+                async for chunk in request.stream():
+                    size += len(chunk)
+                    if size > MAX_BULK_UPLOAD_SIZE:
+                        break
+                    f.write(chunk)
+        if size > MAX_BULK_UPLOAD_SIZE:
+            raise HTTPException(status_code=413, detail=f"Import file exceeds max size of {MAX_BULK_UPLOAD_SIZE} bytes")
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty file")
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+@app.post("/api/libraries/{library_id}/members/bulk", status_code=202)
+async def bulk_import_members(
+    library_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    library = await db.get(FaceLibrary, library_id)
+    if not library:
+        raise HTTPException(status_code=404, detail="Library not found")
+    
+    path = await receive_bulk_upload(request)
+    try:
+        fmt = await run_in_threadpool(detect_format, path)
+        total = await run_in_threadpool(count_items, path, fmt)
+    except Exception as e:
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail=f"Invalid import file: {str(e)}")
+    
+    job = await run_in_threadpool(
+        job_registry.create,
+        "bulk_import",
+        {"library_id": library_id, "path": path, "format": fmt},
+        total,
+    )
+    return {"job_id": job["id"], "status": job["status"], "total": total}
+
+
+JOB_STATUSES = (PENDING, RUNNING, COMPLETED, FAILED, CANCELLED)
+
+
+@app.get("/api/jobs")
+async def list_jobs(
+    status: Optional[str] = Query(None),
+    type: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500)
+):
+    if status is not None and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status, expected one of: {', '.join(JOB_STATUSES)}")
+    return await run_in_threadpool(job_registry.list, status, type, limit)
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(job_registry.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = await run_in_threadpool(job_registry.cancel, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 class UpdateMemberRequest(BaseModel):
     name: str | None = Field(default=None, min_length=1, max_length=100)
     image: str | None = None
 
 
 @app.put("/api/libraries/{library_id}/members/{member_id}")
-def update_library_member(
+async def update_library_member(
     library_id: int,
     member_id: int,
     request: UpdateMemberRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    member = db.query(FaceMember).filter(FaceMember.id == member_id, FaceMember.library_id == library_id).first()
+    member = (await db.execute(select(FaceMember).where(FaceMember.id == member_id, FaceMember.library_id == library_id))).scalars().first()
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     
     if request.name is not None:
         member.name = request.name
     
+    embedding = None
     if request.image:
         try:
-            file_path = decode_base64_image(request.image)
+            image_bytes = decode_base64_bytes(request.image)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
         
-        if member.image_path and is_path_in_upload_dir(Path(member.image_path)):
-            Path(member.image_path).unlink(missing_ok=True)
-        
         try:
-            embedding, face_info = face_service.extract_embedding(str(file_path))
+            embedding, face_info = await inference_executor.run(face_service.extract_embedding, image_bytes, None, "enroll")
+        except HTTPException:
+            raise
         except Exception as e:
-            file_path.unlink(missing_ok=True)
             raise HTTPException(status_code=400, detail=f"Face extraction failed: {str(e)}")
         
+        if member.image_path and is_path_in_upload_dir(Path(member.image_path)):
+            Path(member.image_path).unlink(missing_ok=True)
+        
+        file_path = save_member_image(image_bytes, detect_image_ext(image_bytes))
         member.embedding = float(np.linalg.norm(embedding))
-        member.embedding_vector = json.dumps(embedding.tolist())
+        member.embedding_vector = encode_embedding(embedding)
+        member.embedding_model = get_model_name()
+        member.staged_embedding = None
+        member.staged_embedding_norm = None
+        member.staged_model = None
         member.image_path = str(file_path)
     
-    db.commit()
-    db.refresh(member)
+    member_version = await db.scalar(bump_member_version(library_id))
+    await db.commit()
+    await db.refresh(member)
+    await run_in_threadpool(embedding_cache.update_member, member, embedding, member_version)
     
     return {
         "id": member.id,
@@ -475,8 +773,8 @@ def update_library_member(
 
 
 @app.get("/api/libraries/{library_id}/members/by-record/{record_id}")
-def get_member_by_record_id(library_id: int, record_id: str, db: Session = Depends(get_db)):
-    member = db.query(FaceMember).filter(FaceMember.record_id == record_id, FaceMember.library_id == library_id).first()
+async def get_member_by_record_id(library_id: int, record_id: str, db: AsyncSession = Depends(get_async_db)):
+    member = (await db.execute(select(FaceMember).where(FaceMember.record_id == record_id, FaceMember.library_id == library_id))).scalars().first()
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     
@@ -485,104 +783,92 @@ def get_member_by_record_id(library_id: int, record_id: str, db: Session = Depen
         "record_id": member.record_id,
         "name": member.name,
         "image_path": member.image_path,
+        "embedding_model": member.embedding_model,
         "created_at": member.created_at.isoformat()
     }
 
 
 @app.delete("/api/libraries/{library_id}/members/by-record/{record_id}")
-def delete_member_by_record_id(library_id: int, record_id: str, db: Session = Depends(get_db)):
-    member = db.query(FaceMember).filter(FaceMember.record_id == record_id, FaceMember.library_id == library_id).first()
+async def delete_member_by_record_id(library_id: int, record_id: str, db: AsyncSession = Depends(get_async_db)):
+    member = (await db.execute(select(FaceMember).where(FaceMember.record_id == record_id, FaceMember.library_id == library_id))).scalars().first()
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     
     if member.image_path and is_path_in_upload_dir(Path(member.image_path)):
         Path(member.image_path).unlink(missing_ok=True)
     
-    db.delete(member)
-    db.commit()
+    member_id = member.id
+    await db.delete(member)
+    member_version = await db.scalar(bump_member_version(library_id))
+    await db.commit()
+    await run_in_threadpool(embedding_cache.remove_member, library_id, member_id, member_version)
     
     return {"message": "Member deleted successfully"}
 
 
 @app.delete("/api/libraries/{library_id}/members/{member_id}")
-def delete_library_member(library_id: int, member_id: int, db: Session = Depends(get_db)):
-    member = db.query(FaceMember).filter(FaceMember.id == member_id, FaceMember.library_id == library_id).first()
+async def delete_library_member(library_id: int, member_id: int, db: AsyncSession = Depends(get_async_db)):
+    member = (await db.execute(select(FaceMember).where(FaceMember.id == member_id, FaceMember.library_id == library_id))).scalars().first()
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     
     if member.image_path and is_path_in_upload_dir(Path(member.image_path)):
         Path(member.image_path).unlink(missing_ok=True)
     
-    db.delete(member)
-    db.commit()
+    await db.delete(member)
+    member_version = await db.scalar(bump_member_version(library_id))
+    await db.commit()
+    await run_in_threadpool(embedding_cache.remove_member, library_id, member_id, member_version)
     
     return {"message": "Member deleted successfully"}
 
 
 class SearchJsonRequest(BaseModel):
     library_id: int | None = None
+    library_ids: List[int] | Literal["all"] | None = None
     image: str | None = None
     file: str | None = None
     top_k: int = Field(default=10, ge=1, le=1000)
     threshold: float = Field(default=0.5, ge=0.0, le=1.0)
+    det_size: int | None = Field(default=None, ge=DET_SIZE_MIN, le=DET_SIZE_MAX, multiple_of=32)
 
 
 @app.post("/api/search")
-def search_face(
+async def search_face(
     library_id: Optional[int] = Form(None),
+    library_ids: Optional[str] = Form(None),
     file: UploadFile = File(None),
     top_k: int = Form(10),
     threshold: float = Form(0.5),
     image: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    det_size: Optional[int] = Form(None, ge=DET_SIZE_MIN, le=DET_SIZE_MAX, multiple_of=32),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if not library_id:
-        raise HTTPException(status_code=400, detail="library_id is required")
-    
-    library = db.query(FaceLibrary).filter(FaceLibrary.id == library_id).first()
-    if not library:
-        raise HTTPException(status_code=404, detail="Library not found")
+    libraries = await resolve_search_libraries(db, library_id, library_ids)
     
     if file:
-        file_bytes = file.file.read()
-        validate_upload(file.filename or "image.jpg", len(file_bytes), file_bytes)
-        file_ext = _get_file_ext(file.filename or "image.jpg") or 'jpg'
-        filename = f"{uuid.uuid4()}.{file_ext}"
-        file_path = UPLOAD_DIR / filename
-        
-        with open(file_path, "wb") as f:
-            f.write(file_bytes)
-        
-        try:
-            query_embedding, face_info = face_service.extract_embedding(str(file_path))
-        except Exception as e:
-            file_path.unlink(missing_ok=True)
-            raise HTTPException(status_code=400, detail=f"Face extraction failed: {str(e)}")
-        
-        file_path.unlink(missing_ok=True)
+        image_bytes = await read_upload(file)
     elif image:
         try:
-            file_path = decode_base64_image(image)
+            image_bytes = decode_base64_bytes(image)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
-        
-        try:
-            query_embedding, face_info = face_service.extract_embedding(str(file_path))
-        except Exception as e:
-            file_path.unlink(missing_ok=True)
-            raise HTTPException(status_code=400, detail=f"Face extraction failed: {str(e)}")
-        
-        file_path.unlink(missing_ok=True)
     else:
         raise HTTPException(status_code=400, detail="file or image is required")
     
-    members = db.query(FaceMember).filter(FaceMember.library_id == library_id).all()
+    query_key = result_cache.key(image_bytes, det_size)
+    try:
+        query_embedding, face_info = await run_cached("embedding", query_key, face_service.extract_embedding, image_bytes, det_size)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Face extraction failed: {str(e)}")
     
-    member_ids = [m.id for m in members]
-    names = [m.name for m in members]
-    embeddings_matrix = np.array([json.loads(m.embedding_vector) for m in members])
+    if library_ids:
+        results = await inference_executor.run(search_libraries, libraries, query_embedding, top_k, threshold, query_key)
+        return {"query_face": face_info, "library_ids": list(libraries), "results": results}
     
-    results = face_service.search_faces(query_embedding, embeddings_matrix, member_ids, names, top_k, threshold)
+    results = await inference_executor.run(search_library, library_id, query_embedding, top_k, threshold, query_key)
     
     return {
         "query_face": face_info,
@@ -591,40 +877,34 @@ def search_face(
 
 
 @app.post("/api/search/json")
-def search_face_json(
+async def search_face_json(
     request: SearchJsonRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if request.library_id is None:
-        raise HTTPException(status_code=400, detail="library_id is required")
-    library = db.query(FaceLibrary).filter(FaceLibrary.id == request.library_id).first()
-    if not library:
-        raise HTTPException(status_code=404, detail="Library not found")
+    libraries = await resolve_search_libraries(db, request.library_id, request.library_ids)
     
     base64_image = request.image or request.file
     if not base64_image:
         raise HTTPException(status_code=400, detail="image or file is required")
     
     try:
-        file_path = decode_base64_image(base64_image)
+        image_bytes = decode_base64_bytes(base64_image)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
     
+    query_key = result_cache.key(image_bytes, request.det_size)
     try:
-        query_embedding, face_info = face_service.extract_embedding(str(file_path))
+        query_embedding, face_info = await run_cached("embedding", query_key, face_service.extract_embedding, image_bytes, request.det_size)
+    except HTTPException:
+        raise
     except Exception as e:
-        file_path.unlink(missing_ok=True)
         raise HTTPException(status_code=400, detail=f"Face extraction failed: {str(e)}")
     
-    file_path.unlink(missing_ok=True)
-    
-    members = db.query(FaceMember).filter(FaceMember.library_id == request.library_id).all()
-    
-    member_ids = [m.id for m in members]
-    names = [m.name for m in members]
-    embeddings_matrix = np.array([json.loads(m.embedding_vector) for m in members])
+    if request.library_ids:
+        results = await inference_executor.run(search_libraries, libraries, query_embedding, request.top_k, request.threshold, query_key)
+        return {"query_face": face_info, "library_ids": list(libraries), "results": results}
     
-    results = face_service.search_faces(query_embedding, embeddings_matrix, member_ids, names, request.top_k, request.threshold)
+    results = await inference_executor.run(search_library, request.library_id, query_embedding, request.top_k, request.threshold, query_key)
     
     return {
         "query_face": face_info,
@@ -632,83 +912,372 @@ def search_face_json(
     }
 
 
-@app.post("/api/detect")
-def detect_face(file: UploadFile = File(...)):
-    file_bytes = file.file.read()
-    validate_upload(file.filename or "image.jpg", len(file_bytes), file_bytes)
-    file_ext = _get_file_ext(file.filename or "image.jpg") or 'jpg'
-    filename = f"{uuid.uuid4()}.{file_ext}"
-    file_path = UPLOAD_DIR / filename
+async def _search_faces_response(libraries: dict, multi: bool, faces: List[dict], top_k: int, threshold: float) -> dict:
+    """faces 为 [{'index', 'embedding', 'face_info'?} 或 {'index', 'error'}]，按人脸分组返回检索结果。"""
+    valid = [face for face in faces if 'error' not in face]
+    results = []
+    if valid:
+        queries = np.stack([np.asarray(face['embedding'], dtype=np.float32) for face in valid])
+        try:
+            results = await inference_executor.run(search_libraries_batch, libraries, queries, top_k, threshold, multi)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    by_index = {face['index']: hits for face, hits in zip(valid, results)}
+    
+    grouped = []
+    for face in faces:
+        item = {"index": face['index']}
+        if 'face_info' in face:
+            item["face_info"] = face['face_info']
+        if 'error' in face:
+            item["error"] = face['error']
+        else:
+            item["results"] = by_index[face['index']]
+        grouped.append(item)
+    
+    response = {"count": len(grouped), "faces": grouped}
+    if multi:
+        response["library_ids"] = list(libraries)
+    return response
+
+
+@app.post("/api/search/faces")
+async def search_all_faces(
+    library_id: Optional[int] = Form(None),
+    library_ids: Optional[str] = Form(None),
+    file: UploadFile = File(None),
+    image: Optional[str] = Form(None),
+    top_k: int = Form(10, ge=1, le=1000),
+    threshold: float = Form(0.5),
+    max_faces: Optional[int] = Form(None, ge=1),
+    det_size: Optional[int] = Form(None, ge=DET_SIZE_MIN, le=DET_SIZE_MAX, multiple_of=32),
+    db: AsyncSession = Depends(get_async_db)
+):
+    libraries = await resolve_search_libraries(db, library_id, library_ids)
     
-    with open(file_path, "wb") as f:
-        f.write(file_bytes)
+    if file:
+        image_bytes = await read_upload(file)
+    elif image:
+        try:
+            image_bytes = decode_base64_bytes(image)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
+    else:
+        raise HTTPException(status_code=400, detail="file or image is required")
     
     try:
-        faces = face_service.detect_faces(str(file_path))
-    finally:
-        file_path.unlink(missing_ok=True)
+        extracted = await inference_executor.run(face_service.extract_all_embeddings, image_bytes, det_size, max_faces)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Face extraction failed: {str(e)}")
     
-    return {"faces": faces, "count": len(faces)}
+    faces = [{"index": i, **item} for i, item in enumerate(extracted)]
+    return await _search_faces_response(libraries, bool(library_ids), faces, top_k, threshold)
 
 
-@app.post("/api/detect/confidence")
-def detect_face_with_confidence(file: UploadFile = File(...)):
-    file_bytes = file.file.read()
-    validate_upload(file.filename or "image.jpg", len(file_bytes), file_bytes)
-    file_ext = _get_file_ext(file.filename or "image.jpg") or 'jpg'
-    filename = f"{uuid.uuid4()}.{file_ext}"
-    file_path = UPLOAD_DIR / filename
+def parse_query_embeddings(values: list, model: Optional[str] = None) -> List[np.ndarray]:
+    """解析客户端提交的特征向量（浮点数组或 base64 float32），要求维度一致。"""
+    if model is not None and model != get_model_name():
+        raise HTTPException(
+            status_code=400,
+            detail=f"Embeddings from model '{model}' cannot be compared with library vectors from '{get_model_name()}'"
+        )
+    vectors = []
+    for i, value in enumerate(values):
+        try:
+            vectors.append(parse_embedding(value))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid embedding at index {i}: {str(e)}")
+    if len({v.shape[0] for v in vectors}) > 1:
+        raise HTTPException(status_code=400, detail="Embeddings must have equal dimension")
+    return vectors
+
+
+class SearchFacesJsonRequest(BaseModel):
+    library_id: int | None = None
+    library_ids: List[int] | Literal["all"] | None = None
+    image: str | None = None
+    images: List[str] | None = None
+    embeddings: List[List[float] | str] | None = None
+    top_k: int = Field(default=10, ge=1, le=1000)
+    threshold: float = Field(default=0.5, ge=0.0, le=1.0)
+    max_faces: int | None = Field(default=None, ge=1)
+    det_size: int | None = Field(default=None, ge=DET_SIZE_MIN, le=DET_SIZE_MAX, multiple_of=32)
+
+
+@app.post("/api/search/faces/json")
+async def search_faces_json(
+    request: SearchFacesJsonRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """image: 检索图片中的所有人脸；images: 每张图片一个人脸；embeddings: 直接以特征向量检索。三者选一。"""
+    if sum(x is not None for x in (request.image, request.images, request.embeddings)) != 1:
+        raise HTTPException(status_code=400, detail="Exactly one of image, images or embeddings is required")
+    for items in (request.images, request.embeddings):
+        if items is not None and not 1 <= len(items) <= MAX_BATCH_IMAGES:
+            raise HTTPException(status_code=400, detail=f"Between 1 and {MAX_BATCH_IMAGES} queries per request")
+    
+    libraries = await resolve_search_libraries(db, request.library_id, request.library_ids)
+    
+    if request.embeddings is not None:
+        faces = [{"index": i, "embedding": e} for i, e in enumerate(parse_query_embeddings(request.embeddings))]
+    elif request.images is not None:
+        decoded = []
+        errors = {}
+        _decode_batch_base64(request.images, decoded, errors)
+        valid = [i for i, img in enumerate(decoded) if img is not None]
+        extracted = await inference_executor.run(
+            face_service.extract_embeddings_batch, [decoded[i] for i in valid], request.det_size
+        ) if valid else []
+        by_index = dict(zip(valid, extracted))
+        faces = [{"index": i, **by_index.get(i, {"error": errors.get(i)})} for i in range(len(decoded))]
+    else:
+        try:
+            image_bytes = decode_base64_bytes(request.image)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
+        try:
+            extracted = await inference_executor.run(
+                face_service.extract_all_embeddings, image_bytes, request.det_size, request.max_faces
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Face extraction failed: {str(e)}")
+        faces = [{"index": i, **item} for i, item in enumerate(extracted)]
+    
+    return await _search_faces_response(libraries, bool(request.library_ids), faces, request.top_k, request.threshold)
+
+
+class EmbeddingSearchRequest(BaseModel):
+    library_id: int | None = None
+    library_ids: List[int] | Literal["all"] | None = None
+    embedding: List[float] | str | None = None
+    embeddings: List[List[float] | str] | None = None
+    model: str | None = Field(default=None, max_length=100)
+    top_k: int = Field(default=10, ge=1, le=1000)
+    threshold: float = Field(default=0.5, ge=0.0, le=1.0)
+
+
+@app.post("/api/search/embedding")
+async def search_by_embedding(
+    request: EmbeddingSearchRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """直接以特征向量检索，跳过检测和识别。embedding 返回单个结果列表，embeddings 按查询分组。"""
+    if (request.embedding is None) == (request.embeddings is None):
+        raise HTTPException(status_code=400, detail="Exactly one of embedding or embeddings is required")
+    if request.embeddings is not None and not 1 <= len(request.embeddings) <= MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {MAX_BATCH_IMAGES} queries per request")
+    
+    libraries = await resolve_search_libraries(db, request.library_id, request.library_ids)
+    multi = bool(request.library_ids)
     
-    with open(file_path, "wb") as f:
-        f.write(file_bytes)
+    if request.embeddings is not None:
+        vectors = parse_query_embeddings(request.embeddings, request.model)
+        faces = [{"index": i, "embedding": v} for i, v in enumerate(vectors)]
+        return await _search_faces_response(libraries, multi, faces, request.top_k, request.threshold)
     
+    query = parse_query_embeddings([request.embedding], request.model)[0]
     try:
-        faces = face_service.detect_faces_with_confidence(str(file_path))
-    finally:
-        file_path.unlink(missing_ok=True)
+        results = (await inference_executor.run(
+            search_libraries_batch, libraries, query[np.newaxis, :], request.top_k, request.threshold, multi
+        ))[0]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if multi:
+        return {"library_ids": list(libraries), "results": results}
+    return {"results": results}
+
+
+class EmbeddingMemberRequest(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    embedding: List[float] | str
+    model: str | None = Field(default=None, max_length=100)
+
+
+@app.post("/api/libraries/{library_id}/members/embedding")
+async def add_library_member_by_embedding(
+    library_id: int,
+    request: EmbeddingMemberRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """以客户端提取的特征向量直接添加成员，不保存图片。"""
+    library = await db.get(FaceLibrary, library_id)
+    if not library:
+        raise HTTPException(status_code=404, detail="Library not found")
+    
+    embedding = parse_query_embeddings([request.embedding], request.model)[0]
+    existing = await db.scalar(select(FaceMember.embedding_vector).where(FaceMember.library_id == library_id).limit(1))
+    if existing is not None and decode_embedding(existing).shape[0] != embedding.shape[0]:
+        raise HTTPException(status_code=400, detail="Embedding dimension does not match library members")
+    
+    member = FaceMember(
+        record_id=str(uuid.uuid4()),
+        library_id=library_id,
+        name=request.name,
+        embedding=float(np.linalg.norm(embedding)),
+        embedding_vector=encode_embedding(embedding),
+        embedding_model=get_model_name(),
+        image_path=None
+    )
+    db.add(member)
+    member_version = await db.scalar(bump_member_version(library_id))
+    await db.commit()
+    await db.refresh(member)
+    await run_in_threadpool(embedding_cache.add_member, member, embedding, member_version)
+    
+    return {
+        "id": member.id,
+        "record_id": member.record_id,
+        "name": member.name,
+        "image_path": None,
+        "embedding_model": member.embedding_model,
+        "created_at": member.created_at.isoformat()
+    }
+
+
+class BatchEmbeddingRequest(BaseModel):
+    images: List[str] = Field(..., min_length=1)
+
+
+async def _batch_embedding_response(images: list, errors: dict) -> dict:
+    """images 中解码失败的项为 None，其错误信息记录在 errors 中。"""
+    valid = [i for i, img in enumerate(images) if img is not None]
+    extracted = await inference_executor.run(face_service.extract_embeddings_batch, [images[i] for i in valid]) if valid else []
+    by_index = dict(zip(valid, extracted))
+    
+    results = []
+    for i in range(len(images)):
+        item = by_index.get(i, {'error': errors.get(i)})
+        if 'error' in item:
+            results.append({"index": i, "error": item['error']})
+        else:
+            results.append({"index": i, "embedding": item['embedding'].tolist(), "face_info": item['face_info']})
+    
+    return {"count": len(results), "results": results}
+
+
+def _decode_batch_base64(images: List[str], decoded: list, errors: dict):
+    for image in images:
+        try:
+            decoded.append(decode_base64_bytes(image))
+        except HTTPException as e:
+            errors[len(decoded)] = e.detail
+            decoded.append(None)
+        except Exception as e:
+            errors[len(decoded)] = f"Invalid base64 image: {str(e)}"
+            decoded.append(None)
+
+
+@app.post("/api/embeddings/batch")
+async def extract_embeddings_batch(
+    files: List[UploadFile] = File(None),
+    images: List[str] = Form(None),
+):
+    files = files or []
+    images = images or []
+    total = len(files) + len(images)
+    if total == 0:
+        raise HTTPException(status_code=400, detail="files or images is required")
+    if total > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IMAGES} images per batch")
+    
+    decoded = []
+    errors = {}
+    for file in files:
+        try:
+            decoded.append(await read_upload(file))
+        except HTTPException as e:
+            errors[len(decoded)] = e.detail
+            decoded.append(None)
+    _decode_batch_base64(images, decoded, errors)
+    
+    return await _batch_embedding_response(decoded, errors)
+
+
+@app.post("/api/embeddings/batch/json")
+async def extract_embeddings_batch_json(request: BatchEmbeddingRequest):
+    if len(request.images) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IMAGES} images per batch")
+    
+    decoded = []
+    errors = {}
+    _decode_batch_base64(request.images, decoded, errors)
+    
+    return await _batch_embedding_response(decoded, errors)
+
+
+@app.post("/api/detect")
+async def detect_face(
+    file: UploadFile = File(...),
+    det_size: Optional[int] = Form(None, ge=DET_SIZE_MIN, le=DET_SIZE_MAX, multiple_of=32),
+):
+    file_bytes = await read_upload(file)
+    faces = await run_cached("detect", result_cache.key(file_bytes, det_size), face_service.detect_faces, file_bytes, det_size)
+    
+    return {"faces": faces, "count": len(faces)}
+
+
+@app.post("/api/detect/confidence")
+async def detect_face_with_confidence(
+    file: UploadFile = File(...),
+    det_size: Optional[int] = Form(None, ge=DET_SIZE_MIN, le=DET_SIZE_MAX, multiple_of=32),
+):
+    file_bytes = await read_upload(file)
+    faces = await run_cached(
+        "detect_confidence", result_cache.key(file_bytes, det_size), face_service.detect_faces_with_confidence, file_bytes, det_size
+    )
     
     return {"faces": faces, "count": len(faces)}
 
 
 @app.post("/api/libraries/{library_id}/members/base64")
-def add_member_by_base64(
+async def add_member_by_base64(
     library_id: int,
     request: Base64Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    library = db.query(FaceLibrary).filter(FaceLibrary.id == library_id).first()
+    library = await db.get(FaceLibrary, library_id)
     if not library:
         raise HTTPException(status_code=404, detail="Library not found")
     
     try:
-        file_path = decode_base64_image(request.image)
+        image_bytes = decode_base64_bytes(request.image)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
     
     try:
-        embedding, face_info = face_service.extract_embedding(str(file_path))
+        embedding, face_info = await inference_executor.run(face_service.extract_embedding, image_bytes, None, "enroll")
+    except HTTPException:
+        raise
     except Exception as e:
-        file_path.unlink(missing_ok=True)
         raise HTTPException(status_code=400, detail=f"Face extraction failed: {str(e)}")
     
-    embedding_str = json.dumps(embedding.tolist())
+    file_path = save_member_image(image_bytes, detect_image_ext(image_bytes))
+    embedding_blob = encode_embedding(embedding)
     
     member = FaceMember(
         record_id=str(uuid.uuid4()),
         library_id=library_id,
         name=request.name,
         embedding=float(np.linalg.norm(embedding)),
-        embedding_vector=embedding_str,
+        embedding_vector=embedding_blob,
+        embedding_model=get_model_name(),
         image_path=str(file_path)
     )
     db.add(member)
     try:
-        db.commit()
+        member_version = await db.scalar(bump_member_version(library_id))
+        await db.commit()
     except Exception:
         file_path.unlink(missing_ok=True)
-        db.rollback()
+        await db.rollback()
         raise
-    db.refresh(member)
+    await db.refresh(member)
+    await run_in_threadpool(embedding_cache.add_member, member, embedding, member_version)
     
     return {
         "id": member.id,
@@ -721,35 +1290,29 @@ def add_member_by_base64(
 
 
 @app.post("/api/search/base64")
-def search_face_by_base64(
+async def search_face_by_base64(
     library_id: int,
     request: Base64SearchRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    library = db.query(FaceLibrary).filter(FaceLibrary.id == library_id).first()
+    library = await db.get(FaceLibrary, library_id)
     if not library:
         raise HTTPException(status_code=404, detail="Library not found")
     
     try:
-        file_path = decode_base64_image(request.image)
+        image_bytes = decode_base64_bytes(request.image)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
     
+    query_key = result_cache.key(image_bytes, request.det_size)
     try:
-        query_embedding, face_info = face_service.extract_embedding(str(file_path))
+        query_embedding, face_info = await run_cached("embedding", query_key, face_service.extract_embedding, image_bytes, request.det_size)
+    except HTTPException:
+        raise
     except Exception as e:
-        file_path.unlink(missing_ok=True)
         raise HTTPException(status_code=400, detail=f"Face extraction failed: {str(e)}")
     
-    file_path.unlink(missing_ok=True)
-    
-    members = db.query(FaceMember).filter(FaceMember.library_id == library_id).all()
-    
-    member_ids = [m.id for m in members]
-    names = [m.name for m in members]
-    embeddings_matrix = np.array([json.loads(m.embedding_vector) for m in members])
-    
-    results = face_service.search_faces(query_embedding, embeddings_matrix, member_ids, names, request.top_k, request.threshold)
+    results = await inference_executor.run(search_library, library_id, query_embedding, request.top_k, request.threshold, query_key)
     
     return {
         "query_face": face_info,
@@ -758,70 +1321,196 @@ def search_face_by_base64(
 
 
 @app.post("/api/detect/base64")
-def detect_face_by_base64(request: Base64DetectRequest):
+async def detect_face_by_base64(request: Base64DetectRequest):
     try:
-        file_path = decode_base64_image(request.image)
+        image_bytes = decode_base64_bytes(request.image)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
     
-    try:
-        faces = face_service.detect_faces(str(file_path))
-    finally:
-        file_path.unlink(missing_ok=True)
+    faces = await run_cached("detect", result_cache.key(image_bytes, request.det_size), face_service.detect_faces, image_bytes, request.det_size)
     
     return {"faces": faces, "count": len(faces)}
 
 
 @app.post("/api/detect/confidence/base64")
-def detect_face_confidence_by_base64(request: Base64DetectRequest):
+async def detect_face_confidence_by_base64(request: Base64DetectRequest):
     try:
-        file_path = decode_base64_image(request.image)
+        image_bytes = decode_base64_bytes(request.image)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
     
-    try:
-        faces = face_service.detect_faces_with_confidence(str(file_path))
-    finally:
-        file_path.unlink(missing_ok=True)
+    faces = await run_cached(
+        "detect_confidence", result_cache.key(image_bytes, request.det_size), face_service.detect_faces_with_confidence,
+        image_bytes, request.det_size,
+    )
     
     return {"faces": faces, "count": len(faces)}
 
 
 @app.post("/api/compare")
-def compare_faces(
+async def compare_faces(
     image1: UploadFile = File(...),
     image2: UploadFile = File(...),
 ):
-    paths = []
     try:
-        for img in [image1, image2]:
-            file_bytes = img.file.read()
-            validate_upload(img.filename or "image.jpg", len(file_bytes), file_bytes)
-            file_ext = _get_file_ext(img.filename or "image.jpg") or 'jpg'
-            path = UPLOAD_DIR / f"{uuid.uuid4()}.{file_ext}"
-            with open(path, "wb") as f:
-                f.write(file_bytes)
-            paths.append(path)
-
-        result = face_service.compare_faces(str(paths[0]), str(paths[1]))
-        return result
+        images = [await read_upload(img) for img in [image1, image2]]
+        # 两张图的特征分别按内容哈希缓存，与检索接口共用
+        embeddings = [
+            (await run_cached("embedding", result_cache.key(image, None), face_service.extract_embedding, image, None))[0]
+            for image in images
+        ]
+        return FaceService.compare_embeddings(*embeddings)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        for p in paths:
-            p.unlink(missing_ok=True)
+
+
+MAX_STREAM_FRAMES = get_stream_config().get("max_frames", 300)
+
+
+def process_stream_frame(tracker: FaceTracker, libraries: dict, multi: bool, frame: bytes, top_k: int, threshold: float, det_size: Optional[int]) -> dict:
+    """在推理线程中执行：检测一帧并关联轨迹，只为新轨迹和质量提高的轨迹提取特征、检索人脸库。
+
+    与 /api/search 一样按 search 阈值检查人脸质量，不达标的轨迹本帧不识别，沿用之前的身份，之后的帧再尝试。
+    """
+    img = FaceService._read_image(frame)
+    faces = face_service.detect_faces_with_confidence(img, det_size)
+    pending = [track for track in tracker.update(faces) if track.landmarks is not None]
+    recognized = []
+    if pending:
+        extracted = face_service.extract_embeddings_at(
+            img, [{"bbox": t.bbox, "landmarks": t.landmarks, "det_score": t.det_score} for t in pending], "search", "stream"
+        )
+        recognized = [(track, result["embedding"]) for track, result in zip(pending, extracted) if "embedding" in result]
+    if recognized:
+        embeddings = np.stack([embedding for _, embedding in recognized])
+        results = search_libraries_batch(libraries, embeddings, top_k, threshold, multi)
+        for (track, embedding), hits in zip(recognized, results):
+            tracker.recognized(track, embedding, hits)
+    metrics.inc("stream_faces_total", len(recognized), action="recognized")
+    metrics.inc("stream_faces_total", len(pending) - len(recognized), action="rejected")
+    metrics.inc("stream_faces_total", len(faces) - len(pending), action="tracked")
+    
+    return {
+        "frame": tracker.frame,
+        "faces": len(faces),
+        "recognized": len(recognized),
+        "rejected": len(pending) - len(recognized),
+        "tracks": [track.to_dict() for track in tracker.visible()],
+        "events": tracker.events(),
+    }
+
+
+async def run_stream_frame(tracker: FaceTracker, libraries: dict, multi: bool, frame: bytes, top_k: int, threshold: float, det_size: Optional[int]) -> dict:
+    """单帧失败 (无法解码、推理队列已满、推理出错等) 时返回 {'error'}，不影响后续帧。"""
+    try:
+        return await inference_executor.run(process_stream_frame, tracker, libraries, multi, frame, top_k, threshold, det_size)
+    except HTTPException as e:
+        return {"error": e.detail}
+    except ValueError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        # 推理进程崩溃等意外错误也只影响本帧，连接和跟踪状态保留
+        logger.exception("Stream frame failed")
+        return {"error": f"Frame processing failed: {str(e)}"}
+
+
+@app.websocket("/api/stream")
+async def stream_recognition(
+    websocket: WebSocket,
+    library_id: Optional[int] = None,
+    library_ids: Optional[str] = None,
+    top_k: int = Query(1, ge=1, le=1000),
+    threshold: float = Query(0.5, ge=0.0, le=1.0),
+    det_size: Optional[int] = Query(None, ge=DET_SIZE_MIN, le=DET_SIZE_MAX, multiple_of=32),
+):
+    """视频流识别。客户端按顺序发送帧：二进制消息为图片字节，文本消息为 {"image": base64}；
+    每帧回复一条 JSON (本帧的轨迹和事件)。发送 {"action": "end"} 结束所有轨迹，回复剩余事件后关闭连接。"""
+    # HTTP 中间件不处理 WebSocket，浏览器无法设置请求头时可以用 api_key 查询参数
+    if API_KEY and (websocket.headers.get("X-API-Key") or websocket.query_params.get("api_key")) != API_KEY:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    try:
+        async with AsyncSessionLocal() as db:
+            libraries = await resolve_search_libraries(db, library_id, library_ids)
+    except HTTPException as e:
+        await websocket.send_json({"error": e.detail})
+        await websocket.close(code=1008)
+        return
+    
+    tracker = FaceTracker.from_config()
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        frame = message.get("bytes")
+        if frame is None:
+            try:
+                payload = json.loads(message.get("text") or "")
+            except ValueError:
+                payload = None
+            if not isinstance(payload, dict):
+                await websocket.send_json({"error": "Expected a binary frame or a JSON object"})
+                continue
+            if payload.get("action") == "end":
+                await websocket.send_json({"frame": tracker.frame, "events": tracker.finish()})
+                await websocket.close()
+                return
+            try:
+                frame = decode_base64_bytes(payload.get("image") or "")
+            except HTTPException as e:
+                await websocket.send_json({"error": e.detail})
+                continue
+            except Exception as e:
+                await websocket.send_json({"error": f"Invalid base64 image: {str(e)}"})
+                continue
+        else:
+            try:
+                validate_upload("frame", len(frame), frame)
+            except HTTPException as e:
+                await websocket.send_json({"error": e.detail})
+                continue
+        
+        await websocket.send_json(await run_stream_frame(tracker, libraries, bool(library_ids), frame, top_k, threshold, det_size))
+
+
+@app.post("/api/stream/frames")
+async def stream_frames(
+    files: List[UploadFile] = File(...),
+    library_id: Optional[int] = Form(None),
+    library_ids: Optional[str] = Form(None),
+    top_k: int = Form(1, ge=1, le=1000),
+    threshold: float = Form(0.5),
+    det_size: Optional[int] = Form(None, ge=DET_SIZE_MIN, le=DET_SIZE_MAX, multiple_of=32),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """一次上传一段连续帧 (按上传顺序)，与 WebSocket 接口相同的跟踪识别，返回每帧结果和所有轨迹的汇总。"""
+    if len(files) > MAX_STREAM_FRAMES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_STREAM_FRAMES} frames per request")
+    libraries = await resolve_search_libraries(db, library_id, library_ids)
+    
+    tracker = FaceTracker.from_config()
+    frames = []
+    for file in files:
+        frames.append(await run_stream_frame(tracker, libraries, bool(library_ids), await read_upload(file), top_k, threshold, det_size))
+    
+    ended = [event for frame in frames for event in frame.get("events", []) if event["type"] == "track_ended"]
+    ended.extend(tracker.finish())
+    return {"count": len(frames), "frames": frames, "tracks": sorted(ended, key=lambda event: event["track_id"])}
 
 
 if __name__ == "__main__":
+    from config_loader import get_server_config, get_server_workers
     from database import DATABASE_URL
 
     import uvicorn
-    workers = 1
-    if DATABASE_URL and not DATABASE_URL.startswith("sqlite"):
-        workers = 4
-    else:
+    # uvicorn 的 reload 模式只运行一个 worker
+    reload = bool(get_server_config().get("reload", False))
+    workers = 1 if reload else get_server_workers()
+    if workers > 1 and DATABASE_URL.startswith("sqlite"):
         logger.warning("SQLite detected — forcing workers=1 to avoid 'database is locked' errors. Use PostgreSQL for multi-worker deployment.")
+        workers = 1
 
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers, reload=True)
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers, reload=reload)
@@ -0,0 +1,258 @@
+"""Prometheus 文本格式的运行指标。
+
+未开启 (metrics.enabled: false) 时 inc / observe / set 直接返回，time() 返回共享的空上下文，
+埋点只剩一次属性判断。指标在进程内累计；多 worker 或推理进程池部署时配置 multiprocess_dir，
+各进程每 flush_interval 秒把快照写入该目录，/metrics 汇总所有进程的文件后输出。
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from config_loader import BASE_DIR, get_metrics_config
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "face_"
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (类型, 名称, 说明, 标签, 桶)
+DEFINITIONS = [
+    ("counter", "http_requests_total", "HTTP 请求数", ("method", "route", "status"), None),
+    ("histogram", "http_request_seconds", "HTTP 请求总耗时", ("method", "route"), SECONDS_BUCKETS),
+    ("histogram", "stage_seconds", "各处理阶段耗时", ("stage",), SECONDS_BUCKETS),
+    ("histogram", "inference_batch_size", "每次送入识别模型的人脸数", (), (1, 2, 4, 8, 16, 32, 64, 128)),
+    ("histogram", "faces_per_image", "每张图片检测到的人脸数", (), (0, 1, 2, 3, 5, 10, 20, 50)),
+    ("histogram", "library_search_size", "每次检索的人脸库成员数", (), (100, 1000, 10000, 100000, 1000000, 10000000)),
+    ("counter", "result_cache_requests_total", "结果缓存查询次数", ("kind", "result"), None),
+    ("counter", "quality_rejected_total", "质量不达标、未送入识别模型的人脸数", ("purpose",), None),
+    ("counter", "stream_faces_total", "视频流中的人脸数，按重新识别 / 质量不达标 / 沿用轨迹身份区分", ("action",), None),
+    ("counter", "embedding_cache_requests_total", "人脸库特征矩阵缓存查询次数", ("result",), None),
+    ("gauge", "db_pool_connections", "数据库连接池连接数", ("engine", "state"), None),
+    ("gauge", "inference_executor_pending", "推理线程池中执行和排队的任务数", (), None),
+    ("counter", "inference_executor_rejected_total", "因推理队列已满被拒绝的请求数", (), None),
+]
+
+_NULL = nullcontext()
+
+
+class _Metric:
+    def __init__(self, kind: str, name: str, documentation: str, labels: Tuple[str, ...], buckets=None):
+        self.kind = kind
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # 标签值元组 -> 数值；直方图为 [各桶计数 (非累计，末项为 +Inf), 总和]
+        self.values = {}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+    def __init__(self, enabled: bool = False, directory: Optional[Path] = None, flush_interval: float = 1.0):
+        self.enabled = bool(enabled)
+        self.directory = directory
+        self.flush_interval = max(0.1, float(flush_interval))
+        self._metrics: Dict[str, _Metric] = {name: _Metric(kind, name, doc, labels, buckets) for kind, name, doc, labels, buckets in DEFINITIONS}
+        self._collectors = []
+        self._lock = threading.Lock()
+        if self.enabled and self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._start_flusher()
+            atexit.register(self.flush)
+            if hasattr(os, "register_at_fork"):
+                os.register_at_fork(after_in_child=self._after_fork)
+
+    def _key(self, metric: _Metric, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in metric.labels)
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        if not self.enabled:
+            return
+        metric = self._metrics[name]
+        key = self._key(metric, labels)
+        with self._lock:
+            metric.values[key] = metric.values.get(key, 0.0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        metric = self._metrics[name]
+        key = self._key(metric, labels)
+        with self._lock:
+            metric.values[key] = float(value)
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        metric = self._metrics[name]
+        key = self._key(metric, labels)
+        with self._lock:
+            state = metric.values.get(key)
+            if state is None:
+                state = metric.values[key] = [0] * (len(metric.buckets) + 1) + [0.0]
+            state[bisect.bisect_left(metric.buckets, value)] += 1
+            state[-1] += value
+
+    def time(self, stage: str):
+        """统计一个处理阶段的耗时：with metrics.time("detect"): ..."""
+        if not self.enabled:
+            return _NULL
+        return self._timer(stage)
+
+    @contextmanager
+    def _timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage)
+
+    def register_collector(self, collector: Callable[[], None]):
+        """注册导出前调用的函数，用于把连接池等状态 set 到仪表盘类指标。"""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, Dict[tuple, object]]:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                logger.debug("Metrics collector failed", exc_info=True)
+        with self._lock:
+            return {
+                name: {key: list(value) if isinstance(value, list) else value for key, value in metric.values.items()}
+                for name, metric in self._metrics.items()
+            }
+
+    # ---- 多进程汇总 ----
+
+    def _path(self, pid: int) -> Path:
+        return self.directory / f"{pid}.json"
+
+    def flush(self):
+        if self.directory is None:
+            return
+        data = {name: [[list(key), value] for key, value in values.items()] for name, values in self.snapshot().items()}
+        path = self._path(os.getpid())
+        tmp = path.with_suffix(".tmp")
+        try:
+            tmp.write_text(json.dumps(data))
+            os.replace(tmp, path)
+        except OSError:
+            logger.warning("Failed to write metrics snapshot %s", path, exc_info=True)
+
+    def _start_flusher(self):
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                self.flush()
+
+        threading.Thread(target=run, name="metrics-flusher", daemon=True).start()
+
+    def _after_fork(self):
+        # 子进程不继承父进程已累计的数值，否则汇总时重复计数
+        self._lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric.values = {}
+        self._start_flusher()
+
+    def _merged(self) -> Dict[str, Dict[tuple, object]]:
+        self.flush()
+        merged = {name: {} for name in self._metrics}
+        for path in self.directory.glob("*.json"):
+            try:
+                pid = int(path.stem)
+                data = json.loads(path.read_text())
+            except (ValueError, OSError):
+                continue
+            alive = _alive(pid)
+            for name, items in data.items():
+                metric = self._metrics.get(name)
+                if metric is None or (metric.kind == "gauge" and not alive):
+                    continue
+                values = merged[name]
+                for key, value in items:
+                    key = tuple(key)
+                    if metric.kind == "histogram":
+                        current = values.get(key)
+                        values[key] = value if current is None else [a + b for a, b in zip(current, value)]
+                    else:
+                        values[key] = values.get(key, 0.0) + value
+        return merged
+
+    def render(self) -> str:
+        """按 Prometheus 文本格式 (0.0.4) 输出所有指标。"""
+        data = self._merged() if self.directory is not None else self.snapshot()
+        lines = []
+        for name, metric in self._metrics.items():
+            values = data.get(name, {})
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for key, value in sorted(values.items()):
+                if metric.kind != "histogram":
+                    lines.append(f"{metric.name}{_format_labels(metric.labels, key)} {_format_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(metric.buckets) + ["+Inf"], value[:-1]):
+                    cumulative += count
+                    le = 'le="' + (bound if bound == "+Inf" else _format_number(bound)) + '"'
+                    lines.append(f"{metric.name}_bucket{_format_labels(metric.labels, key, le)} {cumulative}")
+                lines.append(f"{metric.name}_sum{_format_labels(metric.labels, key)} {_format_number(value[-1])}")
+                lines.append(f"{metric.name}_count{_format_labels(metric.labels, key)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def metrics_directory(config: Optional[dict] = None) -> Optional[Path]:
+    config = config if config is not None else get_metrics_config()
+    directory = config.get("multiprocess_dir") or ""
+    if not directory:
+        return None
+    path = Path(directory)
+    return path if path.is_absolute() else BASE_DIR / path
+
+
+def reset_metrics_directory():
+    """清空多进程指标目录；在启动 worker 之前调用，避免上次运行的计数被累加。"""
+    directory = metrics_directory()
+    if directory is None or not directory.exists():
+        return
+    for path in directory.glob("*.json"):
+        path.unlink(missing_ok=True)
+
+
+_metrics_config = get_metrics_config()
+metrics = Metrics(
+    enabled=_metrics_config.get("enabled", False),
+    directory=metrics_directory(_metrics_config),
+    flush_interval=_metrics_config.get("flush_interval", 1.0),
+)
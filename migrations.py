@@ -0,0 +1,153 @@
+"""数据库结构迁移。
+
+init_db() 在建表后调用 run_migrations()，每个迁移步骤都是幂等、可断点续跑的，
+也可以单独执行: python migrations.py
+startup.py 在启动 worker 之前执行一次；直接用 uvicorn --workers 启动时每个 worker 都会执行，
+建表和迁移在 migration_lock() 内串行进行，后进入的 worker 只做检查。
+"""
+import fcntl
+import logging
+from contextlib import contextmanager
+
+from sqlalchemy import inspect, text, Float, Integer, LargeBinary, String
+from sqlalchemy.engine import Engine
+
+from config_loader import get_model_name
+from embedding_codec import encode_embedding, decode_embedding
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 1000
+# PostgreSQL advisory lock 的键
+MIGRATION_LOCK_KEY = 0x66616365
+
+
+@contextmanager
+def migration_lock(engine: Engine):
+    """跨进程互斥：PostgreSQL 用会话级 advisory lock，SQLite 用数据库文件旁 .lock 文件上的 flock。"""
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        return
+    database = engine.url.database if engine.dialect.name == "sqlite" else None
+    if not database or database == ":memory:":
+        yield
+        return
+    with open(f"{database}.lock", "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _columns(engine: Engine, table: str) -> dict:
+    inspector = inspect(engine)
+    if table not in inspector.get_table_names():
+        return {}
+    return {c["name"]: c for c in inspector.get_columns(table)}
+
+
+def migrate_embedding_storage(engine: Engine, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """把 face_members.embedding_vector 从 JSON 文本转换为二进制 float32。
+
+    步骤: 新增临时二进制列 -> 分批回填 -> 删除旧列并重命名。
+    中途中断后再次执行会从未回填的行继续。返回本次转换的行数。
+    """
+    columns = _columns(engine, "face_members")
+    if not columns or "embedding_vector" not in columns:
+        return 0
+    if isinstance(columns["embedding_vector"]["type"], LargeBinary) and "embedding_vector_bin" not in columns:
+        return 0
+
+    blob_type = LargeBinary().compile(dialect=engine.dialect)
+    if "embedding_vector_bin" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE face_members ADD COLUMN embedding_vector_bin {blob_type}"))
+        logger.info("Migrating face_members.embedding_vector to binary storage")
+
+    converted = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, embedding_vector FROM face_members "
+                "WHERE embedding_vector_bin IS NULL ORDER BY id LIMIT :limit"
+            ), {"limit": batch_size}).fetchall()
+            if not rows:
+                break
+            conn.execute(
+                text("UPDATE face_members SET embedding_vector_bin = :blob WHERE id = :id"),
+                [{"id": row.id, "blob": encode_embedding(decode_embedding(row.embedding_vector))} for row in rows],
+            )
+        converted += len(rows)
+        logger.info(f"Converted {converted} embeddings")
+
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE face_members DROP COLUMN embedding_vector"))
+        conn.execute(text("ALTER TABLE face_members RENAME COLUMN embedding_vector_bin TO embedding_vector"))
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("ALTER TABLE face_members ALTER COLUMN embedding_vector SET NOT NULL"))
+    logger.info(f"Embedding storage migration finished, {converted} rows converted")
+    return converted
+
+
+def migrate_embedding_model_columns(engine: Engine, model_name: str) -> int:
+    """为 face_members 增加 embedding_model 及重新提取特征用的 staged_* 列。
+
+    已有成员的向量视为由当前配置的模型生成，回填 embedding_model。返回回填的行数。
+    """
+    columns = _columns(engine, "face_members")
+    if not columns:
+        return 0
+
+    new_columns = {
+        "embedding_model": String(100),
+        "staged_embedding": LargeBinary(),
+        "staged_embedding_norm": Float(),
+        "staged_model": String(100),
+    }
+    for name, column_type in new_columns.items():
+        if name not in columns:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE face_members ADD COLUMN {name} {column_type.compile(dialect=engine.dialect)}"))
+    if "embedding_model" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_face_members_embedding_model ON face_members (embedding_model)"))
+
+    with engine.begin() as conn:
+        backfilled = conn.execute(
+            text("UPDATE face_members SET embedding_model = :model WHERE embedding_model IS NULL"),
+            {"model": model_name},
+        ).rowcount
+    if backfilled:
+        logger.info(f"Recorded embedding model '{model_name}' for {backfilled} existing members")
+    return backfilled
+
+
+def migrate_library_member_version(engine: Engine) -> bool:
+    """为 face_libraries 增加 member_version 列 (成员版本号)，已有人脸库从 0 开始。返回是否新增了列。"""
+    columns = _columns(engine, "face_libraries")
+    if not columns or "member_version" in columns:
+        return False
+    column_type = Integer().compile(dialect=engine.dialect)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE face_libraries ADD COLUMN member_version {column_type} NOT NULL DEFAULT 0"))
+    logger.info("Added face_libraries.member_version")
+    return True
+
+
+def run_migrations(engine: Engine):
+    migrate_embedding_storage(engine)
+    migrate_embedding_model_columns(engine, get_model_name())
+    migrate_library_member_version(engine)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from database import engine
+    with migration_lock(engine):
+        run_migrations(engine)
@@ -0,0 +1,269 @@
+"""切换模型时重新提取人脸库成员的特征向量。
+
+流程:
+  1. 后台任务按成员 id 分批读取 image_path 中的原图，多线程并行用目标模型提取特征，
+     写入 staged_embedding / staged_model，不改动 embedding_vector，搜索继续使用旧向量。
+     每批单独提交，即检查点；任务中断或取消后重新提交会跳过已写入目标模型向量的成员。
+  2. 把 config.yaml 中 model.name 改为目标模型并重启服务。检索只使用与当前模型一致的向量
+     (见 embedding_cache.active_model_vectors)，重启后直接使用暂存向量，不会拿两个模型的向量比较。
+  3. 切换 (cut-over): 所有成员都已有目标模型向量后，一条 UPDATE 把 staged_* 换入
+     embedding_vector / embedding_model。目标模型不是当前模型时拒绝切换。
+
+限流: max_images_per_second 限制提取速率；yield_to_requests 开启时，本进程的推理队列中
+有排队请求就暂停提交新批次，让在线请求优先。
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import bindparam, func, or_, select, update
+
+from config_loader import get_model_name, get_reembed_config
+from database import SessionLocal, FaceLibrary, FaceMember, bump_member_version
+from embedding_cache import active_model_vectors, embedding_cache
+from embedding_codec import encode_embedding
+from face_service import FaceService, face_service
+from inference_executor import inference_executor
+from jobs import Job, job_registry
+
+logger = logging.getLogger(__name__)
+
+_services: Dict[str, FaceService] = {}
+_services_lock = threading.Lock()
+
+
+def get_model_service(model_name: str):
+    """目标模型即当前模型时复用在线服务，否则在本进程中单独加载一份。"""
+    if model_name == get_model_name():
+        return face_service
+    with _services_lock:
+        if model_name not in _services:
+            _services[model_name] = FaceService(model_name=model_name)
+        return _services[model_name]
+
+
+def _unconverted_filter(library_id: int, model_name: str):
+    return (
+        FaceMember.library_id == library_id,
+        or_(FaceMember.embedding_model.is_(None), FaceMember.embedding_model != model_name),
+        or_(FaceMember.staged_model.is_(None), FaceMember.staged_model != model_name),
+    )
+
+
+def _pending_filter(library_id: int, model_name: str):
+    """需要重新提取的成员。以特征向量录入的成员没有原图，无法重新提取，不计入。"""
+    return _unconverted_filter(library_id, model_name) + (FaceMember.image_path.is_not(None),)
+
+
+def _without_image(db, library_id: int, model_name: str) -> int:
+    """没有原图、也没有目标模型向量的成员数；切换后这些成员不参与检索，需用目标模型的向量重新录入。"""
+    return db.scalar(
+        select(func.count(FaceMember.id)).where(*_unconverted_filter(library_id, model_name), FaceMember.image_path.is_(None))
+    )
+
+
+def library_model_status(db, library_id: int) -> dict:
+    models = db.execute(
+        select(FaceMember.embedding_model, func.count(FaceMember.id))
+        .where(FaceMember.library_id == library_id)
+        .group_by(FaceMember.embedding_model)
+    ).all()
+    staged = db.execute(
+        select(FaceMember.staged_model, func.count(FaceMember.id))
+        .where(FaceMember.library_id == library_id, FaceMember.staged_model.is_not(None))
+        .group_by(FaceMember.staged_model)
+    ).all()
+    searchable, _ = active_model_vectors()
+    unsearchable = db.scalar(
+        select(func.count(FaceMember.id)).where(FaceMember.library_id == library_id, ~searchable)
+    )
+    return {
+        "library_id": library_id,
+        "active_model": get_model_name(),
+        "models": {name or "unknown": count for name, count in models},
+        "staged": {name: count for name, count in staged},
+        "unsearchable": unsearchable,
+    }
+
+
+def log_model_mismatch():
+    """启动时提示由其他模型生成向量的成员，这些成员与当前模型的查询向量不可比。"""
+    model_name = get_model_name()
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(FaceMember.library_id, FaceMember.embedding_model, func.count(FaceMember.id))
+            .where(FaceMember.embedding_model.is_not(None), FaceMember.embedding_model != model_name)
+            .group_by(FaceMember.library_id, FaceMember.embedding_model)
+        ).all()
+    for library_id, embedding_model, count in rows:
+        logger.warning(
+            f"Library {library_id} has {count} members embedded with '{embedding_model}' "
+            f"but the active model is '{model_name}'; members without a staged '{model_name}' embedding "
+            f"are excluded from search until the library is re-embedded"
+        )
+
+
+def cutover(library_id: int, model_name: str) -> dict:
+    """把已写入的目标模型向量换入 embedding_vector。仍有成员缺少目标模型向量时不切换；
+    model_name 不是当前查询模型时抛出 ValueError，需先修改 model.name 并重启服务。
+
+    没有原图的成员 (以特征向量录入) 不阻止切换，数量在 without_image 中报告。
+    """
+    if model_name != get_model_name():
+        raise ValueError(
+            f"Active model is '{get_model_name()}', set model.name to '{model_name}' and restart before cutting over"
+        )
+    with SessionLocal() as db:
+        remaining = db.scalar(select(func.count(FaceMember.id)).where(*_pending_filter(library_id, model_name)))
+        without_image = _without_image(db, library_id, model_name)
+        if remaining:
+            return {
+                "library_id": library_id, "model_name": model_name, "switched": 0, "remaining": remaining,
+                "without_image": without_image,
+            }
+        switched = db.execute(
+            update(FaceMember)
+            .where(FaceMember.library_id == library_id, FaceMember.staged_model == model_name)
+            .values(
+                embedding_vector=FaceMember.staged_embedding,
+                embedding=FaceMember.staged_embedding_norm,
+                embedding_model=FaceMember.staged_model,
+                staged_embedding=None,
+                staged_embedding_norm=None,
+                staged_model=None,
+                updated_at=func.now(),
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.execute(bump_member_version(library_id))
+        db.commit()
+    # 所有向量都已更换，磁盘特征文件直接重新生成，不逐行追加
+    embedding_cache.invalidate(library_id, discard_store=True)
+    logger.info(f"Library {library_id} switched {switched} members to model '{model_name}'")
+    if without_image:
+        logger.warning(
+            f"Library {library_id} has {without_image} members without a stored image and no '{model_name}' embedding, "
+            f"they are excluded from search until enrolled again with a '{model_name}' embedding"
+        )
+    return {
+        "library_id": library_id, "model_name": model_name, "switched": switched, "remaining": 0,
+        "without_image": without_image,
+    }
+
+
+# 只写 staged_* 列，updated_at 显式保持原值。目标模型不是当前模型时不影响检索，不递增成员版本号，
+# 各进程的特征矩阵缓存继续有效；目标模型即当前模型时暂存向量会参与检索，由 _write 递增版本号
+_STAGE_STATEMENT = (
+    update(FaceMember.__table__)
+    .where(
+        FaceMember.__table__.c.id == bindparam("member_id"),
+        FaceMember.__table__.c.image_path == bindparam("source_path"),
+    )
+    .values(
+        staged_embedding=bindparam("blob"),
+        staged_embedding_norm=bindparam("norm"),
+        staged_model=bindparam("model"),
+        updated_at=FaceMember.__table__.c.updated_at,
+    )
+)
+
+
+class _Throttle:
+    def __init__(self, max_per_second: float, yield_to_requests: bool):
+        self.max_per_second = max_per_second
+        self.yield_to_requests = yield_to_requests
+        self._start = time.monotonic()
+        self._count = 0
+
+    def wait(self, job: Job, count: int):
+        if self.max_per_second > 0:
+            delay = self._start + self._count / self.max_per_second - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self._count += count
+        while self.yield_to_requests and inference_executor.stats()["queued"] > 0:
+            job.check_cancelled()
+            time.sleep(0.1)
+
+
+def _extract(service, rows: List) -> List[dict]:
+    return service.extract_embeddings_batch([row.image_path for row in rows], purpose=None)
+
+
+def _write(job: Job, library_id: int, model_name: str, rows: List, results: List[dict]):
+    params = []
+    for row, result in zip(rows, results):
+        if "error" in result:
+            job.add_failure(result["error"], member_id=row.id, image_path=row.image_path)
+            continue
+        embedding = result["embedding"]
+        params.append({
+            "member_id": row.id,
+            "source_path": row.image_path,
+            "blob": encode_embedding(embedding),
+            "norm": float(np.linalg.norm(embedding)),
+            "model": model_name,
+        })
+    if params:
+        with SessionLocal() as db:
+            db.execute(_STAGE_STATEMENT, params)
+            if model_name == get_model_name():
+                db.execute(bump_member_version(library_id))
+            db.commit()
+        # 图片在提取期间被替换的成员不会写入，下次运行时重新提取
+        job.add_success(len(params))
+
+
+@job_registry.handler("reembed")
+def reembed_library(job: Job, library_id: int, model_name: str, cutover_when_done: bool = False) -> dict:
+    config = get_reembed_config()
+    workers = max(1, int(config.get("workers", 2)))
+    batch_size = max(1, int(config.get("batch_size", 64)))
+    throttle = _Throttle(float(config.get("max_images_per_second", 0)), bool(config.get("yield_to_requests", True)))
+
+    with SessionLocal() as db:
+        if db.get(FaceLibrary, library_id) is None:
+            raise ValueError(f"Library {library_id} not found")
+        job.set_total(db.scalar(select(func.count(FaceMember.id)).where(*_pending_filter(library_id, model_name))))
+        without_image = _without_image(db, library_id, model_name)
+
+    service = get_model_service(model_name)
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reembed") as pool:
+        in_flight = deque()
+        while True:
+            job.check_cancelled()
+            with SessionLocal() as db:
+                rows = db.execute(
+                    select(FaceMember.id, FaceMember.image_path)
+                    .where(*_pending_filter(library_id, model_name), FaceMember.id > last_id)
+                    .order_by(FaceMember.id)
+                    .limit(batch_size)
+                ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            throttle.wait(job, len(rows))
+            in_flight.append((rows, pool.submit(_extract, service, rows)))
+            while len(in_flight) >= workers * 2:
+                done, future = in_flight.popleft()
+                _write(job, library_id, model_name, done, future.result())
+        while in_flight:
+            done, future = in_flight.popleft()
+            _write(job, library_id, model_name, done, future.result())
+
+    result = {
+        "library_id": library_id, "model_name": model_name, "staged": job.succeeded, "failed": job.failed,
+        "without_image": without_image,
+    }
+    if cutover_when_done:
+        try:
+            result["cutover"] = cutover(library_id, model_name)
+        except ValueError as e:
+            result["cutover"] = {"library_id": library_id, "model_name": model_name, "switched": 0, "error": str(e)}
+    return result
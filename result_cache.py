@@ -0,0 +1,83 @@
+"""相同图片重复请求的结果缓存。
+
+自助终端和客户端重试经常重复提交字节完全相同的图片，按图片内容哈希缓存检测结果、
+查询特征和检索结果，命中时跳过解码、检测和识别。检索结果的键还包含人脸库缓存条目的
+版本号 (见 embedding_cache)，成员变更后版本号递增，旧结果不会再被命中。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from config_loader import get_result_cache_config
+from metrics import metrics
+
+
+class ResultCache:
+    """按 (类别, 键) 缓存结果，条目数超过 max_entries 时按 LRU 淘汰，超过 ttl 秒视为过期。
+
+    缓存的值由调用方共享，取出后不得原地修改。
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 300.0, enabled: bool = True):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self.enabled = bool(enabled)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+
+    def key(self, data: bytes, *params) -> Optional[tuple]:
+        """图片内容哈希加请求参数组成的键；未开启缓存时返回 None，调用方据此跳过缓存。"""
+        if not self.enabled:
+            return None
+        return (hashlib.blake2b(data, digest_size=16).digest(), *params)
+
+    def get(self, kind: str, key) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get((kind, key))
+            if item is not None and item[0] <= now:
+                del self._entries[(kind, key)]
+                item = None
+            if item is None:
+                self._misses[kind] = self._misses.get(kind, 0) + 1
+            else:
+                self._entries.move_to_end((kind, key))
+                self._hits[kind] = self._hits.get(kind, 0) + 1
+        metrics.inc("result_cache_requests_total", kind=kind, result="miss" if item is None else "hit")
+        return None if item is None else item[1]
+
+    def put(self, kind: str, key, value):
+        with self._lock:
+            self._entries[(kind, key)] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end((kind, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            kinds = sorted(set(self._hits) | set(self._misses))
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "kinds": {
+                    kind: {"hits": self._hits.get(kind, 0), "misses": self._misses.get(kind, 0)} for kind in kinds
+                },
+            }
+
+
+_result_cache_config = get_result_cache_config()
+result_cache = ResultCache(
+    max_entries=_result_cache_config.get("max_entries", 4096),
+    ttl=_result_cache_config.get("ttl", 300),
+    enabled=_result_cache_config.get("enabled", True),
+)
@@ -138,6 +138,8 @@ def init_database():
         from sqlalchemy import inspect
 
         init_db()
+        # uvicorn worker 继承环境变量，不再各自执行迁移
+        os.environ["DB_INITIALIZED"] = "1"
 
         inspector = inspect(engine)
         tables = inspector.get_table_names()
@@ -171,19 +173,41 @@ def check_model_files():
         log_warn(f"模型检查警告: {str(e)}")
         return True
 
+def start_inference_pool():
+    """启动独立推理进程池（inference.pool.enabled）"""
+    from config_loader import get_inference_config
+
+    pool_config = get_inference_config().get("pool", {})
+    if not pool_config.get("enabled", False):
+        return None
+
+    log_step("启动推理进程池...")
+    try:
+        from inference_server import InferencePool
+
+        pool = InferencePool(pool_config)
+        pool.start()
+        log_success(f"推理进程池已就绪: {pool.settings['workers']} 个进程, 每个 {pool.settings['threads_per_worker']} 线程")
+        return pool
+    except Exception as e:
+        log_error(f"推理进程池启动失败: {str(e)}")
+        return None
+
 def start_server():
     """启动服务"""
     log_step("启动 FastAPI 服务...")
     
+    from config_loader import get_inference_config, get_server_workers
     from database import DATABASE_URL
 
     import uvicorn
     
-    workers = 1
-    if DATABASE_URL and not DATABASE_URL.startswith("sqlite"):
-        workers = 4
-    else:
+    workers = get_server_workers()
+    if workers > 1 and DATABASE_URL.startswith("sqlite"):
         log_warn("SQLite 模式 — 强制 workers=1 避免数据库锁冲突。生产环境建议使用 PostgreSQL。")
+        workers = 1
+    elif workers > 1 and not get_inference_config().get("pool", {}).get("enabled", False):
+        log_info(f"{workers} 个 worker 各自加载一份模型，可启用 inference.pool 共享推理进程")
     
     log_success("服务启动成功!")
     log_info("=" * 50)
@@ -235,6 +259,16 @@ def main():
     if not check_model_files():
         sys.exit(1)
     
+    # 清空上次运行留下的多进程指标快照
+    from metrics import reset_metrics_directory
+    reset_metrics_directory()
+    
+    # 推理进程池
+    from config_loader import get_inference_config
+    pool = start_inference_pool()
+    if pool is None and get_inference_config().get("pool", {}).get("enabled", False):
+        sys.exit(1)
+    
     print()
     log_success("所有检查通过！启动服务...")
     print()
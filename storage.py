@@ -0,0 +1,76 @@
+"""上传图片的校验与成员图片文件的存取。"""
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from config_loader import get_upload_config
+
+BASE_DIR = Path(__file__).parent.resolve()
+UPLOAD_DIR = BASE_DIR / "uploads"
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+_upload_config = get_upload_config()
+ALLOWED_EXTENSIONS = set(_upload_config.get("allowed_extensions", ["jpg", "jpeg", "png", "bmp"]))
+MAX_FILE_SIZE = _upload_config.get("max_file_size", 10 * 1024 * 1024)
+
+_MAGIC_BYTES = {
+    b'\xff\xd8\xff': ('jpg', 'jpeg'),
+    b'\x89PNG\r\n\x1a\n': ('png',),
+    b'BM': ('bmp',),
+}
+
+
+def is_path_in_upload_dir(path: Path) -> bool:
+    try:
+        return path.resolve().absolute().parts[:len(UPLOAD_DIR.parts)] == UPLOAD_DIR.parts
+    except (ValueError, OSError):
+        return False
+
+
+def get_file_ext(filename: str) -> str:
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+def validate_upload(filename: str, file_size: int, content: bytes):
+    ext = get_file_ext(filename)
+    if ext and ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"File type '.{ext}' not allowed")
+
+    if file_size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail=f"File exceeds max size of {MAX_FILE_SIZE} bytes")
+
+    if not content:
+        raise HTTPException(status_code=400, detail="Empty file")
+
+    matched = False
+    for magic, exts in _MAGIC_BYTES.items():
+        if content[:len(magic)] == magic:
+            if ext and ext not in exts:
+                raise HTTPException(status_code=400, detail="File extension does not match content type")
+            matched = True
+            break
+    if not matched:
+        raise HTTPException(status_code=400, detail="File is not a supported image format")
+
+
+def detect_image_ext(content: bytes) -> str:
+    for magic, exts in _MAGIC_BYTES.items():
+        if content[:len(magic)] == magic:
+            return exts[0]
+    return 'jpg'
+
+
+def save_member_image(file_bytes: bytes, file_ext: str) -> Path:
+    """只有需要保留的成员图片才写入 UPLOAD_DIR，检测/搜索/比对均直接在内存中解码。"""
+    file_path = UPLOAD_DIR / f"{uuid.uuid4()}.{file_ext}"
+    with open(file_path, "wb") as f:
+        f.write(file_bytes)
+    return file_path
+
+
+def remove_member_images(image_paths: List[Optional[str]]):
+    for image_path in image_paths:
+        if image_path and is_path_in_upload_dir(Path(image_path)):
+            Path(image_path).unlink(missing_ok=True)
@@ -0,0 +1,134 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from logging.handlers import QueueHandler
+
+import pytest
+from fastapi.testclient import TestClient
+
+import access_log
+from access_log import AccessLogMiddleware, install_queue_logging
+
+
+async def echo_app(scope, receive, send):
+    """读完整个请求体，返回其长度。"""
+    size = 0
+    while True:
+        message = await receive()
+        size += len(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    await send({"type": "http.response.start", "status": 201, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": str(size).encode()})
+
+
+def _client(**options):
+    return TestClient(AccessLogMiddleware(echo_app, **options))
+
+
+def _records(caplog) -> list:
+    return [record.getMessage() for record in caplog.records if record.name == "access"]
+
+
+def test_json_record_fields(caplog):
+    caplog.set_level(logging.INFO, logger="access")
+    response = _client(log_format="json").post("/api/search?x=1", content=b"abc", headers={"X-Request-ID": "req-1"})
+    assert response.status_code == 201 and response.text == "3"
+    assert response.headers["x-request-id"] == "req-1"
+
+    [message] = _records(caplog)
+    record = json.loads(message)
+    assert record.pop("duration_ms") >= 0
+    assert record == {
+        "request_id": "req-1", "method": "POST", "path": "/api/search", "status": 201,
+        "bytes_in": "3", "bytes_out": 1, "client": "testclient",
+    }
+
+
+def test_text_record_and_generated_request_id(caplog):
+    caplog.set_level(logging.INFO, logger="access")
+    response = _client().get("/health")
+    req_id = response.headers["x-request-id"]
+    assert len(req_id) == 8
+    [message] = _records(caplog)
+    assert message.startswith(f"[{req_id}] GET /health 201 | ")
+    assert message.endswith("| in=- out=1 | testclient")
+
+
+def test_sampled_body_is_truncated_and_redacted(caplog):
+    caplog.set_level(logging.INFO, logger="access")
+    image = "A" * 100
+    payload = json.dumps({"image": image, "top_k": 5}).encode()
+    client = _client(body_sample_rate=1.0, body_max_bytes=80, log_format="json")
+    response = client.post("/api/search/json", content=payload, headers={"Content-Type": "application/json"})
+    # 应用仍然收到完整请求体
+    assert response.text == str(len(payload))
+    body = json.loads(_records(caplog)[0])["body"]
+    assert body.startswith('{"image": "' + "A" * 30 + "...(truncated)")
+    assert body.endswith("...(body truncated)")
+    assert image not in body
+
+
+def test_binary_body_is_summarized(caplog):
+    caplog.set_level(logging.INFO, logger="access")
+    _client(body_sample_rate=1.0).post("/api/detect", content=b"\xff\xd8\xff" * 10, headers={"Content-Type": "image/jpeg"})
+    assert _records(caplog)[1].endswith("Body: <image/jpeg, 30 bytes>")
+
+
+def test_body_sampling(caplog, monkeypatch):
+    caplog.set_level(logging.INFO, logger="access")
+    draws = iter([0.2, 0.7])
+    monkeypatch.setattr(access_log.random, "random", lambda: next(draws))
+    client = _client(body_sample_rate=0.5, log_format="json")
+    for _ in range(2):
+        client.post("/api/search", content=b"x", headers={"Content-Type": "text/plain"})
+    # GET 请求不抽样，也不消耗随机数
+    client.get("/api/search")
+    assert ["body" in json.loads(message) for message in _records(caplog)] == [True, False, False]
+
+    caplog.clear()
+    _client(log_format="json").post("/api/search", content=b"x", headers={"Content-Type": "text/plain"})
+    assert "body" not in json.loads(_records(caplog)[0])
+
+
+class _SlowHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.threads = set()
+
+    def emit(self, record):
+        time.sleep(0.2)
+        self.threads.add(threading.current_thread().name)
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def root_handlers():
+    root = logging.getLogger()
+    saved = root.handlers[:]
+    root.handlers = []
+    yield root
+    root.handlers = saved
+
+
+def test_queue_logging_does_not_block(root_handlers):
+    handler = _SlowHandler()
+    root_handlers.addHandler(handler)
+    listener = install_queue_logging()
+    try:
+        assert [type(h) for h in root_handlers.handlers] == [QueueHandler]
+        # 再次调用不会重复包装
+        assert install_queue_logging() is None
+
+        start = time.perf_counter()
+        for i in range(5):
+            logging.getLogger("access").warning("request %d", i)
+        assert time.perf_counter() - start < 0.2
+    finally:
+        listener.stop()
+        atexit.unregister(listener.stop)
+    assert handler.messages == [f"request {i}" for i in range(5)]
+    assert threading.current_thread().name not in handler.threads
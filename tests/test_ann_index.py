@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from ann_index import ExactIndex, IVFIndex, create_index
+from topk import top_k_cosine
+
+
+def _unit(rows, dim=32, seed=0):
+    data = np.random.default_rng(seed).standard_normal((rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def _clustered(rows, clusters=20, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = _unit(clusters, dim, seed + 1)
+    data = centers[rng.integers(clusters, size=rows)] + 0.05 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def _assert_consistent(index, size):
+    """每一行恰好出现在 _assign 指向的倒排列表中一次。"""
+    rows = sorted(row for members in index._lists for row in members)
+    assert rows == list(range(size))
+    for list_id, members in enumerate(index._lists):
+        for row in members:
+            assert index._assign[row] == list_id
+
+
+def test_exact_index_has_no_candidates():
+    index = create_index({"type": "exact"})
+    assert type(index) is ExactIndex
+    assert index.candidates(_unit(1)[0]) is None
+
+
+def test_unknown_index_type():
+    with pytest.raises(ValueError):
+        create_index({"type": "hnsw"})
+
+
+def test_untrained_below_min_size():
+    index = IVFIndex(nlist=4, nprobe=1, min_size=100)
+    index.build(_unit(50))
+    assert not index.trained
+    assert index.candidates(_unit(1)[0]) is None
+
+
+def test_add_update_remove_keep_lists_consistent():
+    rng = np.random.default_rng(0)
+    capacity = 400
+    data = _unit(capacity, seed=1)
+    size = 200
+    index = IVFIndex(nlist=8, nprobe=2, min_size=100, retrain_factor=10)
+    index.build(data[:size])
+    assert index.trained
+    _assert_consistent(index, size)
+
+    for step in range(300):
+        action = rng.integers(3)
+        if action == 0 and size < capacity:
+            index.add(data[:size + 1], size)
+            size += 1
+        elif action == 1:
+            row = int(rng.integers(size))
+            data[row] = _unit(1, seed=1000 + step)[0]
+            index.update(data[:size], row)
+        elif size > 150:
+            row, last = int(rng.integers(size)), size - 1
+            data[row] = data[last]
+            index.remove(row, last)
+            size -= 1
+        _assert_consistent(index, size)
+
+
+def test_remove_below_min_size_resets():
+    data = _unit(101)
+    index = IVFIndex(nlist=4, nprobe=1, min_size=100)
+    index.build(data)
+    index.remove(0, 100)
+    assert index.trained
+    index.remove(0, 99)
+    assert not index.trained
+
+
+def test_retrains_after_growth():
+    data = _unit(64)
+    index = IVFIndex(nlist=4, nprobe=1, min_size=16, retrain_factor=2)
+    index.build(data[:16])
+    for row in range(16, 32):
+        index.add(data[:row + 1], row)
+    assert index.trained_size == 32
+    _assert_consistent(index, 32)
+
+
+def test_recall_on_clustered_data():
+    matrix = _clustered(5000)
+    queries = _clustered(50, seed=7)
+    index = IVFIndex(nlist=20, nprobe=4, min_size=1000)
+    index.build(matrix)
+    exact, _ = top_k_cosine(queries, matrix, 10)
+    hits = 0
+    for query, truth in zip(queries, exact):
+        candidates = index.candidates(query)
+        assert candidates is not None and len(candidates) < len(matrix)
+        found, _ = top_k_cosine(query, matrix[candidates], 10)
+        hits += len(set(candidates[found[0]]) & set(truth))
+    assert hits / exact.size >= 0.9
@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def _double(items):
+    return [item * 2 for item in items]
+
+
+def test_results_reach_their_callers():
+    batcher = MicroBatcher(_double, max_batch_size=8, max_wait_ms=5)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(batcher, range(200)))
+    assert results == [item * 2 for item in range(200)]
+    stats = batcher.stats()
+    assert stats["items"] == 200 and max(stats["batch_size_counts"]) <= 8
+
+
+def test_flushes_at_max_batch_size():
+    sizes = []
+    batcher = MicroBatcher(lambda items: sizes.append(len(items)) or _double(items), max_batch_size=4, max_wait_ms=10_000)
+    start = time.monotonic()
+    futures = [batcher.submit(item) for item in range(4)]
+    assert [future.result(timeout=5) for future in futures] == [0, 2, 4, 6]
+    # 批次满即执行，不等 max_wait
+    assert time.monotonic() - start < 5
+    assert sizes == [4]
+
+
+def test_flushes_after_max_wait():
+    batcher = MicroBatcher(_double, max_batch_size=100, max_wait_ms=50)
+    start = time.monotonic()
+    futures = [batcher.submit(item) for item in range(3)]
+    assert [future.result(timeout=5) for future in futures] == [0, 2, 4]
+    assert time.monotonic() - start >= 0.04
+    assert batcher.stats()["batch_size_counts"] == {3: 1}
+
+
+def test_exception_fails_only_its_batch():
+    def batch_fn(items):
+        if any(item < 0 for item in items):
+            raise ValueError("negative")
+        return _double(items)
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=2, max_wait_ms=10_000)
+    futures = [batcher.submit(item) for item in (1, -1, 2, 3)]
+    for future in futures[:2]:
+        with pytest.raises(ValueError, match="negative"):
+            future.result(timeout=5)
+    assert [future.result(timeout=5) for future in futures[2:]] == [4, 6]
+    # 批处理线程在异常后继续工作
+    futures = [batcher.submit(item) for item in (5, 6)]
+    assert [future.result(timeout=5) for future in futures] == [10, 12]
+
+
+def test_cancelled_future_is_skipped():
+    release = threading.Event()
+    seen = []
+
+    def batch_fn(items):
+        release.wait(5)
+        seen.append(list(items))
+        return _double(items)
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=1, max_wait_ms=0)
+    first = batcher.submit(1)
+    time.sleep(0.05)
+    cancelled, kept = batcher.submit(2), batcher.submit(3)
+    assert cancelled.cancel()
+    release.set()
+    assert (first.result(timeout=5), kept.result(timeout=5)) == (2, 6)
+    assert seen == [[1], [3]]
@@ -0,0 +1,162 @@
+import base64
+import json
+import uuid
+import zipfile
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import bulk_import
+import main
+import storage
+from bulk_import import FORMAT_NDJSON, FORMAT_ZIP, count_items, detect_format, iter_items
+from database import FaceLibrary, FaceMember
+from jobs import CANCELLED, COMPLETED, job_registry
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+JPG = b"\xff\xd8\xff" + b"\x00" * 32
+
+
+def _zip(tmp_path, entries):
+    path = tmp_path / "import.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def _ndjson(tmp_path, lines):
+    path = tmp_path / "import.ndjson"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def _record(name, data):
+    return json.dumps({"name": name, "image": base64.b64encode(data).decode()})
+
+
+def test_detect_format(tmp_path):
+    assert detect_format(_zip(tmp_path, {"a.jpg": JPG})) == FORMAT_ZIP
+    assert detect_format(_ndjson(tmp_path, ["  " + _record("a", JPG)])) == FORMAT_NDJSON
+    other = tmp_path / "other.bin"
+    other.write_bytes(b"not an import file")
+    with pytest.raises(ValueError):
+        detect_format(str(other))
+
+
+def test_zip_items(tmp_path):
+    path = _zip(tmp_path, {
+        "alice.jpg": JPG,
+        "bob/1.png": PNG,
+        "__MACOSX/bob/._1.png": b"junk",
+        ".hidden.jpg": JPG,
+        "notes.txt": b"ignored",
+    })
+    items = list(iter_items(path, FORMAT_ZIP))
+    assert count_items(path, FORMAT_ZIP) == len(items) == 2
+    assert [(item["index"], item["name"], item["source"], item["data"]) for item in items] == [
+        (0, "alice", "alice.jpg", JPG),
+        (1, "bob", "bob/1.png", PNG),
+    ]
+
+
+def test_zip_entry_over_size_limit_is_not_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_import, "MAX_FILE_SIZE", 16)
+    [item] = iter_items(_zip(tmp_path, {"big.jpg": JPG}), FORMAT_ZIP)
+    assert "data" not in item and "exceeds max size" in item["error"]
+
+
+def test_ndjson_items(tmp_path):
+    unpadded = base64.b64encode(PNG).decode().rstrip("=")
+    path = _ndjson(tmp_path, [
+        _record("alice", JPG),
+        "",
+        json.dumps({"name": "bob", "image": "data:image/png;base64," + unpadded}),
+        "{broken",
+        json.dumps({"name": "carol"}),
+    ])
+    items = list(iter_items(path, FORMAT_NDJSON))
+    assert count_items(path, FORMAT_NDJSON) == len(items) == 4
+    assert [item["index"] for item in items] == [0, 1, 2, 3]
+    assert items[0]["data"] == JPG and items[1]["data"] == PNG
+    assert items[1]["source"] == "line 3"
+    assert items[2]["error"].startswith("Invalid record") and items[2]["name"] is None
+    assert items[3]["error"].startswith("Invalid record") and items[3]["name"] == "carol"
+
+
+@pytest.fixture
+def library(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", tmp_path / "uploads")
+    (tmp_path / "uploads").mkdir()
+    row = FaceLibrary(name=f"lib-{uuid.uuid4().hex[:8]}")
+    db.add(row)
+    db.commit()
+    return row
+
+
+def _fake_extract(chunk):
+    rng = np.random.default_rng(0)
+    results = []
+    for item in chunk:
+        if item["data"].endswith(b"noface"):
+            results.append({"error": "No face detected"})
+        else:
+            embedding = rng.standard_normal(8).astype(np.float32)
+            results.append({"embedding": embedding / np.linalg.norm(embedding)})
+    return results
+
+
+def _run(library_id, path, fmt):
+    job = job_registry.create("bulk_import", {"library_id": library_id, "path": path, "format": fmt}, count_items(path, fmt))
+    job_registry._run(job_registry._claim())
+    return job_registry.get(job["id"])
+
+
+def test_partial_failure_report(library, db, tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_import, "_extract", _fake_extract)
+    path = _ndjson(tmp_path, [
+        _record("alice", JPG),
+        _record("", JPG),
+        _record("x" * 101, JPG),
+        _record("bob", b"GIF89a"),
+        "{broken",
+        _record("carol", JPG + b"noface"),
+        _record("dave", PNG),
+    ])
+    job = _run(library.id, path, FORMAT_NDJSON)
+
+    assert job["status"] == COMPLETED
+    assert (job["total"], job["processed"], job["succeeded"], job["failed"]) == (7, 7, 2, 5)
+    assert job["result"] == {"library_id": library.id, "imported": 2, "failed": 5}
+    failures = {failure["index"]: failure for failure in job["failures"]}
+    assert set(failures) == {1, 2, 3, 4, 5}
+    assert failures[1]["error"] == failures[2]["error"] == "Name must be 1-100 characters"
+    assert failures[3]["error"] == "File is not a supported image format"
+    assert failures[4]["error"].startswith("Invalid record") and failures[4]["source"] == "line 5"
+    assert failures[5] == {"index": 5, "name": "carol", "source": "line 6", "error": "No face detected"}
+
+    members = db.query(FaceMember).filter_by(library_id=library.id).order_by(FaceMember.name).all()
+    assert [member.name for member in members] == ["alice", "dave"]
+    assert len(list((tmp_path / "uploads").iterdir())) == 2
+    # 导入文件在任务结束后删除
+    assert not (tmp_path / "import.ndjson").exists()
+
+
+def test_upload_size_limit(library, monkeypatch):
+    monkeypatch.setattr(main, "MAX_BULK_UPLOAD_SIZE", 64)
+    client = TestClient(main.app)
+    response = client.post(f"/api/libraries/{library.id}/members/bulk", content=_record("a", JPG).encode())
+    assert response.status_code == 413
+    response = client.post(f"/api/libraries/{library.id}/members/bulk", content=b"")
+    assert response.status_code == 400
+
+
+def test_upload_counts_items(library):
+    client = TestClient(main.app)
+    body = ("\n".join(_record(f"m{i}", JPG) for i in range(3)) + "\n").encode()
+    response = client.post(f"/api/libraries/{library.id}/members/bulk", content=body)
+    assert response.status_code == 202
+    assert response.json()["total"] == 3
+    # 取消等待中的任务会删除已上传的临时文件
+    assert job_registry.cancel(response.json()["job_id"])["status"] == CANCELLED
@@ -0,0 +1,100 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from database import FaceLibrary, FaceMember, bump_member_version
+from embedding_cache import EmbeddingCache, LibraryMatrix
+from embedding_codec import encode_embedding
+
+
+def _unit(rows, dim=32, seed=0):
+    data = np.random.default_rng(seed).standard_normal((rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def library(db):
+    row = FaceLibrary(name=f"lib-{uuid.uuid4().hex[:8]}")
+    db.add(row)
+    db.commit()
+    return row
+
+
+def _add(db, library, name, vector):
+    member = FaceMember(
+        record_id=str(uuid.uuid4()), library_id=library.id, name=name,
+        embedding=float(np.linalg.norm(vector)), embedding_vector=encode_embedding(vector, "float32"),
+    )
+    db.add(member)
+    db.flush()
+    version = db.scalar(bump_member_version(library.id))
+    db.commit()
+    return member, version
+
+
+def _contents(cache, db, library_id):
+    with cache.read(db, library_id) as entry:
+        return entry, dict(zip(entry.member_ids, entry.matrix.copy()))
+
+
+def test_library_matrix_grows_from_empty():
+    entry = LibraryMatrix.from_rows([], [], np.empty((0, 0), dtype=np.float32), [])
+    vectors = _unit(40)
+    for i, vector in enumerate(vectors):
+        entry.add(i, f"m{i}", vector, 0.0)
+    assert entry.size == 40 and entry.dim == 32
+    np.testing.assert_allclose(entry.matrix, vectors, atol=1e-6)
+
+    entry.remove(0)
+    assert entry.size == 39 and entry.member_ids[0] == 39
+    np.testing.assert_allclose(entry.matrix[0], vectors[39], atol=1e-6)
+
+
+def test_local_changes_update_cached_matrix_in_place(db, library):
+    cache = EmbeddingCache(max_bytes=1 << 26)
+    vectors = _unit(3)
+    members = [_add(db, library, f"m{i}", v)[0] for i, v in enumerate(vectors)]
+    entry, rows = _contents(cache, db, library.id)
+    assert sorted(rows) == sorted(m.id for m in members)
+
+    member, version = _add(db, library, "new", vectors[0])
+    cache.add_member(member, vectors[0], version)
+    same, rows = _contents(cache, db, library.id)
+    assert same is entry and member.id in rows
+
+    db.delete(members[1])
+    version = db.scalar(bump_member_version(library.id))
+    db.commit()
+    cache.remove_member(library.id, members[1].id, version)
+    same, rows = _contents(cache, db, library.id)
+    assert same is entry and members[1].id not in rows and entry.member_version == version
+
+
+def test_changes_from_other_processes_are_loaded(db, library):
+    local, other = EmbeddingCache(max_bytes=1 << 26), EmbeddingCache(max_bytes=1 << 26)
+    vectors = _unit(2)
+    _add(db, library, "a", vectors[0])
+    _, rows = _contents(other, db, library.id)
+    assert len(rows) == 1
+
+    member, version = _add(db, library, "b", vectors[1])
+    local.add_member(member, vectors[1], version)
+    _, rows = _contents(other, db, library.id)
+    assert member.id in rows
+    np.testing.assert_allclose(rows[member.id], vectors[1], atol=1e-6)
+
+
+def test_version_gap_drops_cached_matrix(db, library):
+    cache = EmbeddingCache(max_bytes=1 << 26)
+    vectors = _unit(3)
+    _add(db, library, "a", vectors[0])
+    entry, _ = _contents(cache, db, library.id)
+
+    # 绕过 add_member 写入的成员，本进程缓存没有见到这次变更
+    skipped, _ = _add(db, library, "b", vectors[1])
+    member, version = _add(db, library, "c", vectors[2])
+    cache.add_member(member, vectors[2], version)
+    reloaded, rows = _contents(cache, db, library.id)
+    assert reloaded is not entry
+    assert {skipped.id, member.id} <= set(rows)
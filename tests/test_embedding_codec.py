@@ -0,0 +1,103 @@
+import base64
+import json
+
+import numpy as np
+import pytest
+
+from embedding_codec import decode_embedding, decode_embeddings, encode_embedding, parse_embedding, quantize_int8
+
+
+def _vectors(rows, dim=512, seed=0):
+    return np.random.default_rng(seed).standard_normal((rows, dim)).astype(np.float32)
+
+
+def test_float32_round_trip():
+    vector = _vectors(1)[0]
+    blob = encode_embedding(vector, "float32")
+    assert len(blob) == 8 + 512 * 4
+    np.testing.assert_array_equal(decode_embedding(blob), vector)
+
+
+def test_legacy_json_text():
+    vector = _vectors(1, dim=8)[0]
+    decoded = decode_embedding(json.dumps(vector.tolist()))
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, vector)
+
+
+def test_invalid_header():
+    blob = bytearray(encode_embedding(_vectors(1, dim=4)[0], "float32"))
+    blob[:2] = b"XX"
+    with pytest.raises(ValueError):
+        decode_embedding(bytes(blob))
+
+
+def test_batch_decode_matches_single():
+    vectors = _vectors(20)
+    blobs = [encode_embedding(v, "float32") for v in vectors]
+    np.testing.assert_array_equal(decode_embeddings(blobs), vectors)
+
+
+def test_batch_decode_mixed_formats():
+    vectors = _vectors(3, dim=16)
+    blobs = [encode_embedding(vectors[0], "float32"), json.dumps(vectors[1].tolist()), encode_embedding(vectors[2], "float32")]
+    np.testing.assert_allclose(decode_embeddings(blobs), vectors, rtol=1e-6)
+    assert decode_embeddings([]).shape == (0, 0)
+
+
+def test_float16_round_trip():
+    vector = _vectors(1)[0]
+    blob = encode_embedding(vector, "float16")
+    assert len(blob) == 8 + 512 * 2
+    np.testing.assert_array_equal(decode_embedding(blob), vector.astype(np.float16).astype(np.float32))
+
+
+def test_int8_round_trip():
+    vector = _vectors(1)[0]
+    blob = encode_embedding(vector, "int8")
+    assert len(blob) == 8 + 4 + 512
+    decoded = decode_embedding(blob)
+    # 对称量化的误差不超过半个量化步长
+    step = np.abs(vector).max() / 127
+    assert np.abs(decoded - vector).max() <= step / 2 + 1e-6
+    cosine = decoded @ vector / np.linalg.norm(decoded) / np.linalg.norm(vector)
+    assert cosine > 0.999
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_batch_decode_quantized(dtype):
+    vectors = _vectors(10)
+    blobs = [encode_embedding(v, dtype) for v in vectors]
+    expected = np.stack([decode_embedding(b) for b in blobs])
+    np.testing.assert_array_equal(decode_embeddings(blobs), expected)
+
+
+def test_quantize_int8_zero_row():
+    quantized, scales = quantize_int8(np.zeros((2, 4), dtype=np.float32))
+    assert not quantized.any()
+    np.testing.assert_array_equal(scales, [1, 1])
+
+
+def test_unsupported_dtype():
+    with pytest.raises(ValueError):
+        encode_embedding(_vectors(1, dim=4)[0], "float64")
+
+
+def test_parse_embedding_list_and_base64():
+    vector = _vectors(1, dim=16)[0]
+    np.testing.assert_array_equal(parse_embedding(vector.tolist()), vector)
+    encoded = base64.b64encode(vector.astype("<f4").tobytes()).decode()
+    np.testing.assert_array_equal(parse_embedding(encoded), vector)
+
+
+@pytest.mark.parametrize("value", [
+    "not base64!",
+    base64.b64encode(b"abc").decode(),
+    [],
+    [0.0, 0.0],
+    [1.0, float("nan")],
+    [0.1] * 4097,
+])
+def test_parse_embedding_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_embedding(value)
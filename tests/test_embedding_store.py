@@ -0,0 +1,191 @@
+import uuid
+
+import numpy as np
+import pytest
+
+import embedding_cache
+import embedding_store
+from ann_index import IVFIndex
+from database import FaceLibrary, FaceMember, bump_member_version
+from embedding_cache import EmbeddingCache
+from embedding_codec import encode_embedding
+from face_service import FaceService
+from embedding_store import RECORD, LibraryStore
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, "store_root", lambda: tmp_path)
+    return tmp_path
+
+
+def _rows(ids, dim=8, seed=0):
+    records = np.zeros(len(ids), dtype=RECORD)
+    records["member_id"] = ids
+    records["stamp"] = np.arange(len(ids), dtype=np.float64)
+    vectors = np.random.default_rng(seed).standard_normal((len(ids), dim)).astype(np.float32)
+    return records, vectors
+
+
+def _create(store, ids, dtype=np.float32):
+    records, vectors = _rows(ids)
+    with store.lock():
+        view = store.write_generation(dtype, [(records[:2], vectors[:2]), (records[2:], vectors[2:])])
+        store.activate(view.generation)
+    return vectors
+
+
+def test_write_and_open(root):
+    store = LibraryStore(1)
+    assert store.open() is None
+    vectors = _create(store, [10, 11, 12, 13])
+    view = store.open()
+    assert view.count == 4 and view.dim == 8 and view.dtype == np.float32
+    assert view.records["member_id"].tolist() == [10, 11, 12, 13]
+    np.testing.assert_array_equal(view.vectors, vectors)
+    assert not view.tombstones().any()
+
+
+def test_append_is_visible_to_new_views_only(root):
+    store = LibraryStore(1)
+    _create(store, [1, 2, 3])
+    old = store.open()
+    records, vectors = _rows([4, 5], seed=1)
+    with store.lock():
+        store.append(store.open(), records, vectors)
+    assert old.count == 3 and old.appended()
+    view = store.open()
+    assert view.count == 5 and not view.appended()
+    np.testing.assert_array_equal(view.vectors[3:], vectors)
+
+
+def test_append_to_empty_generation_sets_dim(root):
+    store = LibraryStore(1)
+    with store.lock():
+        view = store.write_generation(np.float16, [])
+        store.activate(view.generation)
+    assert store.open().count == 0
+    records, vectors = _rows([7])
+    with store.lock():
+        store.append(store.open(), records, vectors)
+    view = store.open()
+    assert view.count == 1 and view.dim == 8 and view.dtype == np.float16
+    np.testing.assert_array_equal(view.vectors[0], vectors[0].astype(np.float16))
+
+
+def test_tombstones(root):
+    store = LibraryStore(1)
+    _create(store, list(range(20)))
+    with store.lock():
+        view = store.open()
+        store.tombstone(view, [0, 9], view.count)
+        store.tombstone(view, [17], view.count)
+    assert np.flatnonzero(store.open().tombstones()).tolist() == [0, 9, 17]
+
+
+def test_activate_removes_old_generations(root):
+    store = LibraryStore(1)
+    _create(store, [1, 2, 3])
+    first = store.generation()
+    _create(store, [4, 5, 6])
+    assert store.generation() != first
+    assert [p.name for p in store.directory.iterdir() if p.name.startswith("gen-")] == [f"gen-{store.generation()}"]
+    store.drop()
+    assert store.generation() is None and store.open() is None
+
+
+def test_compact_keeps_live_rows(root):
+    store = LibraryStore(1)
+    vectors = _create(store, list(range(10)))
+    with store.lock():
+        view = store.open()
+        store.tombstone(view, [1, 4, 5], view.count)
+    generation = store.generation()
+
+    result = EmbeddingCache(max_bytes=1 << 20).compact(1)
+    assert result == {"library_id": 1, "rows": 7, "removed": 3}
+    view = store.open()
+    assert view.generation != generation
+    live = [0, 2, 3, 6, 7, 8, 9]
+    assert view.records["member_id"].tolist() == live
+    np.testing.assert_array_equal(view.vectors, vectors[live])
+    assert not view.tombstones().any()
+
+
+def test_compact_missing_store(root):
+    assert EmbeddingCache(max_bytes=1 << 20).compact(99) == {"library_id": 99, "rows": 0, "removed": 0}
+
+
+def test_cache_writes_member_changes_to_store(root, db):
+    library = FaceLibrary(name="store")
+    db.add(library)
+    db.commit()
+    _, vectors = _rows([0, 1, 2])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    members = []
+    for i in range(2):
+        member = FaceMember(record_id=str(uuid.uuid4()), library_id=library.id, name=f"m{i}",
+                            embedding=1.0, embedding_vector=encode_embedding(vectors[i], "float32"))
+        db.add(member)
+        members.append(member)
+    db.flush()
+    db.scalar(bump_member_version(library.id))
+    db.commit()
+
+    cache = EmbeddingCache(max_bytes=1 << 20, store_config={"enabled": True})
+    with cache.read(db, library.id) as entry:
+        assert sorted(entry.member_ids) == sorted(m.id for m in members)
+
+    # 更新追加新行并把旧行标记删除
+    members[0].embedding_vector = encode_embedding(vectors[2], "float32")
+    version = db.scalar(bump_member_version(library.id))
+    db.commit()
+    cache.update_member(members[0], vectors[2], version)
+    view = LibraryStore(library.id).open()
+    assert view.count == 3
+    assert view.tombstones().tolist() == [True, False, False]
+
+    db.delete(members[1])
+    version = db.scalar(bump_member_version(library.id))
+    db.commit()
+    cache.remove_member(library.id, members[1].id, version)
+    with cache.read(db, library.id) as entry:
+        live = np.flatnonzero(~entry.deleted).tolist()
+        assert entry.size == 1
+        assert [entry.member_ids[i] for i in live] == [members[0].id]
+        np.testing.assert_allclose(entry.matrix[live[0]], vectors[2], atol=1e-6)
+
+
+def test_mapped_library_with_ivf_places_each_row_once(root, db, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "create_index", lambda: IVFIndex(nlist=8, nprobe=4, min_size=100))
+    library = FaceLibrary(name="ivf")
+    db.add(library)
+    db.commit()
+    vectors = np.random.default_rng(0).standard_normal((160, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def add(rows):
+        members = [FaceMember(record_id=str(uuid.uuid4()), library_id=library.id, name=f"m{i}",
+                              embedding=1.0, embedding_vector=encode_embedding(vectors[i], "float32")) for i in rows]
+        db.add_all(members)
+        db.flush()
+        version = db.scalar(bump_member_version(library.id))
+        db.commit()
+        return members, version
+
+    cache = EmbeddingCache(max_bytes=1 << 20, store_config={"enabled": True})
+    add(range(60))
+    with cache.read(db, library.id) as entry:
+        assert not entry.index.trained
+
+    # 本进程追加的行在下次读取时一次映射，跨过 min_size 时只训练一次
+    for i in range(60, 160):
+        members, version = add([i])
+        cache.add_member(members[0], vectors[i], version)
+    with cache.read(db, library.id) as entry:
+        assert entry.index.trained
+        assert sorted(row for rows in entry.index._lists for row in rows) == list(range(160))
+        hits = FaceService.search_faces(vectors[5], entry.matrix, entry.member_ids, entry.names, top_k=50,
+                                        threshold=-1.0, normalized=True, index=entry.index, deleted=entry.deleted)
+    ids = [hit["member_id"] for hit in hits]
+    assert len(ids) == len(set(ids))
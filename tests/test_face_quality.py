@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import face_quality
+from face_quality import assess, blur_variance, estimate_pose, quality_issues, quality_score
+
+# ArcFace 112x112 对齐模板的 5 个关键点，正脸
+TEMPLATE = np.array([[38.29, 51.70], [73.53, 51.50], [56.03, 71.74], [41.55, 92.37], [70.73, 92.20]])
+
+
+def _rotate(kps, degrees):
+    angle = np.radians(degrees)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    center = kps.mean(axis=0)
+    return (kps - center) @ rotation.T + center
+
+
+def test_frontal_template():
+    yaw, pitch, roll = estimate_pose(TEMPLATE)
+    assert abs(yaw) < 3 and abs(pitch) < 3 and abs(roll) < 1
+
+
+def test_nose_shift_changes_yaw_and_pitch():
+    right = TEMPLATE.copy()
+    right[2, 0] += 10
+    yaw, pitch, _ = estimate_pose(right)
+    assert 25 < yaw < 45 and abs(pitch) < 5
+
+    down = TEMPLATE.copy()
+    down[2, 1] += 10
+    yaw, pitch, _ = estimate_pose(down)
+    assert 20 < pitch < 40 and abs(yaw) < 5
+
+
+def test_pose_is_invariant_to_in_plane_rotation():
+    shifted = TEMPLATE.copy()
+    shifted[2, 0] += 10
+    expected = estimate_pose(shifted)
+    yaw, pitch, roll = estimate_pose(_rotate(shifted, 30))
+    assert yaw == pytest.approx(expected[0], abs=0.5)
+    assert pitch == pytest.approx(expected[1], abs=0.5)
+    assert roll == pytest.approx(expected[2] + 30, abs=0.5)
+
+
+def test_blur_variance_prefers_sharp_crops():
+    rng = np.random.default_rng(0)
+    sharp = rng.integers(0, 256, (112, 112, 3), dtype=np.uint8)
+    flat = np.full((112, 112, 3), 128, dtype=np.uint8)
+    assert blur_variance(flat) == 0
+    assert blur_variance(sharp) > 1000
+
+
+def test_quality_score():
+    bbox = [0, 0, 100, 80]
+    assert quality_score(bbox, None, 0.5) == pytest.approx(40)
+    assert quality_score(bbox, TEMPLATE, 0.5) == pytest.approx(40, rel=0.01)
+    turned = TEMPLATE.copy()
+    turned[2, 0] += 10
+    assert quality_score(bbox, turned, 0.5) < 35
+
+
+def test_assess_and_issues():
+    turned = TEMPLATE.copy()
+    turned[2, 0] += 10
+    quality = assess([0, 0, 50, 60], turned, 0.6, crop=np.full((112, 112, 3), 128, dtype=np.uint8))
+    assert quality["size"] == 50 and quality["det_score"] == 0.6 and quality["blur"] == 0
+    thresholds = {"min_det_score": 0.5, "min_face_size": 64, "min_blur": 10, "max_yaw": 30, "max_pitch": 0}
+    issues = quality_issues(quality, thresholds)
+    assert issues == ["size 50.0 < 64", "blur 0.0 < 10", f"yaw {quality['yaw']} exceeds 30"]
+    assert quality_issues(quality, {}) == []
+
+
+def test_thresholds_from_config(monkeypatch):
+    config = {"enabled": True, "enroll": {"min_face_size": 80}, "face_selection": "best"}
+    monkeypatch.setattr(face_quality, "get_quality_config", lambda: config)
+    assert face_quality.get_quality_thresholds() == {"enroll": {"min_face_size": 80}, "search": {}}
+    assert face_quality.get_face_selection() == "best"
+
+    config["enabled"] = False
+    assert face_quality.get_quality_thresholds() == {}
+    config["face_selection"] = "first"
+    with pytest.raises(ValueError):
+        face_quality.get_face_selection()
@@ -0,0 +1,139 @@
+import asyncio
+
+import numpy as np
+
+import main
+from face_tracker import FaceTracker, iou_matrix
+
+# ArcFace 112x112 对齐模板的 5 个关键点，正脸
+TEMPLATE = np.array([[38.29, 51.70], [73.53, 51.50], [56.03, 71.74], [41.55, 92.37], [70.73, 92.20]])
+
+
+def _face(x, y, size=100, det_score=0.9):
+    return {
+        "bbox": [x, y, x + size, y + size],
+        "landmarks": (TEMPLATE * size / 112 + [x, y]).tolist(),
+        "det_score": det_score,
+    }
+
+
+def _embedding(seed, dim=16):
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def _hit(member_id):
+    return [{"library_id": 1, "member_id": member_id, "similarity": 0.8}]
+
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10], [0, 0, 0, 0]], dtype=np.float32)
+    b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]], dtype=np.float32)
+    np.testing.assert_allclose(iou_matrix(a, b), [[1, 1 / 3, 0], [0, 0, 0]], atol=1e-6)
+
+
+def test_associates_moving_faces_and_skips_recognition():
+    tracker = FaceTracker(min_hits=2)
+    pending = tracker.update([_face(0, 0), _face(300, 0)])
+    assert len(pending) == 2
+    for i, track in enumerate(pending):
+        tracker.recognized(track, _embedding(i), _hit(i))
+
+    # 位置小幅移动、质量不变：沿用原轨迹，不需要重新识别
+    assert tracker.update([_face(305, 2), _face(5, 3)]) == []
+    assert [t.track_id for t in tracker.visible()] == [1, 2]
+    assert tracker.tracks[0].bbox == [5, 3, 105, 103]
+
+
+def test_quality_gain_triggers_recognition():
+    tracker = FaceTracker(quality_gain=0.2)
+    track = tracker.update([_face(0, 0, size=60)])[0]
+    tracker.recognized(track, _embedding(0), _hit(1))
+    assert tracker.update([_face(0, 0, size=64)]) == []
+    assert tracker.update([_face(0, 0, size=80)]) == [track]
+
+
+def test_identity_events_after_min_hits():
+    tracker = FaceTracker(min_hits=2)
+    track = tracker.update([_face(0, 0)])[0]
+    tracker.recognized(track, _embedding(0), _hit(7))
+    assert tracker.events() == []
+
+    tracker.update([_face(2, 0)])
+    events = tracker.events()
+    assert [(e["type"], e["track_id"], e["identity"]["member_id"]) for e in events] == [("identity", 1, 7)]
+
+    tracker.update([_face(4, 0)])
+    assert tracker.events() == []
+    tracker.recognized(track, _embedding(0), _hit(8))
+    tracker.update([_face(6, 0)])
+    assert [e["identity"]["member_id"] for e in tracker.events()] == [8]
+
+
+def test_lost_track_ends_after_reid_window():
+    tracker = FaceTracker(max_missed_frames=1, reid_frames=2, min_hits=1)
+    track = tracker.update([_face(0, 0)])[0]
+    tracker.recognized(track, _embedding(0), _hit(1))
+    tracker.events()
+    tracker.update([])
+    tracker.update([])
+    assert tracker.tracks == [] and tracker.lost == [track]
+    for _ in range(3):
+        tracker.update([])
+    events = tracker.events()
+    assert tracker.lost == []
+    assert [(e["type"], e["track_id"], e["frames"]) for e in events] == [("track_ended", 1, 1)]
+
+
+def test_reidentifies_lost_track():
+    tracker = FaceTracker(max_missed_frames=1, reid_frames=10, reid_similarity=0.9)
+    track = tracker.update([_face(0, 0)])[0]
+    tracker.recognized(track, _embedding(0), _hit(1))
+    for _ in range(3):
+        tracker.update([])
+    assert tracker.lost == [track]
+
+    # 在别处重新出现，特征相同：恢复原轨迹
+    new = tracker.update([_face(400, 0)])[0]
+    assert new is not track
+    tracker.recognized(new, _embedding(0), _hit(1))
+    assert tracker.lost == [] and tracker.tracks == [track]
+    assert track.hits == 2 and track.bbox == [400, 0, 500, 100]
+
+    # 特征不同的新面孔不会接管
+    tracker.update([])
+    tracker.update([])
+    stranger = tracker.update([_face(0, 300)])[0]
+    tracker.recognized(stranger, _embedding(1), _hit(2))
+    assert stranger in tracker.tracks and track in tracker.lost
+
+
+def test_finish_ends_all_tracks():
+    tracker = FaceTracker(min_hits=1)
+    for track in tracker.update([_face(0, 0), _face(300, 0)]):
+        tracker.recognized(track, _embedding(track.track_id), [])
+    events = tracker.finish()
+    assert [e["type"] for e in events] == ["identity", "identity", "track_ended", "track_ended"]
+    assert events[0]["identity"] is None
+    assert tracker.tracks == [] and tracker.lost == []
+
+
+def test_from_config():
+    tracker = FaceTracker.from_config({"iou_threshold": 0.5, "min_hits": 0})
+    assert tracker.iou_threshold == 0.5 and tracker.min_hits == 1
+
+
+def test_stream_frame_error_affects_only_that_frame(monkeypatch):
+    calls = []
+
+    def process(tracker, libraries, multi, frame, top_k, threshold, det_size):
+        calls.append(frame)
+        if frame == b"bad":
+            raise RuntimeError("inference worker died")
+        return {"tracks": [], "events": []}
+
+    monkeypatch.setattr(main, "process_stream_frame", process)
+    tracker = FaceTracker()
+    results = [asyncio.run(main.run_stream_frame(tracker, {}, False, frame, 1, 0.5, None)) for frame in (b"bad", b"ok")]
+    assert "inference worker died" in results[0]["error"]
+    assert results[1] == {"tracks": [], "events": []}
+    assert calls == [b"bad", b"ok"]
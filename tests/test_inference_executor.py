@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from face_service import FaceService
+from inference_executor import InferenceExecutor, InferenceQueueFull
+from result_cache import ResultCache
+
+JPG = b"\xff\xd8\xff" + b"\x00" * 32
+
+
+@pytest.fixture
+def full_executor():
+    """一个执行、一个排队，两个名额都被占满的推理线程池。"""
+    executor = InferenceExecutor(max_workers=1, max_queue=1, retry_after=7)
+    release = threading.Event()
+    futures = [executor.submit(release.wait, 5) for _ in range(2)]
+    yield executor
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+
+
+def test_rejects_when_full(full_executor):
+    with pytest.raises(InferenceQueueFull) as info:
+        full_executor.submit(lambda: None)
+    assert info.value.status_code == 503
+    assert info.value.headers == {"Retry-After": "7"}
+    assert full_executor.stats() == {"max_workers": 1, "max_queue": 1, "pending": 2, "queued": 1, "rejected": 1}
+
+
+def _drained(executor, timeout=5.0):
+    # 名额在 Future 的完成回调中归还，可能略晚于 result() 返回
+    deadline = time.monotonic() + timeout
+    while executor.stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return executor
+
+
+def test_slot_is_released_after_task_finishes():
+    executor = InferenceExecutor(max_workers=1, max_queue=0)
+    release = threading.Event()
+    future = executor.submit(release.wait, 5)
+    with pytest.raises(InferenceQueueFull):
+        executor.submit(lambda: None)
+    release.set()
+    future.result(timeout=5)
+    assert _drained(executor).submit(lambda: 42).result(timeout=5) == 42
+
+
+def test_failed_task_releases_slot():
+    executor = InferenceExecutor(max_workers=1, max_queue=0)
+    with pytest.raises(ZeroDivisionError):
+        executor.submit(lambda: 1 / 0).result(timeout=5)
+    assert _drained(executor).submit(lambda: 1).result(timeout=5) == 1
+
+
+def test_endpoint_returns_503_with_retry_after(full_executor, monkeypatch):
+    monkeypatch.setattr(main, "inference_executor", full_executor)
+    monkeypatch.setattr(main, "result_cache", ResultCache(enabled=False))
+    # 只取方法引用，不加载模型
+    monkeypatch.setattr(main, "face_service", FaceService)
+    response = TestClient(main.app).post("/api/detect", files={"file": ("face.jpg", JPG, "image/jpeg")})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+    assert response.json()["detail"] == "Inference queue is full, please retry later"
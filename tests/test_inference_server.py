@@ -0,0 +1,67 @@
+import os
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import pytest
+
+from inference_server import _connect, check_socket_dir, default_socket_dir, read_authkey, worker_address, write_authkey
+
+
+@pytest.fixture
+def socket_dir(tmp_path):
+    path = tmp_path / "sockets"
+    check_socket_dir(str(path), create=True)
+    return str(path)
+
+
+def test_default_socket_dir(monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert default_socket_dir() == "/run/user/1000/face-inference"
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert default_socket_dir().endswith(f"face-inference-{os.getuid()}")
+
+
+def test_rejects_shared_socket_dir(tmp_path):
+    path = tmp_path / "shared"
+    path.mkdir(mode=0o755)
+    os.chmod(path, 0o755)
+    with pytest.raises(RuntimeError):
+        check_socket_dir(str(path), create=True)
+    os.chmod(path, 0o700)
+    check_socket_dir(str(path))
+
+
+def test_authkey_file_is_private(socket_dir):
+    authkey = write_authkey(socket_dir)
+    assert len(authkey) == 32
+    assert os.stat(os.path.join(socket_dir, "authkey")).st_mode & 0o777 == 0o600
+    assert read_authkey(socket_dir) == authkey
+    assert write_authkey(socket_dir) != authkey
+
+
+def test_connection_requires_authkey(socket_dir):
+    authkey = write_authkey(socket_dir)
+    address = worker_address(socket_dir, 0)
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    received = []
+
+    def serve():
+        for _ in range(2):
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                continue
+            received.append(conn.recv())
+            conn.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    with pytest.raises(AuthenticationError):
+        Client(address, family="AF_UNIX", authkey=b"wrong")
+    conn = _connect(address, timeout=5)
+    conn.send("hello")
+    thread.join(timeout=5)
+    conn.close()
+    listener.close()
+    assert received == ["hello"]
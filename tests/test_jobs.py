@@ -0,0 +1,154 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from database import BackgroundJob
+from jobs import CANCELLED, COMPLETED, FAILED, PENDING, RUNNING, JobRegistry
+
+
+@pytest.fixture
+def registry(db):
+    registry = JobRegistry(workers=1, poll_interval=0.05, stale_after=60, max_failures=2)
+    yield registry
+    registry.stop()
+
+
+def _wait(registry, job_id, statuses=(COMPLETED, FAILED, CANCELLED), timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = registry.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def test_runs_job_and_records_progress(registry):
+    @registry.handler("count")
+    def count(job, items):
+        job.set_total(len(items))
+        for item in items:
+            if item < 0:
+                job.add_failure("negative", item=item)
+            else:
+                job.add_success()
+        return {"sum": sum(items)}
+
+    job = registry.create("count", {"items": [1, 2, -1, -2, -3]})
+    assert job["status"] == PENDING
+    registry.start()
+    job = _wait(registry, job["id"])
+    assert job["status"] == COMPLETED
+    assert (job["total"], job["processed"], job["succeeded"], job["failed"]) == (5, 5, 2, 3)
+    # 失败明细最多保留 max_failures 条
+    assert job["failures"] == [{"item": -1, "error": "negative"}, {"item": -2, "error": "negative"}]
+    assert job["result"] == {"sum": -3}
+
+
+def test_failed_job_records_error(registry):
+    @registry.handler("boom")
+    def boom(job):
+        raise RuntimeError("broken")
+
+    registry.start()
+    job = _wait(registry, registry.create("boom", {})["id"])
+    assert job["status"] == FAILED and job["error"] == "broken"
+
+
+def test_unknown_job_type(registry):
+    with pytest.raises(ValueError):
+        registry.create("missing", {})
+
+
+def test_cancel_pending_job_runs_cleanup(registry):
+    cleaned = []
+    registry.handler("noop", cleanup=lambda **params: cleaned.append(params))(lambda job, **params: None)
+    job = registry.cancel(registry.create("noop", {"path": "x"})["id"])
+    assert job["status"] == CANCELLED
+    assert cleaned == [{"path": "x"}]
+    assert registry.cancel("missing") is None
+
+
+def test_cancel_running_job(registry):
+    @registry.handler("loop")
+    def loop(job):
+        while True:
+            job.flush(force=True)
+            job.check_cancelled()
+            time.sleep(0.01)
+
+    registry.start()
+    job_id = registry.create("loop", {})["id"]
+    _wait(registry, job_id, statuses=(RUNNING,))
+    assert registry.cancel(job_id)["cancel_requested"]
+    assert _wait(registry, job_id)["status"] == CANCELLED
+
+
+def test_job_is_claimed_once(registry):
+    registry.handler("once")(lambda job: None)
+    job_id = registry.create("once", {})["id"]
+    # 另一个进程的任务队列
+    other = JobRegistry(workers=1)
+    other.handler("once")(lambda job: None)
+    first, second = registry._claim(), other._claim()
+    assert first.id == job_id and second is None
+
+
+def test_stale_running_job_is_failed(registry, db):
+    registry.handler("stuck")(lambda job: None)
+    job_id = registry.create("stuck", {})["id"]
+    db.execute(update(BackgroundJob).where(BackgroundJob.id == job_id).values(
+        status=RUNNING, updated_at=datetime.utcnow() - timedelta(seconds=120)))
+    db.commit()
+    registry._fail_stale()
+    job = registry.get(job_id)
+    assert job["status"] == FAILED and "stopped responding" in job["error"]
+
+
+def test_heartbeat_keeps_silent_job_alive(db):
+    registry = JobRegistry(workers=1, poll_interval=0.05, stale_after=0.4)
+    done = threading.Event()
+
+    @registry.handler("silent")
+    def silent(job):
+        # 单个步骤长时间没有进度
+        done.wait(5)
+        return {"ok": True}
+
+    try:
+        registry.start()
+        job_id = registry.create("silent", {})["id"]
+        _wait(registry, job_id, statuses=(RUNNING,))
+        for _ in range(10):
+            time.sleep(0.1)
+            registry._fail_stale()
+        assert registry.get(job_id)["status"] == RUNNING
+        done.set()
+        assert _wait(registry, job_id)["status"] == COMPLETED
+    finally:
+        done.set()
+        registry.stop()
+
+
+def test_result_does_not_overwrite_stale_failure(registry, db):
+    proceed = threading.Event()
+
+    @registry.handler("late")
+    def late(job):
+        proceed.wait(5)
+        return {"ok": True}
+
+    registry.start()
+    job_id = registry.create("late", {})["id"]
+    _wait(registry, job_id, statuses=(RUNNING,))
+    db.execute(update(BackgroundJob).where(BackgroundJob.id == job_id).values(
+        updated_at=datetime.utcnow() - timedelta(seconds=120)))
+    db.commit()
+    registry._fail_stale()
+    proceed.set()
+    time.sleep(0.3)
+    job = registry.get(job_id)
+    assert job["status"] == FAILED and job["result"] is None
@@ -0,0 +1,84 @@
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+from metrics import Metrics
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _lines(text: str, name: str) -> list:
+    return [line for line in text.splitlines() if line.startswith(name)]
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False)
+    metrics.inc("http_requests_total", method="GET", route="/", status=200)
+    with metrics.time("detect"):
+        pass
+    assert _lines(metrics.render(), "face_http_requests_total") == []
+
+
+def test_render():
+    metrics = Metrics(enabled=True)
+    metrics.inc("http_requests_total", method="GET", route="/api/search", status=200)
+    metrics.inc("http_requests_total", 2, method="GET", route="/api/search", status=200)
+    metrics.inc("http_requests_total", method="POST", route='/a"b\\', status=503)
+    for value in (0.003, 0.004, 0.2, 30.0):
+        metrics.observe("stage_seconds", value, stage="detect")
+    metrics.set("inference_executor_pending", 5)
+
+    text = metrics.render()
+    assert "# HELP face_http_requests_total HTTP 请求数" in text
+    assert "# TYPE face_stage_seconds histogram" in text
+    assert _lines(text, "face_http_requests_total") == [
+        'face_http_requests_total{method="GET",route="/api/search",status="200"} 3',
+        'face_http_requests_total{method="POST",route="/a\\"b\\\\",status="503"} 1',
+    ]
+    buckets = _lines(text, "face_stage_seconds_bucket")
+    assert 'face_stage_seconds_bucket{stage="detect",le="0.0025"} 0' in buckets
+    assert 'face_stage_seconds_bucket{stage="detect",le="0.005"} 2' in buckets
+    assert 'face_stage_seconds_bucket{stage="detect",le="0.25"} 3' in buckets
+    assert 'face_stage_seconds_bucket{stage="detect",le="10"} 3' in buckets
+    assert buckets[-1] == 'face_stage_seconds_bucket{stage="detect",le="+Inf"} 4'
+    assert _lines(text, "face_stage_seconds_sum") == ['face_stage_seconds_sum{stage="detect"} 30.207']
+    assert _lines(text, "face_stage_seconds_count") == ['face_stage_seconds_count{stage="detect"} 4']
+    assert _lines(text, "face_inference_executor_pending") == ["face_inference_executor_pending 5"]
+
+
+# 另一个进程在同一目录记录指标后退出
+CHILD = textwrap.dedent("""
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, {root!r})
+    from metrics import Metrics
+    metrics = Metrics(enabled=True, directory=Path({directory!r}), flush_interval=60)
+    metrics.inc("http_requests_total", 2, method="GET", route="/api/search", status=200)
+    metrics.inc("http_requests_total", method="GET", route="/api/detect", status=200)
+    metrics.observe("stage_seconds", 0.5, stage="detect")
+    metrics.set("inference_executor_pending", 9)
+    metrics.flush()
+""")
+
+
+def test_merges_multiprocess_directory(tmp_path):
+    metrics = Metrics(enabled=True, directory=tmp_path, flush_interval=60)
+    metrics.inc("http_requests_total", method="GET", route="/api/search", status=200)
+    metrics.observe("stage_seconds", 0.003, stage="detect")
+    metrics.set("inference_executor_pending", 4)
+    subprocess.run([sys.executable, "-c", CHILD.format(root=str(ROOT), directory=str(tmp_path))], check=True)
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+    text = metrics.render()
+    assert len(list(tmp_path.glob("*.json"))) == 2
+    assert _lines(text, "face_http_requests_total") == [
+        'face_http_requests_total{method="GET",route="/api/detect",status="200"} 1',
+        'face_http_requests_total{method="GET",route="/api/search",status="200"} 3',
+    ]
+    assert 'face_stage_seconds_bucket{stage="detect",le="0.005"} 1' in text
+    assert 'face_stage_seconds_bucket{stage="detect",le="0.5"} 2' in text
+    assert _lines(text, "face_stage_seconds_sum") == ['face_stage_seconds_sum{stage="detect"} 0.503']
+    assert _lines(text, "face_stage_seconds_count") == ['face_stage_seconds_count{stage="detect"} 2']
+    # 已退出进程的仪表盘类指标不再计入
+    assert _lines(text, "face_inference_executor_pending") == ["face_inference_executor_pending 4"]
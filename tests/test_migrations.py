@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+import pytest
+from sqlalchemy import LargeBinary, create_engine, inspect, text
+
+import database
+import migrations
+from config_loader import get_model_name
+from embedding_codec import decode_embedding
+
+# 迁移前 (JSON 文本特征、无版本号) 的表结构
+BASELINE_SCHEMA = [
+    """CREATE TABLE face_libraries (
+        id INTEGER NOT NULL PRIMARY KEY,
+        name VARCHAR(100) NOT NULL UNIQUE,
+        description TEXT,
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+        updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP)
+    )""",
+    """CREATE TABLE face_members (
+        id INTEGER NOT NULL PRIMARY KEY,
+        record_id VARCHAR(36) NOT NULL UNIQUE,
+        library_id INTEGER NOT NULL REFERENCES face_libraries (id),
+        name VARCHAR(100) NOT NULL,
+        embedding FLOAT NOT NULL,
+        embedding_vector TEXT NOT NULL,
+        image_path VARCHAR(500),
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+        updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP)
+    )""",
+    "CREATE INDEX ix_face_members_library_id ON face_members (library_id)",
+]
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/baseline.db")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO face_libraries (id, name) VALUES (1, 'lib')"))
+        for i in range(5):
+            conn.execute(
+                text("INSERT INTO face_members (record_id, library_id, name, embedding, embedding_vector) "
+                     "VALUES (:record_id, 1, :name, 1.0, :vector)"),
+                {"record_id": f"r{i}", "name": f"m{i}", "vector": json.dumps([float(i), 0.5, -0.25])},
+            )
+    monkeypatch.setattr(database, "engine", engine)
+    yield engine
+    engine.dispose()
+
+
+def test_init_db_migrates_baseline_schema(engine):
+    database.init_db()
+    database.init_db()
+
+    inspector = inspect(engine)
+    assert "jobs" in inspector.get_table_names()
+    members = {c["name"]: c for c in inspector.get_columns("face_members")}
+    assert isinstance(members["embedding_vector"]["type"], LargeBinary)
+    assert {"embedding_model", "staged_embedding", "staged_embedding_norm", "staged_model"} <= set(members)
+    assert "embedding_vector_bin" not in members
+    assert "ix_face_members_embedding_model" in {index["name"] for index in inspector.get_indexes("face_members")}
+    assert "member_version" in {c["name"] for c in inspector.get_columns("face_libraries")}
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT name, embedding_vector, embedding_model FROM face_members ORDER BY id")).fetchall()
+        assert conn.execute(text("SELECT member_version FROM face_libraries")).scalar() == 0
+    assert len(rows) == 5
+    for i, row in enumerate(rows):
+        np.testing.assert_array_equal(decode_embedding(row.embedding_vector), np.float32([i, 0.5, -0.25]))
+        assert row.embedding_model == get_model_name()
+
+
+def test_embedding_migration_resumes(engine):
+    # 模拟中途中断：临时列已加入且第一行已回填
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE face_members ADD COLUMN embedding_vector_bin BLOB"))
+        conn.execute(text("UPDATE face_members SET embedding_vector_bin = x'00' WHERE id = 1"))
+    assert migrations.migrate_embedding_storage(engine, batch_size=2) == 4
+    assert migrations.migrate_embedding_storage(engine) == 0
+
+    with engine.connect() as conn:
+        blobs = conn.execute(text("SELECT embedding_vector FROM face_members ORDER BY id")).scalars().all()
+    assert blobs[0] == b"\x00"
+    assert [decode_embedding(blob)[0] for blob in blobs[1:]] == [1.0, 2.0, 3.0, 4.0]
@@ -0,0 +1,103 @@
+import uuid
+
+import numpy as np
+import pytest
+
+import embedding_cache
+import embedding_store
+import reembed
+from database import FaceLibrary, FaceMember, bump_member_version
+from embedding_cache import EmbeddingCache
+from embedding_codec import encode_embedding
+from embedding_store import LibraryStore
+
+
+def _unit(rows, dim=8, seed=0):
+    data = np.random.default_rng(seed).standard_normal((rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def active_model(monkeypatch):
+    def set_model(name):
+        monkeypatch.setattr(embedding_cache, "get_model_name", lambda: name)
+        monkeypatch.setattr(reembed, "get_model_name", lambda: name)
+    set_model("old")
+    return set_model
+
+
+@pytest.fixture
+def library(db):
+    """三个 old 模型成员，前两个已暂存 new 模型向量。"""
+    row = FaceLibrary(name=f"lib-{uuid.uuid4().hex[:8]}")
+    db.add(row)
+    db.commit()
+    old, new = _unit(3, seed=1), _unit(3, seed=2)
+    members = []
+    for i in range(3):
+        member = FaceMember(
+            record_id=str(uuid.uuid4()), library_id=row.id, name=f"m{i}", embedding=1.0,
+            embedding_vector=encode_embedding(old[i], "float32"), embedding_model="old", image_path=f"/img/{i}.jpg",
+        )
+        if i < 2:
+            member.staged_embedding = encode_embedding(new[i], "float32")
+            member.staged_embedding_norm = 1.0
+            member.staged_model = "new"
+        db.add(member)
+        members.append(member)
+    db.flush()
+    db.scalar(bump_member_version(row.id))
+    db.commit()
+    return row, members, old, new
+
+
+def _rows(cache, db, library_id):
+    with cache.read(db, library_id) as entry:
+        live = np.ones(len(entry.member_ids), dtype=bool) if entry.deleted is None else ~entry.deleted[:len(entry.member_ids)]
+        return {member_id: np.array(entry.matrix[i]) for i, member_id in enumerate(entry.member_ids) if live[i]}
+
+
+@pytest.mark.parametrize("store", [False, True])
+def test_search_uses_vectors_of_the_active_model(db, library, active_model, store, tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, "store_root", lambda: tmp_path)
+    row, members, old, new = library
+    config = {"enabled": store}
+    rows = _rows(EmbeddingCache(1 << 20, config), db, row.id)
+    assert sorted(rows) == sorted(m.id for m in members)
+    np.testing.assert_allclose(rows[members[0].id], old[0], atol=1e-6)
+
+    # 重启为新模型：使用暂存向量，没有新模型向量的成员不参与检索
+    active_model("new")
+    rows = _rows(EmbeddingCache(1 << 20, config), db, row.id)
+    assert sorted(rows) == sorted(m.id for m in members[:2])
+    np.testing.assert_allclose(rows[members[1].id], new[1], atol=1e-6)
+    if store:
+        assert LibraryStore(row.id).open().model == "new"
+    assert reembed.library_model_status(db, row.id)["unsearchable"] == 1
+
+
+def test_cutover_requires_the_active_model(db, library, active_model):
+    row, members, _, new = library
+    with pytest.raises(ValueError):
+        reembed.cutover(row.id, "new")
+
+    active_model("new")
+    assert reembed.cutover(row.id, "new")["remaining"] == 1
+    db.delete(members[2])
+    db.commit()
+    result = reembed.cutover(row.id, "new")
+    assert (result["switched"], result["remaining"]) == (2, 0)
+    db.expire_all()
+    assert {m.embedding_model for m in db.query(FaceMember).filter(FaceMember.library_id == row.id)} == {"new"}
+    rows = _rows(EmbeddingCache(1 << 20), db, row.id)
+    np.testing.assert_allclose(rows[members[0].id], new[0], atol=1e-6)
+
+
+def test_members_without_image_do_not_block_cutover(db, library, active_model):
+    row, members, _, _ = library
+    members[2].image_path = None
+    db.commit()
+    active_model("new")
+    result = reembed.cutover(row.id, "new")
+    assert (result["switched"], result["remaining"], result["without_image"]) == (2, 0, 1)
+    assert reembed.library_model_status(db, row.id)["unsearchable"] == 1
@@ -0,0 +1,145 @@
+import uuid
+
+import numpy as np
+import pytest
+
+import main
+import result_cache as result_cache_module
+from database import FaceLibrary, FaceMember, bump_member_version
+from embedding_cache import EmbeddingCache
+from embedding_codec import encode_embedding
+from face_service import FaceService
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_key():
+    cache = ResultCache()
+    key = cache.key(b"image", 640)
+    assert key == cache.key(b"image", 640)
+    assert len(key[0]) == 16 and key[1:] == (640,)
+    assert key != cache.key(b"image!", 640)
+    assert key != cache.key(b"image", None)
+    assert ResultCache(enabled=False).key(b"image", 640) is None
+
+
+def test_ttl_expiry(clock):
+    cache = ResultCache(ttl=10)
+    cache.put("detect", "k", [1])
+    clock[0] += 9.9
+    assert cache.get("detect", "k") == [1]
+    clock[0] += 0.1
+    assert cache.get("detect", "k") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["kinds"] == {"detect": {"hits": 1, "misses": 1}}
+
+
+def test_lru_eviction(clock):
+    cache = ResultCache(max_entries=2)
+    cache.put("detect", "a", 1)
+    cache.put("detect", "b", 2)
+    # 命中的条目移到最近使用一端
+    assert cache.get("detect", "a") == 1
+    cache.put("detect", "c", 3)
+    assert cache.get("detect", "b") is None
+    assert (cache.get("detect", "a"), cache.get("detect", "c")) == (1, 3)
+    # 类别是键的一部分
+    assert cache.get("embedding", "a") is None
+
+
+def _unit(rows, dim=16, seed=0):
+    data = np.random.default_rng(seed).standard_normal((rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def _library(db, vectors):
+    row = FaceLibrary(name=f"lib-{uuid.uuid4().hex[:8]}")
+    db.add(row)
+    db.commit()
+    for i, vector in enumerate(vectors):
+        _add(db, row.id, f"m{i}", vector)
+    return row.id
+
+
+def _add(db, library_id, name, vector):
+    member = FaceMember(
+        record_id=str(uuid.uuid4()), library_id=library_id, name=name,
+        embedding=1.0, embedding_vector=encode_embedding(vector, "float32"),
+    )
+    db.add(member)
+    db.flush()
+    version = db.scalar(bump_member_version(library_id))
+    db.commit()
+    return member, version
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """用独立的缓存替换 main 中的单例，返回实际执行检索的次数。"""
+    monkeypatch.setattr(main, "embedding_cache", EmbeddingCache(max_bytes=1 << 26))
+    monkeypatch.setattr(main, "result_cache", ResultCache())
+    monkeypatch.setattr(main, "face_service", FaceService)
+    calls = []
+    search_entry = main.search_entry
+
+    def counted(*args):
+        calls.append(args)
+        return search_entry(*args)
+
+    monkeypatch.setattr(main, "search_entry", counted)
+    return calls
+
+
+def test_search_key_covers_every_parameter(db, searches):
+    vectors = _unit(4)
+    first, second = _library(db, vectors), _library(db, vectors[::-1])
+    query = vectors[0]
+    key = main.result_cache.key(b"image", None)
+
+    hits = main.search_library(first, query, 2, 0.1, key)
+    assert main.search_library(first, query, 2, 0.1, key) == hits
+    assert len(searches) == 1
+    # 返回的是副本，调用方修改不影响缓存
+    hits[0]["library_id"] = first
+    assert "library_id" not in main.search_library(first, query, 2, 0.1, key)[0]
+
+    for library_id, top_k, threshold, query_key in [
+        (second, 2, 0.1, key),
+        (first, 3, 0.1, key),
+        (first, 2, 0.2, key),
+        (first, 2, 0.1, main.result_cache.key(b"other image", None)),
+        (first, 2, 0.1, main.result_cache.key(b"image", 640)),
+    ]:
+        before = len(searches)
+        main.search_library(library_id, query, top_k, threshold, query_key)
+        assert len(searches) == before + 1
+
+    # 不带缓存键的请求总是检索
+    main.search_library(first, query, 2, 0.1, None)
+    main.search_library(first, query, 2, 0.1, None)
+    assert len(searches) == 8
+
+
+def test_member_change_invalidates_search_results(db, searches):
+    vectors = _unit(3)
+    library_id = _library(db, vectors[1:])
+    key = main.result_cache.key(b"image", None)
+    hits = main.search_library(library_id, vectors[0], 1, 0.0, key)
+
+    # 其他进程写入的成员：member_version 变化后重新加载，旧结果不再命中
+    member, _ = _add(db, library_id, "exact", vectors[0])
+    updated = main.search_library(library_id, vectors[0], 1, 0.0, key)
+    assert len(searches) == 2
+    assert updated[0]["member_id"] == member.id != hits[0]["member_id"]
+
+    # 本进程就地更新缓存矩阵同样使旧结果失效
+    closer, version = _add(db, library_id, "closer", vectors[0])
+    main.embedding_cache.add_member(closer, vectors[0], version)
+    main.search_library(library_id, vectors[0], 1, 0.0, key)
+    assert len(searches) == 3
@@ -0,0 +1,170 @@
+import asyncio
+import uuid
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import embedding_cache as embedding_cache_module
+import main
+from database import FaceLibrary, FaceMember, bump_member_version
+from embedding_cache import EmbeddingCache, _quantize_rows
+from embedding_codec import encode_embedding
+from face_service import FaceService
+
+
+def _unit(rows, dim=16, seed=0):
+    data = np.random.default_rng(seed).standard_normal((rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def _queries(vectors, count=6, seed=1):
+    # 与库中向量相近的查询，保证阈值附近有命中
+    noise = _unit(count, vectors.shape[1], seed) * 0.6
+    queries = vectors[:count] + noise
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def _assert_same_hits(actual, expected):
+    # 矩阵乘法与单行乘法的舍入可能差一个 ulp
+    assert [{k: v for k, v in hit.items() if not k.startswith("similarity")} for hit in actual] == \
+        [{k: v for k, v in hit.items() if not k.startswith("similarity")} for hit in expected]
+    assert [hit["similarity"] for hit in actual] == pytest.approx([hit["similarity"] for hit in expected], abs=1e-5)
+
+
+@pytest.mark.parametrize("top_k,threshold", [(1, 0.0), (5, 0.0), (5, 0.3), (200, -1.0)])
+def test_batch_matches_single_searches(top_k, threshold):
+    vectors = _unit(120)
+    member_ids = list(range(1000, 1120))
+    names = [f"m{i}" for i in range(120)]
+    deleted = np.zeros(120, dtype=bool)
+    deleted[[0, 7]] = True
+    queries = _queries(vectors)
+
+    batch = FaceService.search_faces_batch(queries, vectors, member_ids, names, top_k, threshold, normalized=True, deleted=deleted)
+    assert len(batch) == len(queries)
+    for query, hits in zip(queries, batch):
+        single = FaceService.search_faces(query, vectors, member_ids, names, top_k, threshold, normalized=True, deleted=deleted)
+        _assert_same_hits(hits, single)
+        assert len(hits) <= min(top_k, 118)
+        assert all(hit["similarity"] >= threshold for hit in hits)
+        assert not {1000, 1007} & {hit["member_id"] for hit in hits}
+        sims = [hit["similarity"] for hit in hits]
+        assert sims == sorted(sims, reverse=True)
+
+
+def test_batch_rerank_matches_single_searches():
+    vectors = _unit(200, dim=32)
+    data, scales = _quantize_rows(vectors, np.dtype(np.int8))
+    member_ids, names = list(range(200)), [f"m{i}" for i in range(200)]
+    queries = _queries(vectors)
+
+    def exact(rows):
+        return vectors[rows]
+
+    batch = FaceService.search_faces_batch(
+        queries, data, member_ids, names, 3, 0.2, normalized=True, scales=scales, exact=exact, rerank_candidates=20,
+    )
+    for query, hits in zip(queries, batch):
+        single = FaceService.search_faces(
+            query, data, member_ids, names, 3, 0.2, normalized=True, scales=scales, exact=exact, rerank_candidates=20,
+        )
+        _assert_same_hits(hits, single)
+        # 重排后的相似度是原始向量的精确值
+        for hit in hits:
+            assert hit["similarity"] == pytest.approx(float(vectors[hit["member_id"]] @ query), abs=1e-5)
+
+
+def test_empty_inputs():
+    assert FaceService.search_faces_batch(np.empty((0, 4)), _unit(3, 4), [1, 2, 3], ["a", "b", "c"], 1, 0.0) == []
+    assert FaceService.search_faces_batch(_unit(2, 4), np.empty((0, 4), dtype=np.float32), [], [], 1, 0.0) == [[], []]
+
+
+def _library(db, vectors, prefix):
+    row = FaceLibrary(name=f"{prefix}-{uuid.uuid4().hex[:8]}")
+    db.add(row)
+    db.commit()
+    for i, vector in enumerate(vectors):
+        db.add(FaceMember(
+            record_id=str(uuid.uuid4()), library_id=row.id, name=f"{prefix}{i}",
+            embedding=1.0, embedding_vector=encode_embedding(vector, "float32"),
+        ))
+    db.flush()
+    db.scalar(bump_member_version(row.id))
+    db.commit()
+    return row
+
+
+@pytest.fixture(params=["float32", "int8"])
+def libraries(request, db, monkeypatch):
+    """两个人脸库；int8 时量化矩阵上先取候选，再用数据库中的原始向量重排。"""
+    monkeypatch.setattr(
+        embedding_cache_module, "get_quantization_config",
+        lambda: {"memory_dtype": request.param, "rerank_candidates": 16},
+    )
+    monkeypatch.setattr(main, "embedding_cache", EmbeddingCache(max_bytes=1 << 26))
+    monkeypatch.setattr(main, "face_service", FaceService)
+    vectors = _unit(60)
+    first, second = _library(db, vectors[:30], "a"), _library(db, vectors[30:], "b")
+    return {first.id: first.name, second.id: second.name}, vectors
+
+
+def _search(client, body):
+    response = client.post("/api/search/embedding", json=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_batch_endpoint_matches_single_endpoint(libraries):
+    libs, vectors = libraries
+    client = TestClient(main.app)
+    queries = _queries(vectors, count=5, seed=3)
+    library_id = next(iter(libs))
+    batch = _search(client, {"library_id": library_id, "embeddings": queries.tolist(), "top_k": 3, "threshold": 0.2})
+    assert batch["count"] == 5 and "library_ids" not in batch
+    for face, query in zip(batch["faces"], queries):
+        single = _search(client, {"library_id": library_id, "embedding": query.tolist(), "top_k": 3, "threshold": 0.2})
+        _assert_same_hits(face["results"], single["results"])
+        assert all("library_id" not in hit for hit in face["results"])
+
+
+def test_multi_library_search_merges_top_k(libraries):
+    libs, vectors = libraries
+    client = TestClient(main.app)
+    queries = _queries(vectors[25:], count=6, seed=4)
+    merged = _search(client, {"library_ids": list(libs), "embeddings": queries.tolist(), "top_k": 4, "threshold": 0.0})
+    assert merged["library_ids"] == list(libs)
+    for face, query in zip(merged["faces"], queries):
+        expected = []
+        for library_id, name in libs.items():
+            hits = _search(client, {"library_id": library_id, "embedding": query.tolist(), "top_k": 4, "threshold": 0.0})["results"]
+            expected.extend({**hit, "library_id": library_id, "library_name": name} for hit in hits)
+        expected.sort(key=lambda hit: hit["similarity"], reverse=True)
+        _assert_same_hits(face["results"], expected[:4])
+
+    everything = _search(client, {"library_ids": "all", "embedding": queries[0].tolist(), "top_k": 4, "threshold": 0.0})
+    _assert_same_hits(everything["results"], merged["faces"][0]["results"])
+
+
+def test_faces_response_keeps_errors_in_place(libraries):
+    libs, vectors = libraries
+    library_id = next(iter(libs))
+    faces = [
+        {"index": 0, "embedding": vectors[0], "face_info": {"bbox": [0, 0, 1, 1]}},
+        {"index": 1, "error": "Face quality too low"},
+        {"index": 2, "embedding": vectors[1]},
+    ]
+    response = asyncio.run(main._search_faces_response({library_id: libs[library_id]}, False, faces, 1, 0.5))
+    assert response["count"] == 3
+    first, failed, last = response["faces"]
+    assert first["face_info"] == {"bbox": [0, 0, 1, 1]} and first["results"][0]["name"] == "a0"
+    assert failed == {"index": 1, "error": "Face quality too low"}
+    assert last["results"][0]["name"] == "a1"
+
+
+def test_dimension_mismatch_is_rejected(libraries):
+    libs, _ = libraries
+    response = TestClient(main.app).post(
+        "/api/search/embedding", json={"library_id": next(iter(libs)), "embeddings": [[0.1] * 8]},
+    )
+    assert response.status_code == 400 and "dimension" in response.json()["detail"]
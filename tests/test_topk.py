@@ -0,0 +1,86 @@
+import threading
+
+import numpy as np
+import pytest
+
+import topk
+from topk import top_k_cosine
+
+
+def _unit(rows, dim, rng):
+    data = rng.standard_normal((rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def _brute_force(queries, matrix, k):
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    norms = np.linalg.norm(matrix, axis=1)
+    sims = queries @ matrix.T / norms
+    order = np.argsort(-sims, axis=1, kind="stable")[:, :k]
+    return order, np.take_along_axis(sims, order, axis=1)
+
+
+@pytest.mark.parametrize("rows,k,chunk_rows", [(1000, 10, 128), (1000, 10, 4096), (37, 50, 8), (5, 1, 2)])
+def test_matches_brute_force(rows, k, chunk_rows):
+    rng = np.random.default_rng(rows + k)
+    matrix = _unit(rows, 64, rng)
+    queries = rng.standard_normal((4, 64)).astype(np.float32)
+    indices, sims = top_k_cosine(queries, matrix, k, chunk_rows=chunk_rows)
+    expected_idx, expected_sims = _brute_force(queries, matrix, k)
+    assert indices.shape == (4, min(k, rows))
+    np.testing.assert_array_equal(indices, expected_idx)
+    np.testing.assert_allclose(sims, expected_sims, rtol=1e-5, atol=1e-6)
+
+
+def test_unnormalized_matrix():
+    rng = np.random.default_rng(1)
+    matrix = _unit(500, 32, rng) * rng.uniform(0.5, 3.0, (500, 1)).astype(np.float32)
+    queries = rng.standard_normal((3, 32)).astype(np.float32)
+    indices, sims = top_k_cosine(queries, matrix, 5, normalized=False, chunk_rows=64)
+    expected_idx, expected_sims = _brute_force(queries, matrix, 5)
+    np.testing.assert_array_equal(indices, expected_idx)
+    np.testing.assert_allclose(sims, expected_sims, rtol=1e-5, atol=1e-6)
+
+
+def test_float16_matrix_and_scales():
+    rng = np.random.default_rng(2)
+    matrix = _unit(300, 32, rng)
+    scales = rng.uniform(0.5, 1.5, 300).astype(np.float32)
+    queries = rng.standard_normal((2, 32)).astype(np.float32)
+    indices, sims = top_k_cosine(queries, matrix.astype(np.float16), 5, chunk_rows=64, scales=scales)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    full = queries @ matrix.astype(np.float16).astype(np.float32).T * scales
+    expected_idx = np.argsort(-full, axis=1, kind="stable")[:, :5]
+    np.testing.assert_array_equal(indices, expected_idx)
+    np.testing.assert_allclose(sims, np.take_along_axis(full, expected_idx, axis=1), rtol=1e-4, atol=1e-5)
+
+
+def test_deleted_rows_are_excluded():
+    rng = np.random.default_rng(3)
+    matrix = _unit(200, 16, rng)
+    deleted = np.zeros(200, dtype=bool)
+    deleted[::2] = True
+    queries = matrix[[0, 10]]
+    indices, sims = top_k_cosine(queries, matrix, 10, chunk_rows=32, deleted=deleted)
+    assert not deleted[indices].any()
+    assert np.isfinite(sims).all()
+
+
+def test_empty_inputs():
+    indices, sims = top_k_cosine(np.ones((2, 8), dtype=np.float32), np.empty((0, 8), dtype=np.float32), 5)
+    assert indices.shape == (2, 0) and sims.shape == (2, 0)
+
+
+def test_large_scratch_buffers_are_not_cached(monkeypatch):
+    monkeypatch.setattr(topk, "SCRATCH_MAX_FLOATS", 1000)
+    monkeypatch.setattr(topk, "_scratch", threading.local())
+    rng = np.random.default_rng(4)
+    matrix = _unit(300, 16, rng)
+    queries = rng.standard_normal((8, 16)).astype(np.float32)
+
+    # 8 x 100 的相似度块可以缓存，8 x 300 的用完即释放
+    top_k_cosine(queries, matrix, 5, chunk_rows=100)
+    assert topk._scratch.scores.shape == (800,)
+    indices, _ = top_k_cosine(queries, matrix, 5, chunk_rows=300)
+    assert topk._scratch.scores.shape == (800,)
+    np.testing.assert_array_equal(indices, _brute_force(queries, matrix, 5)[0])
@@ -0,0 +1,97 @@
+"""余弦相似度 top-k 检索内核。
+
+人脸库矩阵按 CHUNK_ROWS 行分块与查询矩阵相乘，相似度写入线程内复用的缓冲区
+(不超过 SCRATCH_MAX_FLOATS 个元素才缓存，大批量查询的缓冲区用完即释放)；
+每块用 argpartition 取前 k 个后与已有结果合并，全程 float32，不对整个库排序，
+也不生成与库同样大小的掩码、索引或归一化副本。
+
+float16 / int8 量化矩阵按 CAST_CHUNK_ROWS 行逐块转换为 float32 后计算，
+int8 矩阵的每行相似度再乘以该行的缩放系数 scales。deleted 掩码为 True 的行不参与排序。
+"""
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+CHUNK_ROWS = 65536
+CAST_CHUNK_ROWS = 8192
+# 每个线程每种缓冲区最多缓存的 float32 个数 (16 MiB)，推理线程多时常驻内存有上限
+SCRATCH_MAX_FLOATS = 1 << 22
+
+_scratch = threading.local()
+
+
+def _buffer(name: str, size: int) -> np.ndarray:
+    if size > SCRATCH_MAX_FLOATS:
+        return np.empty(size, dtype=np.float32)
+    buf = getattr(_scratch, name, None)
+    if buf is None or buf.shape[0] < size:
+        buf = np.empty(size, dtype=np.float32)
+        setattr(_scratch, name, buf)
+    return buf[:size]
+
+
+def _select(scores: np.ndarray, k: int) -> np.ndarray:
+    """每行前 k 大的列号（未排序）。"""
+    n = scores.shape[1]
+    if k >= n:
+        return np.broadcast_to(np.arange(n), (scores.shape[0], n))
+    return np.argpartition(scores, n - k, axis=1)[:, n - k:]
+
+
+def top_k_cosine(queries: np.ndarray, matrix: np.ndarray, k: int, normalized: bool = True,
+                 chunk_rows: int = CHUNK_ROWS, scales: Optional[np.ndarray] = None,
+                 deleted: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """返回 (indices[Q, k'], sims[Q, k'])，每行按相似度降序，k' = min(k, N)。
+
+    queries 为 (Q, d)，函数内部归一化；normalized 为 False 时矩阵行范数按块计算，
+    相似度除以行范数，不复制矩阵。scales 为 (N,) 时相似度逐行乘以 scales。
+    deleted 为 (N,) 布尔掩码，被删除行的相似度为 -inf，行数不足 k 时可能出现在结果末尾。
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    query_norms[query_norms == 0] = 1
+    queries = queries / query_norms
+
+    q, n = queries.shape[0], matrix.shape[0]
+    k = min(k, n)
+    best_idx = np.empty((q, 0), dtype=np.int64)
+    best_sims = np.empty((q, 0), dtype=np.float32)
+    if k == 0 or q == 0:
+        return best_idx, best_sims
+
+    cast = matrix.dtype != np.float32
+    if cast:
+        chunk_rows = min(chunk_rows, CAST_CHUNK_ROWS)
+    for start in range(0, n, chunk_rows):
+        chunk = matrix[start:start + chunk_rows]
+        rows = chunk.shape[0]
+        if cast:
+            converted = _buffer("chunk", rows * chunk.shape[1]).reshape(chunk.shape)
+            np.copyto(converted, chunk, casting="unsafe")
+            chunk = converted
+        scores = _buffer("scores", q * rows).reshape(q, rows)
+        np.matmul(queries, chunk.T, out=scores)
+        if scales is not None:
+            scores *= scales[start:start + rows]
+        if not normalized:
+            norms = np.sqrt(np.einsum("ij,ij->i", chunk, chunk))
+            norms[norms == 0] = 1
+            scores /= norms
+        if deleted is not None:
+            scores[:, deleted[start:start + rows]] = -np.inf
+
+        cols = _select(scores, k)
+        sims = np.take_along_axis(scores, cols, axis=1)
+        if best_idx.shape[1]:
+            cols = np.concatenate([best_idx, cols + start], axis=1)
+            sims = np.concatenate([best_sims, sims], axis=1)
+            keep = _select(sims, k)
+            best_idx = np.take_along_axis(cols, keep, axis=1)
+            best_sims = np.take_along_axis(sims, keep, axis=1)
+        else:
+            best_idx = cols + start
+            best_sims = sims
+
+    order = np.argsort(-best_sims, axis=1, kind="stable")
+    return np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_sims, order, axis=1)